@@ -1,18 +1,30 @@
 from django.contrib import admin
-from .models import Conversation, ChatMessage, UserUsageStats
+from .models import Conversation, ChatMessage, UserUsageStats, UsageRollup, ChatJob
+from apps.core.services.context_builder import ContextBuilder
+from apps.core.services.conversation_service import ConversationService
+from apps.core.services.prompt_cache import PromptCache
 
 
 @admin.register(Conversation)
 class ConversationAdmin(admin.ModelAdmin):
-    list_display = ['id', 'user', 'title', 'get_message_count', 'is_active', 'created_at', 'updated_at']
+    list_display = ['id', 'user', 'title', 'message_count', 'is_active', 'created_at', 'updated_at']
     list_filter = ['is_active', 'created_at', 'user']
     search_fields = ['user__username', 'title', 'id']
-    readonly_fields = ['id', 'created_at', 'updated_at']
+    readonly_fields = [
+        'id', 'created_at', 'updated_at', 'last_sequence', 'message_count',
+        'last_message_preview', 'last_message_role', 'last_message_at'
+    ]
     date_hierarchy = 'created_at'
     
-    def get_message_count(self, obj):
-        return obj.messages.count()
-    get_message_count.short_description = 'Messages'
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        PromptCache.invalidate(obj.pk)
+    
+    def delete_queryset(self, request, queryset):
+        conversation_ids = list(queryset.values_list('id', flat=True))
+        super().delete_queryset(request, queryset)
+        for conversation_id in conversation_ids:
+            PromptCache.invalidate(conversation_id)
 
 
 @admin.register(ChatMessage)
@@ -26,6 +38,29 @@ class ChatMessageAdmin(admin.ModelAdmin):
     def short_content(self, obj):
         return obj.content[:100] + '...' if len(obj.content) > 100 else obj.content
     short_content.short_description = 'Content'
+    
+    # Edited or deleted messages must not linger in summaries or cached prompts
+    def save_model(self, request, obj, form, change):
+        previous_conversation_id = None
+        if change:
+            previous_conversation_id = ChatMessage.objects.filter(pk=obj.pk).values_list(
+                'conversation_id', flat=True
+            ).first()
+        obj.token_count = ContextBuilder.estimate_tokens(obj.content)
+        super().save_model(request, obj, form, change)
+        ConversationService.refresh_summary(obj.conversation_id)
+        if previous_conversation_id and previous_conversation_id != obj.conversation_id:
+            ConversationService.refresh_summary(previous_conversation_id)
+    
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        ConversationService.refresh_summary(obj.conversation_id)
+    
+    def delete_queryset(self, request, queryset):
+        conversation_ids = set(queryset.values_list('conversation_id', flat=True))
+        super().delete_queryset(request, queryset)
+        for conversation_id in conversation_ids:
+            ConversationService.refresh_summary(conversation_id)
 
 
 @admin.register(UserUsageStats)
@@ -33,4 +68,21 @@ class UserUsageStatsAdmin(admin.ModelAdmin):
     list_display = ['user', 'total_messages', 'total_tokens', 'last_request_at', 'created_at']
     list_filter = ['created_at', 'last_request_at']
     search_fields = ['user__username', 'user__email']
-    readonly_fields = ['created_at', 'updated_at']
\ No newline at end of file
+    readonly_fields = ['created_at', 'updated_at']
+
+
+@admin.register(UsageRollup)
+class UsageRollupAdmin(admin.ModelAdmin):
+    list_display = ['user', 'day', 'model', 'message_count', 'prompt_tokens', 'completion_tokens']
+    list_filter = ['day', 'model']
+    search_fields = ['user__username']
+    date_hierarchy = 'day'
+
+
+@admin.register(ChatJob)
+class ChatJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'conversation', 'status', 'created_at', 'finished_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['id', 'user__username', 'conversation__id']
+    readonly_fields = ['id', 'created_at', 'started_at', 'finished_at']
+    date_hierarchy = 'created_at'
\ No newline at end of file
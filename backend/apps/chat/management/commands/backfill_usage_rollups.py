@@ -0,0 +1,82 @@
+from collections import defaultdict
+from datetime import date
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from apps.chat.models import ChatMessage, UsageRollup
+from apps.core.services.usage_service import UsageService
+
+
+class Command(BaseCommand):
+    """
+    Rebuild UsageRollup rows from assistant messages
+    
+    Counts what UsageService.record_usage would have: cached and
+    coalesced replies count as messages but spent no tokens. Messages
+    written before 'coalesced' was kept in their metadata can't be told
+    apart, their tokens are counted.
+    
+    LLM calls made for rolling summaries (recorded with messages=0)
+    leave no message behind, so their tokens are missing from rebuilt
+    rollups. UserUsageStats totals are not touched and keep them.
+    """
+    
+    help = (
+        "Rebuild UsageRollup rows from assistant messages. Pending usage "
+        "deltas are flushed first; rollups in the selected range are replaced. "
+        "Tokens of rolling summary calls are not included."
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=date.fromisoformat, help='First day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--until', type=date.fromisoformat, help='Last day to rebuild (YYYY-MM-DD)')
+    
+    def handle(self, *args, **options):
+        since, until = options['since'], options['until']
+        if since and until and since > until:
+            raise CommandError('--since must not be after --until')
+        
+        # Otherwise deltas already counted by the rebuild would be added again
+        UsageService.flush()
+        
+        messages = ChatMessage.objects.filter(role='assistant')
+        rollups_to_delete = UsageRollup.objects.all()
+        if since:
+            messages = messages.filter(created_at__date__gte=since)
+            rollups_to_delete = rollups_to_delete.filter(day__gte=since)
+        if until:
+            messages = messages.filter(created_at__date__lte=until)
+            rollups_to_delete = rollups_to_delete.filter(day__lte=until)
+        
+        rollups = defaultdict(UsageService.empty_rollup)
+        rows = messages.values_list(
+            'conversation__user_id', 'created_at', 'model_used', 'metadata'
+        ).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+        
+        for user_id, created_at, model, metadata in rows:
+            metadata = metadata or {}
+            # Answered without an upstream call of its own, as in record_usage
+            spent = not (metadata.get('cached') or metadata.get('coalesced'))
+            UsageService.add_to_rollup(
+                rollups[(user_id, timezone.localdate(created_at), model or '')],
+                1,
+                (metadata.get('prompt_tokens') or 0) if spent else 0,
+                (metadata.get('completion_tokens') or 0) if spent else 0,
+                metadata.get('latency_ms'),
+            )
+        
+        with transaction.atomic():
+            deleted, _ = rollups_to_delete.delete()
+            UsageRollup.objects.bulk_create(
+                [
+                    UsageRollup(user_id=user_id, day=day, model=model, **rollup)
+                    for (user_id, day, model), rollup in rollups.items()
+                ],
+                batch_size=settings.EXPORT_CHUNK_SIZE
+            )
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Replaced {deleted} rollups with {len(rollups)} rebuilt from assistant messages"
+        ))
\ No newline at end of file
@@ -0,0 +1,46 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:17
+
+from django.db import migrations, models
+
+
+def backfill_sequences(apps, schema_editor):
+    """Number existing messages per conversation in created_at order"""
+    Conversation = apps.get_model('chat', 'Conversation')
+    ChatMessage = apps.get_model('chat', 'ChatMessage')
+    
+    for conversation_id in Conversation.objects.values_list('id', flat=True).iterator():
+        messages = list(
+            ChatMessage.objects.filter(conversation_id=conversation_id)
+            .order_by('created_at', 'id')
+            .only('id')
+        )
+        for sequence, message in enumerate(messages, start=1):
+            message.sequence = sequence
+        
+        ChatMessage.objects.bulk_update(messages, ['sequence'], batch_size=500)
+        Conversation.objects.filter(id=conversation_id).update(last_sequence=len(messages))
+
+
+class Migration(migrations.Migration):
+    
+    dependencies = [
+        ('chat', '0001_initial'),
+    ]
+    
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='sequence',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_sequence',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_sequences, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='chatmessage',
+            constraint=models.UniqueConstraint(fields=('conversation', 'sequence'), name='unique_message_sequence'),
+        ),
+    ]
\ No newline at end of file
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:18
+
+from django.db import migrations, models
+
+
+def backfill_token_counts(apps, schema_editor):
+    """Same estimate as ContextBuilder.estimate_tokens at the time of writing"""
+    ChatMessage = apps.get_model('chat', 'ChatMessage')
+
+    batch = []
+    for message in ChatMessage.objects.only('id', 'content').iterator(chunk_size=500):
+        message.token_count = -(-len(message.content or '') // 4) + 4
+        batch.append(message)
+        if len(batch) >= 500:
+            ChatMessage.objects.bulk_update(batch, ['token_count'])
+            batch = []
+
+    if batch:
+        ChatMessage.objects.bulk_update(batch, ['token_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_message_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='token_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_token_counts, migrations.RunPython.noop),
+    ]
\ No newline at end of file
@@ -0,0 +1,53 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:19
+
+from django.db import migrations, models
+
+
+def backfill_summaries(apps, schema_editor):
+    """Fill message_count and last_message_* from existing messages"""
+    Conversation = apps.get_model('chat', 'Conversation')
+    ChatMessage = apps.get_model('chat', 'ChatMessage')
+
+    for conversation_id in Conversation.objects.values_list('id', flat=True).iterator():
+        messages = ChatMessage.objects.filter(conversation_id=conversation_id)
+        latest = messages.order_by('-sequence').values('role', 'content', 'created_at').first()
+        if latest is None:
+            continue
+
+        Conversation.objects.filter(id=conversation_id).update(
+            message_count=messages.count(),
+            last_message_preview=latest['content'][:100],
+            last_message_role=latest['role'],
+            last_message_at=latest['created_at']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_message_token_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_preview',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_role',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:25
+
+from django.db import migrations
+
+SQLITE_FTS_TABLE = 'chat_message_fts'
+POSTGRES_SEARCH_INDEX = 'chat_message_search_idx'
+
+
+def create_search_index(apps, schema_editor):
+    """
+    SQLite: FTS5 table filled by an insert trigger
+    Postgres: GIN index over to_tsvector('english', content)
+    """
+    vendor = schema_editor.connection.vendor
+    ChatMessage = apps.get_model('chat', 'ChatMessage')
+
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {SQLITE_FTS_TABLE} USING fts5("
+            "content, message_id UNINDEXED, conversation_id UNINDEXED, "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {SQLITE_FTS_TABLE}_insert AFTER INSERT ON chat_chatmessage BEGIN "
+            f"INSERT INTO {SQLITE_FTS_TABLE}(content, message_id, conversation_id) "
+            "VALUES (NEW.content, NEW.id, NEW.conversation_id); END"
+        )
+        schema_editor.execute(
+            f"INSERT INTO {SQLITE_FTS_TABLE}(content, message_id, conversation_id) "
+            "SELECT content, id, conversation_id FROM chat_chatmessage"
+        )
+
+    elif vendor == 'postgresql':
+        from django.contrib.postgres.indexes import GinIndex
+        from django.contrib.postgres.search import SearchVector
+
+        schema_editor.add_index(
+            ChatMessage,
+            GinIndex(SearchVector('content', config='english'), name=POSTGRES_SEARCH_INDEX)
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    if vendor == 'sqlite':
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {SQLITE_FTS_TABLE}_insert")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SQLITE_FTS_TABLE}")
+
+    elif vendor == 'postgresql':
+        schema_editor.execute(f"DROP INDEX IF EXISTS {POSTGRES_SEARCH_INDEX}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_conversation_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
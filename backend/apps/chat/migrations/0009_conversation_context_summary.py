@@ -0,0 +1,47 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:44
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_unsummarized_tokens(apps, schema_editor):
+    """Nothing is summarized yet, every message counts"""
+    Conversation = apps.get_model('chat', 'Conversation')
+    ChatMessage = apps.get_model('chat', 'ChatMessage')
+
+    totals = ChatMessage.objects.filter(
+        conversation_id=OuterRef('pk')
+    ).order_by().values('conversation_id').annotate(total=Sum('token_count')).values('total')
+    Conversation.objects.update(unsummarized_tokens=Coalesce(Subquery(totals), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_chat_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='context_summary',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='context_summary_through',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='context_summary_tokens',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='unsummarized_tokens',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_unsummarized_tokens, migrations.RunPython.noop),
+    ]
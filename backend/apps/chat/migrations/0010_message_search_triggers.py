@@ -0,0 +1,52 @@
+# Generated by Django 5.0.1 on 2026-10-17 05:40
+
+from django.db import migrations
+
+SQLITE_FTS_TABLE = 'chat_message_fts'
+
+
+def create_search_triggers(apps, schema_editor):
+    """
+    SQLite: keep the FTS5 table in step with edited and deleted messages
+    Postgres: nothing to do, the expression index follows the table
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    schema_editor.execute(
+        f"CREATE TRIGGER {SQLITE_FTS_TABLE}_update AFTER UPDATE OF content, conversation_id "
+        f"ON chat_chatmessage BEGIN "
+        f"DELETE FROM {SQLITE_FTS_TABLE} WHERE message_id = OLD.id; "
+        f"INSERT INTO {SQLITE_FTS_TABLE}(content, message_id, conversation_id) "
+        "VALUES (NEW.content, NEW.id, NEW.conversation_id); END"
+    )
+    schema_editor.execute(
+        f"CREATE TRIGGER {SQLITE_FTS_TABLE}_delete AFTER DELETE ON chat_chatmessage BEGIN "
+        f"DELETE FROM {SQLITE_FTS_TABLE} WHERE message_id = OLD.id; END"
+    )
+
+    # Drop rows left behind by edits and deletes made before the triggers existed
+    schema_editor.execute(f"DELETE FROM {SQLITE_FTS_TABLE}")
+    schema_editor.execute(
+        f"INSERT INTO {SQLITE_FTS_TABLE}(content, message_id, conversation_id) "
+        "SELECT content, id, conversation_id FROM chat_chatmessage"
+    )
+
+
+def drop_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    schema_editor.execute(f"DROP TRIGGER IF EXISTS {SQLITE_FTS_TABLE}_update")
+    schema_editor.execute(f"DROP TRIGGER IF EXISTS {SQLITE_FTS_TABLE}_delete")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_conversation_context_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_triggers, drop_search_triggers),
+    ]
\ No newline at end of file
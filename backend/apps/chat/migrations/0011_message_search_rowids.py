@@ -0,0 +1,93 @@
+# Generated by Django 5.0.1 on 2026-10-17 06:30
+
+from django.db import migrations
+
+SQLITE_FTS_TABLE = 'chat_message_fts'
+# message_id -> rowid of its FTS row. message_id is UNINDEXED in the FTS
+# table (and a UUID, so it can't be the rowid itself), this keeps edits
+# and deletes to a primary key lookup instead of a full FTS scan
+SQLITE_FTS_IDS_TABLE = 'chat_message_fts_ids'
+
+
+def key_search_rows_by_rowid(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    for trigger in ('insert', 'update', 'delete'):
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {SQLITE_FTS_TABLE}_{trigger}")
+
+    schema_editor.execute(
+        f"CREATE TABLE {SQLITE_FTS_IDS_TABLE} ("
+        "message_id char(32) NOT NULL PRIMARY KEY, fts_rowid integer NOT NULL"
+        ") WITHOUT ROWID"
+    )
+
+    # Rebuild, numbering every message's FTS row
+    schema_editor.execute(f"DELETE FROM {SQLITE_FTS_TABLE}")
+    schema_editor.execute(
+        f"INSERT INTO {SQLITE_FTS_IDS_TABLE}(message_id, fts_rowid) "
+        "SELECT id, ROW_NUMBER() OVER (ORDER BY rowid) FROM chat_chatmessage"
+    )
+    schema_editor.execute(
+        f"INSERT INTO {SQLITE_FTS_TABLE}(rowid, content, message_id, conversation_id) "
+        f"SELECT i.fts_rowid, m.content, m.id, m.conversation_id "
+        f"FROM chat_chatmessage m JOIN {SQLITE_FTS_IDS_TABLE} i ON i.message_id = m.id"
+    )
+
+    fts_rowid = f"(SELECT fts_rowid FROM {SQLITE_FTS_IDS_TABLE} WHERE message_id = OLD.id)"
+    schema_editor.execute(
+        f"CREATE TRIGGER {SQLITE_FTS_TABLE}_insert AFTER INSERT ON chat_chatmessage BEGIN "
+        f"INSERT INTO {SQLITE_FTS_TABLE}(content, message_id, conversation_id) "
+        "VALUES (NEW.content, NEW.id, NEW.conversation_id); "
+        f"INSERT INTO {SQLITE_FTS_IDS_TABLE}(message_id, fts_rowid) "
+        "VALUES (NEW.id, last_insert_rowid()); END"
+    )
+    schema_editor.execute(
+        f"CREATE TRIGGER {SQLITE_FTS_TABLE}_update AFTER UPDATE OF content, conversation_id "
+        f"ON chat_chatmessage BEGIN "
+        f"UPDATE {SQLITE_FTS_TABLE} SET content = NEW.content, conversation_id = NEW.conversation_id "
+        f"WHERE rowid = {fts_rowid}; END"
+    )
+    schema_editor.execute(
+        f"CREATE TRIGGER {SQLITE_FTS_TABLE}_delete AFTER DELETE ON chat_chatmessage BEGIN "
+        f"DELETE FROM {SQLITE_FTS_TABLE} WHERE rowid = {fts_rowid}; "
+        f"DELETE FROM {SQLITE_FTS_IDS_TABLE} WHERE message_id = OLD.id; END"
+    )
+
+
+def key_search_rows_by_message_id(apps, schema_editor):
+    """Back to the triggers of 0005 and 0010"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    for trigger in ('insert', 'update', 'delete'):
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {SQLITE_FTS_TABLE}_{trigger}")
+    schema_editor.execute(f"DROP TABLE IF EXISTS {SQLITE_FTS_IDS_TABLE}")
+
+    schema_editor.execute(
+        f"CREATE TRIGGER {SQLITE_FTS_TABLE}_insert AFTER INSERT ON chat_chatmessage BEGIN "
+        f"INSERT INTO {SQLITE_FTS_TABLE}(content, message_id, conversation_id) "
+        "VALUES (NEW.content, NEW.id, NEW.conversation_id); END"
+    )
+    schema_editor.execute(
+        f"CREATE TRIGGER {SQLITE_FTS_TABLE}_update AFTER UPDATE OF content, conversation_id "
+        f"ON chat_chatmessage BEGIN "
+        f"DELETE FROM {SQLITE_FTS_TABLE} WHERE message_id = OLD.id; "
+        f"INSERT INTO {SQLITE_FTS_TABLE}(content, message_id, conversation_id) "
+        "VALUES (NEW.content, NEW.id, NEW.conversation_id); END"
+    )
+    schema_editor.execute(
+        f"CREATE TRIGGER {SQLITE_FTS_TABLE}_delete AFTER DELETE ON chat_chatmessage BEGIN "
+        f"DELETE FROM {SQLITE_FTS_TABLE} WHERE message_id = OLD.id; END"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0010_message_search_triggers'),
+    ]
+
+    operations = [
+        migrations.RunPython(key_search_rows_by_rowid, key_search_rows_by_message_id),
+    ]
\ No newline at end of file
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import F
 from django.contrib.auth.models import User
 from django.utils import timezone
 import uuid
@@ -9,12 +10,28 @@ class Conversation(models.Model):
     Represents a chat conversation/thread
     Each user can have multiple conversations
     """
+    PREVIEW_LENGTH = 100
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversations')
     title = models.CharField(max_length=255, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+    # Last sequence number handed out to a message in this conversation
+    last_sequence = models.PositiveIntegerField(default=0)
+    # Denormalized summary, kept in sync by ConversationService.append_message
+    message_count = models.PositiveIntegerField(default=0)
+    last_message_preview = models.CharField(max_length=PREVIEW_LENGTH, blank=True, default='')
+    last_message_role = models.CharField(max_length=20, blank=True, default='')
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    # Rolling summary of messages up to context_summary_through, sent in their
+    # place as a system message (see SummaryService)
+    context_summary = models.TextField(blank=True, default='')
+    context_summary_through = models.PositiveIntegerField(default=0)
+    context_summary_tokens = models.PositiveIntegerField(default=0)
+    # Sum of token_count of the messages after context_summary_through
+    unsummarized_tokens = models.PositiveIntegerField(default=0)
     
     class Meta:
         ordering = ['-updated_at']
@@ -56,7 +73,11 @@ class ChatMessage(models.Model):
     )
     role = models.CharField(max_length=20, choices=ROLE_CHOICES)
     content = models.TextField()
+    # Per-conversation ordering, allocated by ConversationService.append_message
+    sequence = models.PositiveIntegerField(default=0)
     tokens_used = models.IntegerField(null=True, blank=True)
+    # Cached prompt-size estimate of this message, see ContextBuilder
+    token_count = models.PositiveIntegerField(default=0)
     model_used = models.CharField(max_length=100, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     metadata = models.JSONField(default=dict, blank=True)
@@ -67,6 +88,12 @@ class ChatMessage(models.Model):
             models.Index(fields=['conversation', 'created_at']),
             models.Index(fields=['conversation', 'role']),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['conversation', 'sequence'],
+                name='unique_message_sequence'
+            ),
+        ]
     
     def __str__(self):
         return f"{self.role}: {self.content[:50]}"
@@ -90,7 +117,109 @@ class UserUsageStats(models.Model):
         return f"{self.user.username} - {self.total_messages} messages"
     
     def increment_usage(self, tokens=0):
-        self.total_messages += 1
-        self.total_tokens += tokens
-        self.last_request_at = timezone.now()
-        self.save()
\ No newline at end of file
+        """Atomic increment, the chat path buffers through UsageDelta instead"""
+        UserUsageStats.objects.filter(pk=self.pk).update(
+            total_messages=F('total_messages') + 1,
+            total_tokens=F('total_tokens') + tokens,
+            last_request_at=timezone.now()
+        )
+        self.refresh_from_db(fields=['total_messages', 'total_tokens', 'last_request_at'])
+
+
+class UsageDelta(models.Model):
+    """
+    Pending usage not yet applied to UserUsageStats
+    
+    Insert-only, so concurrent requests from the same user never contend
+    on the stats row. flush_usage_deltas folds these into the totals.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='usage_deltas')
+    messages = models.IntegerField(default=1)
+    tokens = models.IntegerField(default=0)
+    model = models.CharField(max_length=100, blank=True, default='')
+    prompt_tokens = models.IntegerField(default=0)
+    completion_tokens = models.IntegerField(default=0)
+    latency_ms = models.IntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['user']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} +{self.messages} messages, +{self.tokens} tokens"
+
+
+class UsageRollup(models.Model):
+    """
+    Per-user, per-day, per-model usage totals for analytics
+    
+    Maintained by the usage flusher from UsageDelta rows, so dashboards
+    read these instead of scanning ChatMessage.metadata.
+    latency_histogram holds counts per UsageService.LATENCY_BUCKETS_MS.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='usage_rollups')
+    day = models.DateField()
+    model = models.CharField(max_length=100, blank=True, default='')
+    message_count = models.IntegerField(default=0)
+    prompt_tokens = models.BigIntegerField(default=0)
+    completion_tokens = models.BigIntegerField(default=0)
+    latency_histogram = models.JSONField(default=list, blank=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'day', 'model'],
+                name='unique_usage_rollup'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} {self.day} {self.model or 'unknown'}: {self.message_count} messages"
+
+
+class ChatJob(models.Model):
+    """
+    A chat turn queued for a Celery worker (POST /chat/ in async mode)
+    
+    The user message is saved when the job is created, the worker
+    generates and saves the reply and stores the same payload ChatView
+    would have returned in result.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+    FINISHED = (SUCCEEDED, FAILED)
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_jobs')
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='jobs')
+    user_message = models.ForeignKey(ChatMessage, on_delete=models.CASCADE, related_name='jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    # Response cache opt in/out of the request, None follows the deployment setting
+    use_cache = models.BooleanField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} job {self.id}: {self.status}"
+    
+    @property
+    def is_finished(self):
+        return self.status in self.FINISHED
\ No newline at end of file
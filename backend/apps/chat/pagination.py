@@ -0,0 +1,87 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+import uuid
+
+
+class MessageCursorPagination(BasePagination):
+    """
+    Keyset pagination for chat messages on (created_at, id)
+    
+    Pages are read newest-first through the (conversation, created_at)
+    index and returned oldest-first. ?before=<cursor> loads the page of
+    older messages, so deep pages cost the same as the first one.
+    """
+    page_size = 50
+    max_page_size = 200
+    cursor_query_param = 'before'
+    page_size_query_param = 'limit'
+    invalid_cursor_message = 'Invalid cursor'
+    
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        before = self.decode_cursor(request.query_params.get(self.cursor_query_param))
+        self.page, self.has_more = self.get_page(queryset, self.get_page_size(request), before)
+        return self.page
+    
+    def get_paginated_response(self, data):
+        cursor = self.encode_cursor(self.page[0]) if self.has_more else None
+        next_url = None
+        if cursor:
+            next_url = replace_query_param(
+                self.request.build_absolute_uri(), self.cursor_query_param, cursor
+            )
+        
+        return Response({
+            'next': next_url,
+            'before': cursor,
+            'has_more': self.has_more,
+            'results': data,
+        })
+    
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+    
+    @classmethod
+    def get_page(cls, queryset, limit, before=None):
+        """
+        Up to limit messages older than the before key, oldest first
+        
+        Returns:
+            (messages, has_more)
+        """
+        if before is not None:
+            created_at, message_id = before
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) |
+                Q(created_at=created_at, id__lt=message_id)
+            )
+        
+        rows = list(queryset.order_by('-created_at', '-id')[:limit + 1])
+        has_more = len(rows) > limit
+        return rows[:limit][::-1], has_more
+    
+    @classmethod
+    def encode_cursor(cls, message) -> str:
+        raw = f"{message.created_at.isoformat()}|{message.id}"
+        return urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+    
+    @classmethod
+    def decode_cursor(cls, cursor):
+        if not cursor:
+            return None
+        
+        try:
+            raw = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            created_at, message_id = raw.split('|')
+            return datetime.fromisoformat(created_at), uuid.UUID(message_id)
+        except (TypeError, ValueError):
+            raise NotFound(cls.invalid_cursor_message)
\ No newline at end of file
@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import Conversation, ChatMessage, UserUsageStats
+from .models import Conversation, ChatMessage, UserUsageStats, ChatJob
+from .pagination import MessageCursorPagination
 
 
 class ChatMessageSerializer(serializers.ModelSerializer):
@@ -15,8 +16,7 @@ class ChatMessageSerializer(serializers.ModelSerializer):
 
 
 class ConversationSerializer(serializers.ModelSerializer):
-    """Serializer for conversations"""
-    message_count = serializers.IntegerField(source='get_message_count', read_only=True)
+    """Serializer for conversations, reads only denormalized summary columns"""
     latest_message = serializers.SerializerMethodField()
     
     class Meta:
@@ -25,29 +25,52 @@ class ConversationSerializer(serializers.ModelSerializer):
             'id', 'title', 'created_at', 'updated_at', 
             'is_active', 'message_count', 'latest_message'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'created_at', 'updated_at', 'message_count']
     
     def get_latest_message(self, obj):
-        latest = obj.messages.order_by('-created_at').first()
-        if latest:
+        if obj.last_message_at:
             return {
-                'content': latest.content[:100],
-                'role': latest.role,
-                'created_at': latest.created_at
+                'content': obj.last_message_preview,
+                'role': obj.last_message_role,
+                'created_at': obj.last_message_at
             }
         return None
 
 
+class ConversationSearchSerializer(ConversationSerializer):
+    """Conversation search hit with relevance and highlighted snippet"""
+    rank = serializers.FloatField(source='search_rank', read_only=True)
+    snippet = serializers.CharField(source='search_snippet', read_only=True)
+    matched_message_id = serializers.UUIDField(read_only=True, allow_null=True)
+    
+    class Meta(ConversationSerializer.Meta):
+        fields = ConversationSerializer.Meta.fields + ['rank', 'snippet', 'matched_message_id']
+
+
 class ConversationDetailSerializer(serializers.ModelSerializer):
-    """Detailed conversation with messages"""
-    messages = ChatMessageSerializer(many=True, read_only=True)
+    """
+    Conversation with its newest messages
+    Older messages are loaded from ChatHistoryView with messages_cursor
+    """
     
     class Meta:
         model = Conversation
         fields = [
             'id', 'title', 'created_at', 'updated_at', 
-            'is_active', 'messages'
+            'is_active', 'message_count'
         ]
+    
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        limit = self.context.get('message_limit', MessageCursorPagination.page_size)
+        
+        messages, has_more = MessageCursorPagination.get_page(instance.messages.all(), limit)
+        data['messages'] = ChatMessageSerializer(messages, many=True).data
+        data['has_more_messages'] = has_more
+        data['messages_cursor'] = (
+            MessageCursorPagination.encode_cursor(messages[0]) if has_more else None
+        )
+        return data
 
 
 class ChatRequestSerializer(serializers.Serializer):
@@ -55,6 +78,10 @@ class ChatRequestSerializer(serializers.Serializer):
     message = serializers.CharField(required=True, max_length=4000)
     conversation_id = serializers.UUIDField(required=False, allow_null=True)
     stream = serializers.BooleanField(default=False, required=False)
+    # Opt in/out of the LLM response cache, unset follows the deployment setting
+    cache = serializers.BooleanField(default=None, required=False, allow_null=True)
+    # 'async' queues the completion and answers 202 with a job (also: Prefer: respond-async)
+    mode = serializers.ChoiceField(choices=['sync', 'async'], default='sync', required=False)
     
     def validate_message(self, value):
         if not value or not value.strip():
@@ -62,6 +89,18 @@ class ChatRequestSerializer(serializers.Serializer):
         return value.strip()
 
 
+class ChatJobSerializer(serializers.ModelSerializer):
+    """Status of a queued chat turn, result holds the ChatView payload once done"""
+    
+    class Meta:
+        model = ChatJob
+        fields = [
+            'id', 'status', 'conversation_id', 'user_message_id',
+            'result', 'error', 'created_at', 'started_at', 'finished_at'
+        ]
+        read_only_fields = fields
+
+
 class ChatResponseSerializer(serializers.Serializer):
     """Serializer for chat response"""
     conversation_id = serializers.UUIDField()
@@ -0,0 +1,89 @@
+from celery import shared_task
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def cleanup_old_conversations():
+    """Delete conversations older than 90 days"""
+    from django.utils import timezone
+    from datetime import timedelta
+    from apps.chat.models import Conversation
+    
+    threshold = timezone.now() - timedelta(days=90)
+    deleted = Conversation.objects.filter(
+        updated_at__lt=threshold,
+        is_active=False
+    ).delete()
+    
+    return f"Deleted {deleted[0]} conversations"
+
+
+@shared_task(ignore_result=True)
+def flush_usage_deltas():
+    """Apply buffered usage deltas to UserUsageStats"""
+    from apps.core.services.usage_service import UsageService
+    
+    return UsageService.flush()
+
+
+@shared_task(ignore_result=True)
+def run_chat_job(job_id, quota_charge=0):
+    """Generate and save the reply of a queued chat turn (POST /chat/ in async mode)"""
+    from django.utils import timezone
+    from apps.chat.models import ChatJob
+    from apps.core.services.chat_service import ChatService
+    from apps.core.services.stream_buffer import StreamBuffer
+    from apps.core.services.token_quota import TokenQuota
+    from apps.core.services.request_timing import RequestTimings
+    
+    # Claim the job, a redelivered message finds it taken and does nothing
+    claimed = ChatJob.objects.filter(id=job_id, status=ChatJob.PENDING).update(
+        status=ChatJob.RUNNING, started_at=timezone.now()
+    )
+    if not claimed:
+        return
+    
+    job = None
+    buffer = None
+    llm_response = None
+    try:
+        job = ChatJob.objects.select_related('user', 'conversation', 'user_message').get(id=job_id)
+        buffer = StreamBuffer.get(str(job.id), job.user_id)
+        if buffer is not None:
+            buffer.append({'job_id': str(job.id), 'status': job.status})
+        
+        with RequestTimings.track('chat_job'):
+            assistant_message, llm_response = ChatService.generate_reply(
+                job.user, job.conversation, job.user_message, cache=job.use_cache
+            )
+        job.result = ChatService.response_data(
+            job.conversation, job.user_message, assistant_message, llm_response
+        )
+        job.status = ChatJob.SUCCEEDED
+    except Exception as e:
+        logger.error(f"Chat job {job_id} failed: {str(e)}")
+        if job is None:
+            # Never loaded, don't leave it claimed as running or its charge unsettled
+            ChatService.fail_job(job_id, f'Failed to generate response: {str(e)}', quota_charge)
+            return
+        job.error = f'Failed to generate response: {str(e)}'
+        job.status = ChatJob.FAILED
+    
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'error', 'finished_at'])
+    
+    # Charged by ChatView when the job was queued
+    TokenQuota.settle(job.user_id, quota_charge, llm_response)
+    
+    if buffer is not None:
+        buffer.finish(ChatService.job_event(job))
+
+
+@shared_task(ignore_result=True)
+def summarize_conversation(conversation_id):
+    """Fold older turns of a long conversation into its rolling summary"""
+    from apps.core.services.summary_service import SummaryService
+    
+    SummaryService.summarize(conversation_id)
\ No newline at end of file
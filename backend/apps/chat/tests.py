@@ -0,0 +1,469 @@
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from io import StringIO
+from unittest import mock
+import json
+import threading
+
+from talkflow.celery import app as celery_app
+
+from apps.chat.models import Conversation, ChatMessage, ChatJob, UsageDelta, UsageRollup
+from apps.chat.tasks import run_chat_job
+from apps.core.services.context_builder import ContextBuilder
+from apps.core.services.conversation_service import ConversationService
+from apps.core.services.fake_provider import FakeProvider
+from apps.core.services.llm_service import LLMService
+from apps.core.services.search_service import SearchService
+from apps.core.services.stream_buffer import StreamBuffer
+from apps.core.services.token_quota import TokenQuota
+from apps.core.services.usage_service import UsageService
+
+
+def run_in_threads(target, args_list):
+    """Run target once per args tuple on its own thread, re-raising the first error"""
+    errors = []
+    
+    def run(*args):
+        try:
+            target(*args)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            # Each thread has its own connection
+            connection.close()
+    
+    threads = [threading.Thread(target=run, args=args) for args in args_list]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    
+    if errors:
+        raise errors[0]
+
+
+class AppendMessageConcurrencyTests(TransactionTestCase):
+    """ConversationService.append_message from concurrent requests"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='writer', password='pass')
+        self.conversations = [Conversation.objects.create(user=self.user) for _ in range(4)]
+    
+    def test_sequences_are_unique_and_gap_free(self):
+        appends = 10
+        barrier = threading.Barrier(len(self.conversations) * 2)
+        
+        def write(conversation_id):
+            conversation = Conversation.objects.get(pk=conversation_id)
+            barrier.wait()
+            for index in range(appends):
+                ConversationService.append_message(conversation, role='user', content=f'message {index}')
+        
+        # Two writers per conversation, all conversations at once
+        run_in_threads(write, [(c.pk,) for c in self.conversations] * 2)
+        
+        for conversation in self.conversations:
+            sequences = list(
+                ChatMessage.objects.filter(conversation=conversation)
+                .order_by('sequence').values_list('sequence', flat=True)
+            )
+            self.assertEqual(sequences, list(range(1, appends * 2 + 1)))
+            
+            conversation.refresh_from_db()
+            self.assertEqual(conversation.last_sequence, appends * 2)
+            self.assertEqual(conversation.message_count, appends * 2)
+    
+    def test_slow_llm_call_does_not_hold_up_other_conversations(self):
+        slow, fast = self.conversations[:2]
+        slow_entered = threading.Event()
+        fast_done = threading.Event()
+        outcome = {}
+        
+        class StallingProvider(FakeProvider):
+            """Holds the slow request inside its LLM call until the other one is done"""
+            
+            def generate_response(self, messages, **kwargs):
+                if messages[-1]['content'] == 'slow question':
+                    slow_entered.set()
+                    outcome['fast_finished_first'] = fast_done.wait(5)
+                return super().generate_response(messages, **kwargs)
+        
+        def post(conversation_id, message):
+            client = APIClient()
+            client.force_authenticate(self.user)
+            if conversation_id == fast.pk:
+                slow_entered.wait(5)
+            response = client.post(
+                reverse('chat:chat'),
+                {'message': message, 'conversation_id': str(conversation_id)},
+                format='json'
+            )
+            outcome[message] = response.status_code
+            if conversation_id == fast.pk:
+                fast_done.set()
+        
+        caches['ratelimit'].clear()
+        with mock.patch.object(LLMService, '_provider', StallingProvider()):
+            run_in_threads(post, [(slow.pk, 'slow question'), (fast.pk, 'fast question')])
+        
+        # A transaction held across the LLM call would have blocked the second write
+        self.assertTrue(outcome['fast_finished_first'])
+        self.assertEqual(outcome['fast question'], 200)
+        self.assertEqual(outcome['slow question'], 200)
+        for conversation in (slow, fast):
+            self.assertEqual(
+                list(conversation.messages.values_list('sequence', flat=True).order_by('sequence')),
+                [1, 2]
+            )
+
+
+class ConversationListQueryTests(TestCase):
+    """The conversation list reads the denormalized columns only"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', password='pass')
+        for index in range(20):
+            conversation = Conversation.objects.create(user=self.user, title=f'Conversation {index}')
+            ConversationService.append_message(conversation, role='user', content='question')
+            ConversationService.append_message(conversation, role='assistant', content=f'answer {index}')
+        
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def test_query_count_does_not_grow_with_conversations(self):
+        # One COUNT for the page, one SELECT for its rows
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('chat:conversation_list'))
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 20)
+        first = response.data['results'][0]
+        self.assertEqual(first['message_count'], 2)
+        self.assertEqual(first['latest_message']['role'], 'assistant')
+
+
+class ChatMessageAdminTests(TestCase):
+    """Admin edits keep the conversation summary columns in sync"""
+    
+    def setUp(self):
+        self.user = User.objects.create_superuser(username='admin', password='pass')
+        self.conversation = Conversation.objects.create(user=self.user)
+        self.question = ConversationService.append_message(self.conversation, role='user', content='question')
+        self.answer = ConversationService.append_message(self.conversation, role='assistant', content='answer')
+        
+        self.model_admin = admin.site._registry[ChatMessage]
+        self.request = RequestFactory().post('/')
+        self.request.user = self.user
+    
+    def test_edit_of_latest_message_updates_preview(self):
+        self.answer.content = 'edited answer'
+        self.model_admin.save_model(self.request, self.answer, None, True)
+        
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.last_message_preview, 'edited answer')
+        self.assertEqual(self.conversation.message_count, 2)
+    
+    def test_edit_recounts_tokens(self):
+        self.answer.content = 'a much longer answer ' * 20
+        self.model_admin.save_model(self.request, self.answer, None, True)
+        
+        self.answer.refresh_from_db()
+        self.assertEqual(self.answer.token_count, ContextBuilder.estimate_tokens(self.answer.content))
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.unsummarized_tokens, self.question.token_count + self.answer.token_count)
+    
+    def test_summarized_messages_are_not_counted(self):
+        Conversation.objects.filter(pk=self.conversation.pk).update(context_summary_through=1)
+        self.answer.content = 'edited answer'
+        self.model_admin.save_model(self.request, self.answer, None, True)
+        
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.unsummarized_tokens, self.answer.token_count)
+    
+    def test_delete_falls_back_to_previous_message(self):
+        self.model_admin.delete_model(self.request, self.answer)
+        
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.message_count, 1)
+        self.assertEqual(self.conversation.last_message_preview, 'question')
+        self.assertEqual(self.conversation.last_message_role, 'user')
+        self.assertEqual(self.conversation.last_message_at, self.question.created_at)
+    
+    def test_bulk_delete_empties_summary(self):
+        self.model_admin.delete_queryset(self.request, ChatMessage.objects.filter(conversation=self.conversation))
+        
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.message_count, 0)
+        self.assertEqual(self.conversation.unsummarized_tokens, 0)
+        self.assertEqual(self.conversation.last_message_preview, '')
+        self.assertIsNone(self.conversation.last_message_at)
+        # Sequence numbers are never reused
+        self.assertEqual(self.conversation.last_sequence, 2)
+
+
+class MessageSearchIndexTests(TestCase):
+    """The search index follows edits and deletes of messages"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='searcher', password='pass')
+        self.conversation = Conversation.objects.create(user=self.user)
+        self.message = ConversationService.append_message(self.conversation, role='user', content='walrus habitat')
+    
+    def hit_ids(self, query):
+        return [hit['message_id'] for hit in SearchService.search_conversations(self.user, query)]
+    
+    def test_edited_message_is_found_by_new_content_only(self):
+        self.message.content = 'penguin habitat'
+        self.message.save()
+        
+        self.assertEqual(self.hit_ids('walrus'), [])
+        self.assertEqual(self.hit_ids('penguin'), [self.message.id])
+    
+    def test_deleted_message_is_not_found(self):
+        self.message.delete()
+        
+        self.assertEqual(self.hit_ids('walrus'), [])
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM chat_message_fts")
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+
+class UsageFlushConcurrencyTests(TransactionTestCase):
+    """record_usage and flush running side by side lose no increments"""
+    
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'user{index}', password='pass') for index in range(3)]
+    
+    def test_no_increments_are_lost(self):
+        requests = 15
+        response = {'model': 'test-model', 'tokens_used': 30, 'prompt_tokens': 20,
+                    'completion_tokens': 10, 'latency_ms': 300}
+        recording = threading.Event()
+        
+        def record(user_id):
+            user = User.objects.get(pk=user_id)
+            recording.set()
+            for _ in range(requests):
+                UsageService.record_usage(user, response)
+        
+        def flush():
+            recording.wait(5)
+            for _ in range(5):
+                UsageService.flush()
+        
+        # Two writers per user, plus flushers racing the writers and each other
+        run_in_threads(
+            lambda task, *args: task(*args),
+            [(record, user.pk) for user in self.users] * 2 + [(flush,), (flush,)]
+        )
+        UsageService.flush()
+        
+        self.assertFalse(UsageDelta.objects.exists())
+        for user in self.users:
+            stats = UsageService.get_stats(user)
+            self.assertEqual(stats.total_messages, requests * 2)
+            self.assertEqual(stats.total_tokens, requests * 2 * 30)
+            
+            rollups = UsageRollup.objects.filter(user=user)
+            self.assertEqual(sum(rollup.message_count for rollup in rollups), requests * 2)
+            self.assertEqual(sum(sum(rollup.latency_histogram) for rollup in rollups), requests * 2)
+    
+    def test_pending_summary_tokens_are_counted(self):
+        user = self.users[0]
+        UsageService.record_usage(user, {'model': 'test-model', 'tokens_used': 50}, messages=0)
+        
+        stats = UsageService.get_stats(user)
+        self.assertEqual(stats.total_messages, 0)
+        self.assertEqual(stats.total_tokens, 50)
+        self.assertIsNotNone(stats.last_request_at)
+
+
+class LatencyPercentileTests(SimpleTestCase):
+    
+    def test_interpolates_within_bucket(self):
+        histogram = [0] * (len(UsageService.LATENCY_BUCKETS_MS) + 1)
+        # Ten samples between 250 and 500 ms
+        histogram[2] = 10
+        
+        self.assertEqual(UsageService.latency_percentile(histogram, 50), 375)
+        self.assertEqual(UsageService.latency_percentile(histogram, 100), 500)
+    
+    def test_overflow_reports_last_bound(self):
+        histogram = [0] * (len(UsageService.LATENCY_BUCKETS_MS) + 1)
+        histogram[-1] = 1
+        
+        self.assertEqual(UsageService.latency_percentile(histogram, 95), UsageService.LATENCY_BUCKETS_MS[-1])
+    
+    def test_empty_histogram(self):
+        self.assertIsNone(UsageService.latency_percentile([0, 0], 50))
+
+
+class BackfillUsageRollupsTests(TestCase):
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='backfill', password='pass')
+        self.conversation = Conversation.objects.create(user=self.user)
+    
+    def reply(self, **metadata):
+        ConversationService.append_message(
+            self.conversation, role='assistant', content='answer', model_used='test-model',
+            metadata={'prompt_tokens': 20, 'completion_tokens': 10, 'latency_ms': 300, **metadata}
+        )
+    
+    def test_cached_and_coalesced_replies_spend_no_tokens(self):
+        self.reply()
+        self.reply(cached=True)
+        self.reply(coalesced=True)
+        
+        call_command('backfill_usage_rollups', stdout=StringIO())
+        
+        rollup = UsageRollup.objects.get(user=self.user, model='test-model')
+        self.assertEqual(rollup.message_count, 3)
+        self.assertEqual(rollup.prompt_tokens, 20)
+        self.assertEqual(rollup.completion_tokens, 10)
+        self.assertEqual(sum(rollup.latency_histogram), 3)
+
+
+class ChatJobTests(TestCase):
+    """Async chat turns run by an eager Celery worker"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='jobs', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        
+        # Settings are namespaced, so the keys are CELERY_* ones
+        always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.update(CELERY_TASK_ALWAYS_EAGER=True)
+        self.addCleanup(celery_app.conf.update, CELERY_TASK_ALWAYS_EAGER=always_eager)
+        
+        patcher = mock.patch.object(LLMService, '_provider', FakeProvider(content='Hello from the worker'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def start_job(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('chat:chat'), {'message': 'hi', 'mode': 'async'}, format='json')
+        self.assertEqual(response.status_code, 202)
+        return response.data['data']['job_id']
+    
+    def events(self, job_id):
+        response = self.client.get(reverse('chat:chat_job_events', args=[job_id]))
+        self.assertEqual(response.status_code, 200)
+        body = b''.join(response.streaming_content).decode()
+        return [
+            json.loads(line[len('data: '):])
+            for line in body.splitlines() if line.startswith('data: ')
+        ]
+    
+    def test_job_runs_and_reports_its_result(self):
+        job_id = self.start_job()
+        
+        job = ChatJob.objects.get(id=job_id)
+        self.assertEqual(job.status, ChatJob.SUCCEEDED)
+        self.assertEqual(job.result['assistant_message']['content'], 'Hello from the worker')
+        
+        final = self.events(job_id)[-1]
+        self.assertTrue(final['done'])
+        self.assertEqual(final['status'], ChatJob.SUCCEEDED)
+    
+    def test_events_fall_back_to_job_row(self):
+        # A worker on another cache never writes the buffer the web process created
+        with mock.patch.object(StreamBuffer, 'get', return_value=None):
+            job_id = self.start_job()
+        
+        final = self.events(job_id)[-1]
+        self.assertTrue(final['done'])
+        self.assertEqual(final['data']['assistant_message']['content'], 'Hello from the worker')
+    
+    def test_failure_before_generation_does_not_leave_job_running(self):
+        conversation = Conversation.objects.create(user=self.user)
+        message = ConversationService.append_message(conversation, role='user', content='hi')
+        job = ChatJob.objects.create(user=self.user, conversation=conversation, user_message=message)
+        
+        with mock.patch.object(StreamBuffer, 'get', side_effect=ConnectionError('cache down')):
+            run_chat_job.delay(str(job.id))
+        
+        job.refresh_from_db()
+        self.assertEqual(job.status, ChatJob.FAILED)
+        self.assertIn('cache down', job.error)
+        self.assertIsNotNone(job.finished_at)
+    
+    def test_job_that_cannot_be_loaded_settles_its_charge(self):
+        conversation = Conversation.objects.create(user=self.user)
+        message = ConversationService.append_message(conversation, role='user', content='hi')
+        job = ChatJob.objects.create(user=self.user, conversation=conversation, user_message=message)
+        StreamBuffer.create(self.user.id, stream_id=str(job.id))
+        
+        with mock.patch.object(ChatJob.objects, 'select_related', side_effect=DatabaseError('db gone')), \
+                mock.patch.object(TokenQuota, 'settle') as settle:
+            run_chat_job.delay(str(job.id), 500)
+        
+        settle.assert_called_once_with(self.user.id, 500)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ChatJob.FAILED)
+        self.assertEqual(self.events(job.id)[-1]['status'], ChatJob.FAILED)
+    
+    def test_job_that_cannot_be_queued_fails_and_settles_its_charge(self):
+        with mock.patch.object(run_chat_job, 'delay', side_effect=ConnectionError('broker down')), \
+                mock.patch.object(TokenQuota, 'charge', return_value=500), \
+                mock.patch.object(TokenQuota, 'settle') as settle:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('chat:chat'), {'message': 'hi', 'mode': 'async'}, format='json')
+        
+        self.assertEqual(response.status_code, 202)
+        settle.assert_any_call(self.user.id, 500)
+        
+        job = ChatJob.objects.get(id=response.data['data']['job_id'])
+        self.assertEqual(job.status, ChatJob.FAILED)
+        self.assertIn('broker down', job.error)
+        job_id = job.id
+        self.assertEqual(self.events(job_id)[-1]['status'], ChatJob.FAILED)
+
+
+class TokenQuotaSettleTests(SimpleTestCase):
+    
+    def settled_cost(self, llm_response):
+        with mock.patch.object(TokenQuota, 'is_enabled', return_value=True), \
+                mock.patch.object(TokenQuota, '_apply', return_value=(True, 0.0)) as apply:
+            TokenQuota.settle(1, 100, llm_response)
+        return apply.call_args.args[1]
+    
+    def test_charge_is_reconciled_with_tokens_used(self):
+        self.assertEqual(self.settled_cost({'tokens_used': 40}), -60)
+    
+    def test_cached_and_coalesced_replies_are_refunded(self):
+        self.assertEqual(self.settled_cost({'tokens_used': 40, 'cached': True}), -100)
+        self.assertEqual(self.settled_cost({'tokens_used': 40, 'coalesced': True}), -100)
+
+
+class ChatRateLimitTests(TestCase):
+    """The sync, async and streaming chat endpoints share one rate limit"""
+    
+    def setUp(self):
+        caches['ratelimit'].clear()
+        self.user = User.objects.create_user(username='limited', password='pass')
+        self.client = APIClient()
+        token = RefreshToken.for_user(self.user).access_token
+        # JWT, the async endpoints authenticate on their own
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        
+        patcher = mock.patch.object(LLMService, '_provider', FakeProvider())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_async_endpoints_count_against_the_sync_budget(self):
+        for _ in range(10):
+            response = self.client.post(reverse('chat:chat'), {'message': 'hi'}, format='json')
+            self.assertEqual(response.status_code, 200)
+        
+        for name in ('chat:chat_async', 'chat:chat_async_stream'):
+            response = self.client.post(reverse(name), {'message': 'hi'}, format='json')
+            self.assertEqual(response.status_code, 429)
\ No newline at end of file
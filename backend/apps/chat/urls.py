@@ -5,7 +5,17 @@ from .views import (
     ConversationDetailView,
     ChatHistoryView,
     UserStatsView,
+    UsageTimeseriesView,
     ChatStreamView,
+    ChatStreamResumeView,
+    ChatJobView,
+    ChatJobEventsView,
+    ConversationSearchView,
+    ConversationExportView,
+    ConversationBulkExportView,
+    AsyncChatView,
+    AsyncChatStreamView,
+    AsyncChatStreamResumeView,
 )
 
 app_name = 'chat'
@@ -13,13 +23,25 @@ app_name = 'chat'
 urlpatterns = [
     # Main chat endpoint
     path('', ChatView.as_view(), name='chat'),
+    path('jobs/<uuid:job_id>/', ChatJobView.as_view(), name='chat_job'),
+    path('jobs/<uuid:job_id>/events/', ChatJobEventsView.as_view(), name='chat_job_events'),
     
     # Conversation management
     path('conversations/', ConversationListView.as_view(), name='conversation_list'),
     path('conversations/<uuid:id>/', ConversationDetailView.as_view(), name='conversation_detail'),
+    path('conversations/<uuid:id>/export/', ConversationExportView.as_view(), name='conversation_export'),
+    path('conversations/export/', ConversationBulkExportView.as_view(), name='conversation_bulk_export'),
+    path('search/', ConversationSearchView.as_view(), name='conversation_search'),
     
     # History and stats
     path('history/', ChatHistoryView.as_view(), name='chat_history'),
     path('stats/', UserStatsView.as_view(), name='user_stats'),
+    path('stats/timeseries/', UsageTimeseriesView.as_view(), name='usage_timeseries'),
     path('stream/', ChatStreamView.as_view(), name='chat_stream'),
+    path('stream/<str:stream_id>/', ChatStreamResumeView.as_view(), name='chat_stream_resume'),
+    
+    # Native async endpoints (serve with an ASGI server)
+    path('async/', AsyncChatView.as_view(), name='chat_async'),
+    path('async/stream/', AsyncChatStreamView.as_view(), name='chat_async_stream'),
+    path('async/stream/<str:stream_id>/', AsyncChatStreamResumeView.as_view(), name='chat_async_stream_resume'),
 ]
\ No newline at end of file
@@ -1,31 +1,112 @@
 from rest_framework import status, generics, views
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db import transaction
 from django.conf import settings
 from django.utils import timezone
+from datetime import timedelta
 from django.core.cache import cache
+from django.db import connection, transaction
+import asyncio
 import logging
+import threading
 
-from .models import Conversation, ChatMessage, UserUsageStats
+from .models import Conversation, ChatMessage, UserUsageStats, ChatJob
+from .pagination import MessageCursorPagination
 from .serializers import (
     ChatRequestSerializer,
     ChatResponseSerializer,
     ConversationSerializer,
     ConversationDetailSerializer,
+    ConversationSearchSerializer,
     ChatMessageSerializer,
+    ChatJobSerializer,
     UserUsageStatsSerializer
 )
 from apps.core.services.llm_service import LLMService
+from apps.core.services.chat_service import ChatService
+from apps.core.services.conversation_service import ConversationService
+from apps.core.services.context_builder import ContextBuilder
+from apps.core.services.prompt_cache import PromptCache
+from apps.core.services.search_service import SearchService
+from apps.core.services.export_service import ExportService
+from apps.core.services.usage_service import UsageService
+from apps.core.services.streaming import StreamAccumulator, sse_event
+from apps.core.services.stream_buffer import StreamBuffer
+from apps.core.services.idempotency import IdempotencyStore
+from apps.core.services.admission import AdmissionController
+from apps.core.services.token_quota import TokenQuota
+from apps.core.services.request_timing import RequestTimings
+from apps.core.exceptions import AdmissionRejected, QuotaExceeded
+from apps.core.metrics import LLM_STREAMS_CANCELLED, LLM_CANCELLED_TOKENS_SAVED
 from django_ratelimit.decorators import ratelimit
 from django.utils.decorators import method_decorator
 from django.shortcuts import get_object_or_404
-from django.db.models import Q
-from django.http import HttpResponse
+from django.urls import reverse
+from django.http import JsonResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django_ratelimit.core import is_ratelimited
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import APIException
+from rest_framework_simplejwt.authentication import JWTAuthentication
 
 logger = logging.getLogger(__name__)
 
-@method_decorator(ratelimit(key='user', rate='10/m', method='POST'), name='post')
+# One budget shared by the sync, async and streaming chat endpoints
+CHAT_RATE_LIMIT = {'group': 'chat', 'key': 'user', 'rate': '10/m', 'method': 'POST'}
+
+
+def get_idempotency_key(request, scope):
+    """Store key of the Idempotency-Key header as (key, error_response), key is None without one"""
+    key = request.headers.get('Idempotency-Key')
+    if key is None:
+        return None, None
+    
+    if not IdempotencyStore.is_valid_key(key):
+        return None, Response({
+            'success': False,
+            'error': f'Idempotency-Key must be 1-{IdempotencyStore.MAX_KEY_LENGTH} printable characters'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    return IdempotencyStore.make_key(request.user.id, scope, key), None
+
+
+def idempotency_error(record, fingerprint, scope):
+    """Response for a retry that can't be replayed, None if it can"""
+    if record['fingerprint'] != fingerprint:
+        IdempotencyStore.count(scope, 'mismatch')
+        return Response({
+            'success': False,
+            'error': 'Idempotency-Key was already used for a different request'
+        }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    
+    if record['state'] != IdempotencyStore.DONE:
+        IdempotencyStore.count(scope, 'in_progress')
+        return Response({
+            'success': False,
+            'error': 'A request with this Idempotency-Key is still in progress'
+        }, status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'})
+    
+    return None
+
+
+def retry_later_response(e):
+    """429/503 with Retry-After for a request turned away by admission control or the token quota"""
+    return JsonResponse({
+        'success': False,
+        'error': str(e)
+    }, status=e.status_code, headers={'Retry-After': str(e.retry_after)})
+
+
+def charge_token_quota(user, conversation_id, message_content):
+    """Charge a chat request's estimated tokens up front as (charged, error_response)"""
+    try:
+        return TokenQuota.charge(user, conversation_id, message_content), None
+    except QuotaExceeded as e:
+        return 0, retry_later_response(e)
+
+
+@method_decorator(ratelimit(**CHAT_RATE_LIMIT), name='post')
 class ChatView(views.APIView):
     """
     Main chat endpoint - Send message and get AI response
@@ -34,87 +115,100 @@ class ChatView(views.APIView):
     Request body:
     {
         "message": "Your message here",
-        "conversation_id": "uuid" (optional, creates new if not provided)
+        "conversation_id": "uuid" (optional, creates new if not provided),
+        "mode": "sync" | "async" (optional)
     }
+    
+    The request runs as a staged pipeline: the user message is saved in
+    its own short transaction, the LLM is called with no transaction
+    open, then the assistant reply is saved in a second short one.
+    
+    In async mode (or with a Prefer: respond-async header) only the user
+    message is saved here. The reply is generated by a Celery worker and
+    the response is 202 with a job to poll at /chat/jobs/<job_id>/ or to
+    follow at /chat/jobs/<job_id>/events/
+    
+    With an Idempotency-Key header, a retried request gets the first
+    response back (waiting for it if needed) instead of a second turn
     """
     permission_classes = [IsAuthenticated]
     
-    @transaction.atomic
+    @RequestTimings.timed('chat')
     def post(self, request):
         serializer = ChatRequestSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
+        store_key, error_response = get_idempotency_key(request, 'chat')
+        if error_response:
+            return error_response
+        if store_key is None:
+            return self.respond(request, serializer)
+        
+        fingerprint = IdempotencyStore.fingerprint(serializer.validated_data)
+        record = IdempotencyStore.begin(store_key, fingerprint)
+        if record is not None:
+            error_response = idempotency_error(record, fingerprint, 'chat')
+            if error_response:
+                return error_response
+            IdempotencyStore.count('chat', 'replayed')
+            return Response(record['data'], status=record['status'], headers={'Idempotent-Replayed': 'true'})
+        
+        response = self.respond(request, serializer)
+        if response.status_code >= 500 or response.status_code == status.HTTP_429_TOO_MANY_REQUESTS:
+            # Nothing worth replaying, let the retry run
+            IdempotencyStore.release(store_key)
+        else:
+            IdempotencyStore.complete(store_key, fingerprint, response.status_code, response.data)
+        IdempotencyStore.count('chat', 'new')
+        return response
+    
+    def respond(self, request, serializer):
         user = request.user
         message_content = serializer.validated_data['message']
         conversation_id = serializer.validated_data.get('conversation_id')
+        run_async = (
+            serializer.validated_data['mode'] == 'async' or
+            'respond-async' in request.headers.get('Prefer', '')
+        )
+        
+        charged, error_response = charge_token_quota(user, conversation_id, message_content)
+        if error_response:
+            return error_response
         
+        llm_response = None
         try:
             # Get or create conversation
             if conversation_id:
-                conversation = Conversation.objects.select_for_update().get(
+                conversation = Conversation.objects.get(
                     id=conversation_id,
                     user=user
                 )
             else:
                 conversation = Conversation.objects.create(user=user)
             
-            # Load conversation history (limited for performance)
-            history_messages = conversation.messages.order_by('created_at')[:settings.MAX_CHAT_HISTORY]
-            
-            # Save user message
-            user_message = ChatMessage.objects.create(
-                conversation=conversation,
-                role='user',
-                content=message_content
+            # Save user message (stage 1)
+            user_message = ConversationService.append_message(
+                conversation, role='user', content=message_content
             )
             
-            # Prepare messages for LLM
-            llm_messages = LLMService.format_conversation_for_llm(history_messages)
-            llm_messages.append({'role': 'user', 'content': message_content})
-            
-            # Call LLM service
-            llm_response = LLMService.generate_chat_response(messages=llm_messages)
+            if run_async:
+                response = self.start_job(
+                    request, conversation, user_message, serializer.validated_data.get('cache'), charged
+                )
+                # The job settles the charge once its reply is generated
+                charged = 0
+                return response
             
-            # Save assistant response
-            assistant_message = ChatMessage.objects.create(
-                conversation=conversation,
-                role='assistant',
-                content=llm_response['content'],
-                tokens_used=llm_response.get('tokens_used', 0),
-                model_used=llm_response.get('model', 'unknown'),
-                metadata={
-                    'prompt_tokens': llm_response.get('prompt_tokens', 0),
-                    'completion_tokens': llm_response.get('completion_tokens', 0),
-                    'finish_reason': llm_response.get('finish_reason', 'unknown')
-                }
+            assistant_message, llm_response = ChatService.generate_reply(
+                user, conversation, user_message, cache=serializer.validated_data.get('cache')
             )
             
-            # Update conversation timestamp and generate title if first message
-            conversation.updated_at = timezone.now()
-            conversation.save()
-            
-            if conversation.get_message_count() == 2 and not conversation.title:
-                conversation.generate_title()
-            
-            # Update user usage stats
-            usage_stats, _ = UserUsageStats.objects.get_or_create(user=user)
-            usage_stats.increment_usage(tokens=llm_response.get('tokens_used', 0))
-            
             # Return response
-            response_data = {
-                'conversation_id': str(conversation.id),
-                'user_message': ChatMessageSerializer(user_message).data,
-                'assistant_message': ChatMessageSerializer(assistant_message).data,
-                'usage': {
-                    'prompt_tokens': llm_response.get('prompt_tokens', 0),
-                    'completion_tokens': llm_response.get('completion_tokens', 0),
-                    'total_tokens': llm_response.get('tokens_used', 0),
-                }
-            }
-            
             return Response({
                 'success': True,
-                'data': response_data
+                'data': ChatService.response_data(
+                    conversation, user_message, assistant_message, llm_response
+                )
             }, status=status.HTTP_200_OK)
             
         except Conversation.DoesNotExist:
@@ -123,12 +217,59 @@ class ChatView(views.APIView):
                 'error': 'Conversation not found'
             }, status=status.HTTP_404_NOT_FOUND)
             
+        except AdmissionRejected as e:
+            return Response({
+                'success': False,
+                'error': str(e)
+            }, status=e.status_code, headers={'Retry-After': str(e.retry_after)})
+            
         except Exception as e:
             logger.error(f"Chat error for user {user.username}: {str(e)}")
             return Response({
                 'success': False,
                 'error': f'Failed to generate response: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        finally:
+            # Refunds the estimate not used, all of it if no reply came back
+            TokenQuota.settle(user.id, charged, llm_response)
+    
+    def start_job(self, request, conversation, user_message, cache, quota_charge=0):
+        """Queue stages 2 and 3 for a worker, answers 202 with the job"""
+        from .tasks import run_chat_job
+        
+        job = ChatJob.objects.create(
+            user=request.user,
+            conversation=conversation,
+            user_message=user_message,
+            use_cache=cache,
+        )
+        # Events of the job, followed at /chat/jobs/<job_id>/events/
+        StreamBuffer.create(request.user.id, stream_id=str(job.id))
+        
+        def enqueue():
+            try:
+                run_chat_job.delay(str(job.id), quota_charge)
+            except Exception as e:
+                # Broker down, no worker will ever pick the job up
+                logger.error(f"Chat job {job.id} could not be queued: {str(e)}")
+                ChatService.fail_job(job.id, f'Failed to queue job: {str(e)}', quota_charge)
+                job.refresh_from_db(fields=['status', 'error', 'finished_at'])
+        
+        transaction.on_commit(enqueue)
+        
+        status_url = request.build_absolute_uri(reverse('chat:chat_job', args=[job.id]))
+        return Response({
+            'success': True,
+            'data': {
+                'job_id': str(job.id),
+                'status': job.status,
+                'conversation_id': str(conversation.id),
+                'user_message': ChatMessageSerializer(user_message).data,
+                'status_url': status_url,
+                'events_url': f'{status_url}events/',
+            }
+        }, status=status.HTTP_202_ACCEPTED, headers={'Location': status_url})
 
 
 class ConversationListView(generics.ListAPIView):
@@ -143,14 +284,17 @@ class ConversationListView(generics.ListAPIView):
         return Conversation.objects.filter(
             user=self.request.user,
             is_active=True
-        ).prefetch_related('messages')
+        )
 
 
 class ConversationDetailView(generics.RetrieveDestroyAPIView):
     """
-    Get conversation details with full message history
-    GET /chat/conversations/<uuid>/
+    Get conversation details with the newest messages
+    GET /chat/conversations/<uuid>/?limit=<n>
     DELETE /chat/conversations/<uuid>/
+    
+    Returns at most n messages (default 50) plus messages_cursor for
+    loading older ones from /chat/history/
     """
     permission_classes = [IsAuthenticated]
     serializer_class = ConversationDetailSerializer
@@ -159,11 +303,17 @@ class ConversationDetailView(generics.RetrieveDestroyAPIView):
     def get_queryset(self):
         return Conversation.objects.filter(user=self.request.user)
     
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['message_limit'] = MessageCursorPagination().get_page_size(self.request)
+        return context
+    
     def destroy(self, request, *args, **kwargs):
         """Soft delete conversation"""
         instance = self.get_object()
         instance.is_active = False
         instance.save()
+        PromptCache.invalidate(instance.id)
         return Response({
             'success': True,
             'message': 'Conversation deleted successfully'
@@ -172,11 +322,15 @@ class ConversationDetailView(generics.RetrieveDestroyAPIView):
 
 class ChatHistoryView(generics.ListAPIView):
     """
-    Get chat history for a specific conversation
-    GET /chat/history/?conversation_id=<uuid>
+    Get chat history for a specific conversation, newest page first
+    GET /chat/history/?conversation_id=<uuid>&before=<cursor>&limit=<n>
+    
+    Pass the returned 'before' cursor to load the next page of older
+    messages (infinite scroll)
     """
     permission_classes = [IsAuthenticated]
     serializer_class = ChatMessageSerializer
+    pagination_class = MessageCursorPagination
     
     def get_queryset(self):
         conversation_id = self.request.query_params.get('conversation_id')
@@ -187,7 +341,7 @@ class ChatHistoryView(generics.ListAPIView):
         return ChatMessage.objects.filter(
             conversation__id=conversation_id,
             conversation__user=self.request.user
-        ).order_by('created_at')
+        )
 
 
 class UserStatsView(generics.RetrieveAPIView):
@@ -199,16 +353,174 @@ class UserStatsView(generics.RetrieveAPIView):
     serializer_class = UserUsageStatsSerializer
     
     def get_object(self):
-        obj, _ = UserUsageStats.objects.get_or_create(user=self.request.user)
-        return obj
+        # Stored totals plus deltas not yet flushed
+        return UsageService.get_stats(self.request.user)
+
+
+class UsageTimeseriesView(views.APIView):
+    """
+    Daily usage time series from the usage rollups
+    GET /chat/stats/timeseries/?days=30&model=<model>&by_model=true
+    """
+    permission_classes = [IsAuthenticated]
+    
+    MAX_DAYS = 366
+    
+    def get(self, request):
+        try:
+            days = int(request.query_params.get('days', 30))
+        except ValueError:
+            return Response({
+                'success': False,
+                'error': 'days must be an integer'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        days = max(1, min(days, self.MAX_DAYS))
+        
+        model = request.query_params.get('model') or None
+        by_model = request.query_params.get('by_model', '').lower() in ('1', 'true', 'yes')
+        
+        end = timezone.localdate()
+        start = end - timedelta(days=days - 1)
+        series = UsageService.get_timeseries(
+            request.user, start, end, model=model, by_model=by_model
+        )
+        
+        return Response({
+            'success': True,
+            'data': {
+                'start': start,
+                'end': end,
+                'model': model,
+                'by_model': by_model,
+                'series': series,
+            }
+        }, status=status.HTTP_200_OK)
     
 from django.http import StreamingHttpResponse
 import json
 
+def sse_response(event_stream, stream_id):
+    """StreamingHttpResponse for a chat event stream"""
+    return StreamingHttpResponse(
+        event_stream,
+        content_type='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+            'X-Stream-ID': stream_id,
+        }
+    )
+
+
+def new_stream_accumulator(llm_messages):
+    """StreamAccumulator with a prompt estimate, in case the stream is cancelled"""
+    return StreamAccumulator(prompt_tokens=sum(
+        ContextBuilder.estimate_tokens(m['content']) for m in llm_messages
+    ))
+
+
+def record_stream_cancelled(buffer, llm_response):
+    """Count a cancelled generation and the completion tokens it didn't spend"""
+    saved = max(0, settings.LLM_CONFIG['MAX_TOKENS'] - llm_response['completion_tokens'])
+    LLM_STREAMS_CANCELLED.inc()
+    LLM_CANCELLED_TOKENS_SAVED.inc(saved)
+    logger.info(f"Stream {buffer.stream_id} abandoned, cancelled upstream (up to {saved} tokens saved)")
+
+
+@RequestTimings.timed('chat_stream')
+def run_stream_generation(buffer, user, message_content, conversation_id, tier='default',
+                          quota_charge=0):
+    """
+    Generate a streamed reply into buffer
+    
+    Runs on its own thread, so a client that drops can resume. Once no
+    client has read the buffer for STREAM_CANCEL_GRACE seconds the
+    upstream stream is closed and the partial reply is saved with
+    finish_reason 'cancelled'. The stream holds an admission slot of
+    tier while it runs, and settles quota_charge once it's done.
+    """
+    llm_response = None
+    try:
+        # Get/create conversation
+        if conversation_id:
+            conversation = Conversation.objects.get(id=conversation_id, user=user)
+        else:
+            conversation = Conversation.objects.create(user=user)
+        
+        # Save user message
+        user_message = ConversationService.append_message(
+            conversation, role='user', content=message_content
+        )
+        
+        # Prepare messages
+        llm_messages = ContextBuilder.build_messages(conversation, user_message)
+        
+        # Stream response, tokens are coalesced into frames
+        provider = LLMService.get_provider()
+        stream = new_stream_accumulator(llm_messages)
+        
+        with RequestTimings.llm_call(), AdmissionController.slot(tier):
+            upstream = provider.generate_streaming_response(llm_messages)
+            try:
+                for item in upstream:
+                    text = stream.feed(item)
+                    if text:
+                        buffer.append({'chunk': text})
+                    if buffer.is_abandoned():
+                        stream.cancel()
+                        break
+            finally:
+                # Closes the provider's HTTP stream, generation stops upstream
+                upstream.close()
+        
+        text = stream.flush()
+        if text:
+            buffer.append({'chunk': text})
+        
+        # Save complete response and account usage like ChatView
+        llm_response = stream.get_response(default_model=getattr(provider, 'model', None))
+        assistant_message = ConversationService.append_message(
+            conversation, **ChatService.assistant_message_fields(llm_response, user_message)
+        )
+        
+        if user_message.sequence == 1 and not conversation.title:
+            conversation.generate_title()
+        
+        UsageService.record_usage(user, llm_response)
+        
+        cancelled = llm_response['finish_reason'] == 'cancelled'
+        if cancelled:
+            record_stream_cancelled(buffer, llm_response)
+        
+        buffer.finish({
+            'done': True,
+            'cancelled': cancelled,
+            'conversation_id': str(conversation.id),
+            'message_id': str(assistant_message.id),
+        })
+        
+    except Exception as e:
+        logger.error(f"Stream {buffer.stream_id} failed: {str(e)}")
+        buffer.finish({'error': str(e)})
+    
+    finally:
+        TokenQuota.settle(user.id, quota_charge, llm_response)
+        # This thread's own connection
+        connection.close()
+
+
+@method_decorator(ratelimit(**CHAT_RATE_LIMIT), name='post')
 class ChatStreamView(views.APIView):
     """
     Streaming chat endpoint for real-time responses
-    GET /chat/stream/
+    POST /chat/stream/
+    
+    Events carry IDs, a client that drops can resume with
+    GET /chat/stream/<stream_id>/ and a Last-Event-ID header
+    
+    A retry with the same Idempotency-Key replays the first request's
+    stream from its buffer (or from Last-Event-ID) instead of starting
+    another generation
     """
     permission_classes = [IsAuthenticated]
     
@@ -216,79 +528,196 @@ class ChatStreamView(views.APIView):
         serializer = ChatRequestSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
+        store_key, error_response = get_idempotency_key(request, 'chat_stream')
+        if error_response:
+            return error_response
+        
         message_content = serializer.validated_data['message']
         conversation_id = serializer.validated_data.get('conversation_id')
         
-        def event_stream():
-            try:
-                # Get/create conversation
-                if conversation_id:
-                    conversation = Conversation.objects.get(
-                        id=conversation_id, user=request.user
-                    )
-                else:
-                    conversation = Conversation.objects.create(user=request.user)
-                
-                # Save user message
-                user_message = ChatMessage.objects.create(
-                    conversation=conversation,
-                    role='user',
-                    content=message_content
-                )
-                
-                # Prepare messages
-                history = conversation.messages.order_by('created_at')[:50]
-                llm_messages = LLMService.format_conversation_for_llm(history)
-                llm_messages.append({'role': 'user', 'content': message_content})
-                
-                # Stream response
-                from apps.core.services.groq_provider import GroqProvider
-                provider = GroqProvider()
-                
-                full_response = ""
-                for chunk in provider.generate_streaming_response(llm_messages):
-                    full_response += chunk
-                    yield f"data: {json.dumps({'chunk': chunk})}\n\n"
-                
-                # Save complete response
-                assistant_message = ChatMessage.objects.create(
-                    conversation=conversation,
-                    role='assistant',
-                    content=full_response,
-                    model_used='llama-3.3-70b-versatile'
-                )
-                
-                yield f"data: {json.dumps({'done': True, 'message_id': str(assistant_message.id)})}\n\n"
-                
-            except Exception as e:
-                yield f"data: {json.dumps({'error': str(e)})}\n\n"
-        
-        return StreamingHttpResponse(
-            event_stream(),
-            content_type='text/event-stream',
-            headers={
-                'Cache-Control': 'no-cache',
-                'X-Accel-Buffering': 'no',
-            }
+        # Turn the stream away now if the queue is full, not in its first event
+        tier = AdmissionController.tier_for(request.user)
+        try:
+            AdmissionController.check(tier)
+        except AdmissionRejected as e:
+            return retry_later_response(e)
+        
+        charged, error_response = charge_token_quota(request.user, conversation_id, message_content)
+        if error_response:
+            return error_response
+        
+        buffer = StreamBuffer.create(request.user.id)
+        
+        if store_key:
+            fingerprint = IdempotencyStore.fingerprint(serializer.validated_data)
+            record = IdempotencyStore.begin_stream(store_key, fingerprint, buffer.stream_id)
+            if record is not None:
+                # A replay generates nothing
+                TokenQuota.settle(request.user.id, charged)
+                return self.replay(request, record, fingerprint)
+            IdempotencyStore.count('chat_stream', 'new')
+        
+        threading.Thread(
+            target=run_stream_generation,
+            args=(buffer, request.user, message_content, conversation_id, tier, charged),
+            name=f'chat-stream-{buffer.stream_id}',
+            daemon=True
+        ).start()
+        
+        return sse_response(buffer.iter_sse(), buffer.stream_id)
+    
+    def replay(self, request, record, fingerprint):
+        error_response = idempotency_error(record, fingerprint, 'chat_stream')
+        if error_response:
+            return error_response
+        
+        buffer = StreamBuffer.get(record['stream_id'], request.user.id)
+        if buffer is None:
+            return Response({
+                'success': False,
+                'error': 'Stream not found or expired'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        event_stream_id, after = StreamBuffer.parse_event_id(request.headers.get('Last-Event-ID'))
+        if event_stream_id != buffer.stream_id:
+            after = 0
+        
+        IdempotencyStore.count('chat_stream', 'replayed')
+        response = sse_response(buffer.iter_sse(after), buffer.stream_id)
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
+
+class ChatStreamResumeView(views.APIView):
+    """
+    Resume a chat stream from the replay buffer
+    GET /chat/stream/<stream_id>/ with Last-Event-ID (header or ?last_event_id=)
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request, stream_id):
+        last_event_id = (
+            request.headers.get('Last-Event-ID') or
+            request.query_params.get('last_event_id')
         )
+        event_stream_id, after = StreamBuffer.parse_event_id(last_event_id)
+        if event_stream_id not in (None, stream_id):
+            return Response({
+                'success': False,
+                'error': 'Last-Event-ID belongs to another stream'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        buffer = StreamBuffer.get(stream_id, request.user.id)
+        if buffer is None:
+            return Response({
+                'success': False,
+                'error': 'Stream not found or expired'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        return sse_response(buffer.iter_sse(after), stream_id)
+    
+
+class ChatJobView(views.APIView):
+    """
+    Status of a chat job queued by POST /chat/ in async mode
+    GET /chat/jobs/<job_id>/
+    
+    Once status is 'succeeded', result holds what the synchronous
+    POST /chat/ would have returned
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request, job_id):
+        job = get_object_or_404(ChatJob, id=job_id, user=request.user)
+        return Response({
+            'success': True,
+            'data': ChatJobSerializer(job).data
+        }, status=status.HTTP_200_OK)
+
+
+class ChatJobEventsView(views.APIView):
+    """
+    Follow a chat job as server-sent events
+    GET /chat/jobs/<job_id>/events/ (resumable with Last-Event-ID)
     
+    Sends 'running' when a worker picks the job up, and a final event
+    with the job's status and result or error
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request, job_id):
+        job = get_object_or_404(ChatJob, id=job_id, user=request.user)
+        stream_id = str(job.id)
+        
+        last_event_id = (
+            request.headers.get('Last-Event-ID') or
+            request.query_params.get('last_event_id')
+        )
+        _, after = StreamBuffer.parse_event_id(last_event_id)
+        
+        def finished_event():
+            # The worker's final event may never reach this buffer, the row has the outcome too
+            job.refresh_from_db(fields=['status', 'result', 'error', 'finished_at'])
+            return ChatService.job_event(job) if job.is_finished else None
+        
+        buffer = StreamBuffer.get(stream_id, request.user.id)
+        if buffer is not None:
+            return sse_response(buffer.iter_sse(after, finished_event), stream_id)
+        
+        if job.is_finished:
+            # Events expired, the job row still has the outcome
+            return sse_response(iter([sse_event(ChatService.job_event(job))]), stream_id)
+        
+        return Response({
+            'success': False,
+            'error': 'Job events not available, poll the job status instead'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+
 class ConversationSearchView(generics.ListAPIView):
-    """Search conversations by title or content"""
-    serializer_class = ConversationSerializer
+    """
+    Full-text search over the user's conversations
+    GET /chat/search/?q=<query>
+    
+    Results are ranked by relevance with a highlighted snippet of the
+    best matching message (or the title) per conversation
+    """
+    serializer_class = ConversationSearchSerializer
     permission_classes = [IsAuthenticated]
     
-    def get_queryset(self):
-        query = self.request.query_params.get('q', '')
-        return Conversation.objects.filter(
-            user=self.request.user,
-            is_active=True
-        ).filter(
-            Q(title__icontains=query) |
-            Q(messages__content__icontains=query)
-        ).distinct()
+    def list(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '').strip()
+        hits = SearchService.search_conversations(request.user, query) if query else []
+        
+        # Only load the conversations for the requested page
+        page = self.paginate_queryset(hits)
+        conversations = Conversation.objects.in_bulk(
+            [hit['conversation_id'] for hit in page]
+        )
+        
+        results = []
+        for hit in page:
+            conversation = conversations.get(hit['conversation_id'])
+            if conversation is None:
+                continue
+            conversation.search_rank = hit['rank']
+            conversation.search_snippet = hit['snippet']
+            conversation.matched_message_id = hit['message_id']
+            results.append(conversation)
+        
+        serializer = self.get_serializer(results, many=True)
+        return self.get_paginated_response(serializer.data)
     
 class ConversationExportView(views.APIView):
-    """Export conversation as JSON/Markdown"""
+    """
+    Export a conversation, streamed as it is read from the database
+    GET /chat/conversations/<uuid>/export/?format=markdown|json|ndjson
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def perform_content_negotiation(self, request, force=False):
+        # ?format= selects the export format here, not a DRF renderer
+        return super().perform_content_negotiation(request, force=True)
     
     def get(self, request, id):
         conversation = get_object_or_404(
@@ -296,14 +725,346 @@ class ConversationExportView(views.APIView):
         )
         
         format_type = request.query_params.get('format', 'json')
+        if format_type not in ExportService.FORMATS:
+            return Response({
+                'success': False,
+                'error': f"Unsupported format, use one of: {', '.join(ExportService.FORMATS)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        return export_response(
+            ExportService.iter_conversation(conversation, format_type),
+            format_type,
+            f"conversation-{conversation.id}"
+        )
+
+
+class ConversationBulkExportView(ConversationExportView):
+    """
+    Export all of the user's conversations in one streamed archive
+    GET /chat/conversations/export/?format=ndjson|zip
+    """
+    
+    def get(self, request):
+        format_type = request.query_params.get('format', 'ndjson')
+        
+        if format_type == 'zip':
+            stream = ExportService.iter_bulk_zip(request.user)
+        elif format_type == 'ndjson':
+            stream = ExportService.iter_bulk_ndjson(request.user)
+        else:
+            return Response({
+                'success': False,
+                'error': f"Unsupported format, use one of: {', '.join(ExportService.BULK_FORMATS)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        return export_response(
+            stream,
+            format_type,
+            f"conversations-{timezone.now():%Y%m%d-%H%M%S}"
+        )
+
+
+def export_response(stream, format_type, filename):
+    return StreamingHttpResponse(
+        stream,
+        content_type=ExportService.CONTENT_TYPES[format_type],
+        headers={
+            'Content-Disposition': (
+                f'attachment; filename="{filename}.{ExportService.EXTENSIONS[format_type]}"'
+            ),
+            'X-Accel-Buffering': 'no',
+        }
+    )
+
+
+class AsyncAuthenticatedView(View):
+    """
+    Base for native async endpoints served under ASGI
+    DRF's APIView is sync-only, so JWT authentication is done here
+    and the handler runs on the event loop without holding a thread
+    """
+    
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # JWT-only endpoints, no session cookie to protect
+        return csrf_exempt(super().as_view(**initkwargs))
+    
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            auth = await sync_to_async(JWTAuthentication().authenticate)(request)
+        except APIException as e:
+            auth = None
+            logger.info(f"Async view authentication failed: {str(e)}")
+        
+        if auth is None:
+            return JsonResponse({
+                'success': False,
+                'error': 'Authentication credentials were not provided or are invalid'
+            }, status=status.HTTP_401_UNAUTHORIZED)
+        
+        request.user = auth[0]
+        return await super().dispatch(request, *args, **kwargs)
+    
+    def parse_chat_request(self, request):
+        """Validate the JSON body, returns (validated_data, error_response)"""
+        try:
+            payload = json.loads(request.body or b'{}')
+        except ValueError:
+            return None, JsonResponse({
+                'success': False,
+                'error': 'Invalid JSON body'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        serializer = ChatRequestSerializer(data=payload)
+        if not serializer.is_valid():
+            return None, JsonResponse({
+                'success': False,
+                'error': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        return serializer.validated_data, None
+    
+    async def check_rate_limit(self, request):
+        """429 response once the user is over CHAT_RATE_LIMIT, None otherwise"""
+        limited = await sync_to_async(is_ratelimited)(
+            request=request, increment=True, **CHAT_RATE_LIMIT
+        )
+        if limited:
+            return JsonResponse({
+                'success': False,
+                'error': 'Rate limit exceeded'
+            }, status=status.HTTP_429_TOO_MANY_REQUESTS)
+        return None
+    
+    async def get_or_create_conversation(self, user, conversation_id):
+        if conversation_id:
+            return await Conversation.objects.aget(id=conversation_id, user=user)
+        return await Conversation.objects.acreate(user=user)
+
+
+class AsyncChatView(AsyncAuthenticatedView):
+    """
+    Async chat endpoint - same contract as ChatView
+    POST /chat/async/
+    
+    The LLM round-trip is awaited on the event loop, so one ASGI
+    process can keep many completions in flight at once
+    """
+    
+    @RequestTimings.timed('chat_async')
+    async def post(self, request):
+        data, error_response = self.parse_chat_request(request)
+        if error_response:
+            return error_response
+        
+        error_response = await self.check_rate_limit(request)
+        if error_response:
+            return error_response
+        
+        user = request.user
+        message_content = data['message']
         
-        if format_type == 'markdown':
-            content = f"# {conversation.title}\n\n"
-            for msg in conversation.messages.all():
-                content += f"**{msg.role.title()}:** {msg.content}\n\n"
+        charged, error_response = await sync_to_async(charge_token_quota)(
+            user, data.get('conversation_id'), message_content
+        )
+        if error_response:
+            return error_response
+        
+        llm_response = None
+        try:
+            conversation = await self.get_or_create_conversation(
+                user, data.get('conversation_id')
+            )
+            
+            user_message = await sync_to_async(ConversationService.append_message)(
+                conversation, role='user', content=message_content
+            )
+            
+            llm_messages = await sync_to_async(ContextBuilder.build_messages)(
+                conversation, user_message
+            )
+            
+            llm_response = await LLMService.agenerate_chat_response(
+                messages=llm_messages, cache=data.get('cache'),
+                tier=AdmissionController.tier_for(user)
+            )
             
-            return HttpResponse(content, content_type='text/markdown')
+            assistant_message = await sync_to_async(ConversationService.append_message)(
+                conversation, **ChatService.assistant_message_fields(llm_response, user_message)
+            )
+            
+            if user_message.sequence == 1 and not conversation.title:
+                await sync_to_async(conversation.generate_title)()
+            
+            await sync_to_async(UsageService.record_usage)(user, llm_response)
+            
+            return JsonResponse({
+                'success': True,
+                'data': ChatService.response_data(
+                    conversation, user_message, assistant_message, llm_response
+                )
+            }, status=status.HTTP_200_OK)
+        
+        except Conversation.DoesNotExist:
+            return JsonResponse({
+                'success': False,
+                'error': 'Conversation not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        except AdmissionRejected as e:
+            return JsonResponse({
+                'success': False,
+                'error': str(e)
+            }, status=e.status_code, headers={'Retry-After': str(e.retry_after)})
+        
+        except Exception as e:
+            logger.error(f"Async chat error for user {user.username}: {str(e)}")
+            return JsonResponse({
+                'success': False,
+                'error': f'Failed to generate response: {str(e)}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        finally:
+            await sync_to_async(TokenQuota.settle)(user.id, charged, llm_response)
+
+
+_background_streams = set()
+
+
+@RequestTimings.timed('chat_stream')
+async def arun_stream_generation(buffer, user, message_content, conversation_id, tier='default',
+                                 quota_charge=0):
+    """Async variant of run_stream_generation, runs as a task on the event loop"""
+    append = sync_to_async(buffer.append)
+    finish = sync_to_async(buffer.finish)
+    
+    llm_response = None
+    try:
+        if conversation_id:
+            conversation = await Conversation.objects.aget(id=conversation_id, user=user)
+        else:
+            conversation = await Conversation.objects.acreate(user=user)
+        
+        user_message = await sync_to_async(ConversationService.append_message)(
+            conversation, role='user', content=message_content
+        )
+        
+        llm_messages = await sync_to_async(ContextBuilder.build_messages)(
+            conversation, user_message
+        )
+        
+        provider = LLMService.get_provider()
+        stream = new_stream_accumulator(llm_messages)
+        
+        with RequestTimings.llm_call():
+            async with AdmissionController.aslot(tier):
+                upstream = provider.agenerate_streaming_response(llm_messages)
+                try:
+                    async for item in upstream:
+                        text = stream.feed(item)
+                        if text:
+                            await append({'chunk': text})
+                        if await buffer.ais_abandoned():
+                            stream.cancel()
+                            break
+                finally:
+                    await upstream.aclose()
+        
+        text = stream.flush()
+        if text:
+            await append({'chunk': text})
+        
+        llm_response = stream.get_response(default_model=getattr(provider, 'model', None))
+        assistant_message = await sync_to_async(ConversationService.append_message)(
+            conversation, **ChatService.assistant_message_fields(llm_response, user_message)
+        )
+        
+        if user_message.sequence == 1 and not conversation.title:
+            await sync_to_async(conversation.generate_title)()
+        
+        await sync_to_async(UsageService.record_usage)(user, llm_response)
+        
+        cancelled = llm_response['finish_reason'] == 'cancelled'
+        if cancelled:
+            record_stream_cancelled(buffer, llm_response)
+        
+        await finish({
+            'done': True,
+            'cancelled': cancelled,
+            'conversation_id': str(conversation.id),
+            'message_id': str(assistant_message.id),
+        })
+    
+    except Exception as e:
+        logger.error(f"Stream {buffer.stream_id} failed: {str(e)}")
+        await finish({'error': str(e)})
+    
+    finally:
+        await sync_to_async(TokenQuota.settle)(user.id, quota_charge, llm_response)
+
+
+class AsyncChatStreamView(AsyncAuthenticatedView):
+    """
+    Async streaming chat endpoint
+    POST /chat/async/stream/
+    
+    Under ASGI the event stream is an async generator, so an open
+    stream does not pin a worker thread. Resumable like ChatStreamView
+    """
+    
+    async def post(self, request):
+        data, error_response = self.parse_chat_request(request)
+        if error_response:
+            return error_response
+        
+        error_response = await self.check_rate_limit(request)
+        if error_response:
+            return error_response
+        
+        tier = AdmissionController.tier_for(request.user)
+        try:
+            AdmissionController.check(tier)
+        except AdmissionRejected as e:
+            return retry_later_response(e)
+        
+        charged, error_response = await sync_to_async(charge_token_quota)(
+            request.user, data.get('conversation_id'), data['message']
+        )
+        if error_response:
+            return error_response
+        
+        buffer = await sync_to_async(StreamBuffer.create)(request.user.id)
+        
+        # Generation outlives this response, keep a reference until it's done
+        task = asyncio.create_task(arun_stream_generation(
+            buffer, request.user, data['message'], data.get('conversation_id'), tier, charged
+        ))
+        _background_streams.add(task)
+        task.add_done_callback(_background_streams.discard)
+        
+        return sse_response(buffer.aiter_sse(), buffer.stream_id)
+
+
+class AsyncChatStreamResumeView(AsyncAuthenticatedView):
+    """
+    Async variant of ChatStreamResumeView
+    GET /chat/async/stream/<stream_id>/
+    """
+    
+    async def get(self, request, stream_id):
+        last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+        event_stream_id, after = StreamBuffer.parse_event_id(last_event_id)
+        if event_stream_id not in (None, stream_id):
+            return JsonResponse({
+                'success': False,
+                'error': 'Last-Event-ID belongs to another stream'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        buffer = await sync_to_async(StreamBuffer.get)(stream_id, request.user.id)
+        if buffer is None:
+            return JsonResponse({
+                'success': False,
+                'error': 'Stream not found or expired'
+            }, status=status.HTTP_404_NOT_FOUND)
         
-        # JSON export
-        data = ConversationDetailSerializer(conversation).data
-        return Response(data)
\ No newline at end of file
+        return sse_response(buffer.aiter_sse(after), stream_id)
\ No newline at end of file
@@ -40,6 +40,38 @@ class LLMServiceException(Exception):
     pass
 
 
+class LLMRequestRejected(RuntimeError):
+    """
+    The provider refused the request itself (a 4xx such as 400, 401 or 413)
+    
+    Caused by the request, not the provider's health, so it is neither
+    retried nor failed over and doesn't count against circuit breakers.
+    """
+    
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
 class ConversationNotFoundException(Exception):
     """Raised when conversation is not found"""
-    pass
\ No newline at end of file
+    pass
+
+
+class AdmissionRejected(Exception):
+    """LLM call not admitted, the queue is full (429) or the wait timed out (503)"""
+    
+    def __init__(self, message, status_code, retry_after):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class QuotaExceeded(Exception):
+    """Token quota can't cover the request's estimated tokens (429)"""
+    
+    status_code = 429
+    
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
\ No newline at end of file
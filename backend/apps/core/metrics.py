@@ -0,0 +1,124 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# Exposed at /metrics by django_prometheus alongside its request metrics
+
+LLM_SINGLE_FLIGHT_CALLS = Counter(
+    'talkflow_llm_single_flight_calls_total',
+    'LLM calls made by a single-flight leader on behalf of identical requests'
+)
+
+LLM_COALESCED_REQUESTS = Counter(
+    'talkflow_llm_coalesced_requests_total',
+    'LLM requests answered by an identical in-flight call instead of a new one',
+    ['scope']
+)
+
+LLM_RESPONSE_CACHE_REQUESTS = Counter(
+    'talkflow_llm_response_cache_requests_total',
+    'LLM response cache lookups by result',
+    ['result']
+)
+
+
+LLM_RETRIES = Counter(
+    'talkflow_llm_retries_total',
+    'LLM attempts retried after a transient error',
+    ['provider', 'reason']
+)
+
+LLM_HEDGED_REQUESTS = Counter(
+    'talkflow_llm_hedged_requests_total',
+    'LLM requests that fired a hedge attempt, by which attempt won '
+    '(skipped: no executor thread was free to hedge)',
+    ['winner']
+)
+
+
+LLM_STREAMS_CANCELLED = Counter(
+    'talkflow_llm_streams_cancelled_total',
+    'Streamed generations stopped because no client was reading them'
+)
+
+LLM_CANCELLED_TOKENS_SAVED = Counter(
+    'talkflow_llm_cancelled_tokens_saved_total',
+    'Completion tokens not generated thanks to stream cancellation '
+    '(upper bound: max_tokens minus tokens generated before cancelling)'
+)
+
+
+IDEMPOTENT_REQUESTS = Counter(
+    'talkflow_idempotent_requests_total',
+    'Chat requests sent with an Idempotency-Key, by outcome',
+    ['scope', 'result']
+)
+
+
+LLM_ADMISSION_IN_FLIGHT = Gauge(
+    'talkflow_llm_admission_in_flight',
+    'LLM calls holding an admission slot in this process'
+)
+
+LLM_ADMISSION_QUEUE_DEPTH = Gauge(
+    'talkflow_llm_admission_queue_depth',
+    'Requests waiting for an LLM admission slot in this process',
+    ['tier']
+)
+
+LLM_ADMISSION_WAIT_SECONDS = Histogram(
+    'talkflow_llm_admission_wait_seconds',
+    'Time admitted requests waited for an LLM slot',
+    ['tier'],
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+
+LLM_ADMISSION_REJECTED = Counter(
+    'talkflow_llm_admission_rejected_total',
+    'Requests turned away by LLM admission control',
+    ['tier', 'reason']
+)
+
+TOKEN_QUOTA_REJECTED = Counter(
+    'talkflow_token_quota_rejected_total',
+    'Chat requests rejected because the user\'s token bucket ran dry'
+)
+
+LLM_REQUEST_SECONDS = Histogram(
+    'talkflow_llm_request_seconds',
+    'LLM request latency, retries and hedges included (streams until the last token)',
+    ['provider', 'model', 'mode'],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+)
+
+LLM_TIME_TO_FIRST_TOKEN_SECONDS = Histogram(
+    'talkflow_llm_time_to_first_token_seconds',
+    'Time from sending a streamed LLM request to its first text',
+    ['provider', 'model'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30)
+)
+
+LLM_TOKENS_PER_SECOND = Histogram(
+    'talkflow_llm_tokens_per_second',
+    'Completion tokens generated per second (from the first token on for streams)',
+    ['provider', 'model', 'mode'],
+    buckets=(5, 10, 25, 50, 100, 200, 400, 800, 1600)
+)
+
+LLM_TOKENS = Histogram(
+    'talkflow_llm_tokens',
+    'Prompt and completion tokens per LLM request',
+    ['provider', 'model', 'kind'],
+    buckets=(16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+)
+
+LLM_ERRORS = Counter(
+    'talkflow_llm_errors_total',
+    'LLM requests that failed after retries, by exception class',
+    ['provider', 'model', 'error']
+)
+
+CHAT_REQUEST_SECONDS = Histogram(
+    'talkflow_chat_request_seconds',
+    'Time of a chat request spent in the database, on LLM calls and elsewhere',
+    ['endpoint', 'component'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
\ No newline at end of file
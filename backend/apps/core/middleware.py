@@ -0,0 +1,139 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils import timezone
+import json
+import logging
+import os
+import random
+import time
+
+from apps.core.services.request_timing import RequestTimings
+
+# Rotating slow request log, see LOGGING
+slow_request_logger = logging.getLogger('talkflow.profiling')
+
+
+class ProfilingMiddleware:
+    """
+    Opt-in per-request profile, enabled with PROFILING['ENABLED']
+    
+    Profiled requests get a Server-Timing header with their SQL time
+    and query count, view time, serialization time (rendering of DRF
+    responses), LLM time and total. The view time includes its queries
+    and LLM calls. Requests slower than SLOW_REQUEST_MS are written to
+    the rotating slow request log, one JSON object per line, with their
+    queries tallied by SQL.
+    
+    Only SAMPLE_RATE of requests are profiled, the rest pass through
+    untouched. A low rate with HEADERS off is meant for production. SQL
+    is logged without its parameters.
+    """
+    
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.config = settings.PROFILING
+        if not self.config['ENABLED']:
+            raise MiddlewareNotUsed
+        
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        
+        log_dir = os.path.dirname(self.config['LOG_FILE'])
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+    
+    def sampled(self) -> bool:
+        rate = self.config['SAMPLE_RATE']
+        return rate >= 1 or random.random() < rate
+    
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        
+        if not self.sampled():
+            return self.get_response(request)
+        
+        request._profile = {}
+        with RequestTimings.track(capture_queries=True) as timings:
+            response = self.get_response(request)
+        self.finish(request, response, timings)
+        return response
+    
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        
+        request._profile = {}
+        with RequestTimings.track(capture_queries=True) as timings:
+            response = await self.get_response(request)
+        self.finish(request, response, timings)
+        return response
+    
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, '_profile'):
+            request._profile['view_started'] = time.monotonic()
+        return None
+    
+    def process_template_response(self, request, response):
+        """Runs right before DRF responses are rendered"""
+        profile = getattr(request, '_profile', None)
+        if profile is not None:
+            profile['render_started'] = time.monotonic()
+            
+            def rendered(response):
+                profile['render_finished'] = time.monotonic()
+            response.add_post_render_callback(rendered)
+        return response
+    
+    def stages(self, request, timings: RequestTimings) -> dict:
+        """Milliseconds per stage of a finished request"""
+        now = time.monotonic()
+        profile = request._profile
+        view_started = profile.get('view_started', timings.started)
+        render_started = profile.get('render_started')
+        render_finished = profile.get('render_finished', now)
+        
+        stages = {
+            'db': timings.db * 1000,
+            'view': ((render_started or now) - view_started) * 1000,
+            'serialize': (render_finished - render_started) * 1000 if render_started else 0.0,
+            'llm': timings.llm * 1000,
+            'total': (now - timings.started) * 1000,
+        }
+        return {name: round(ms, 1) for name, ms in stages.items()}
+    
+    def finish(self, request, response, timings: RequestTimings) -> None:
+        stages = self.stages(request, timings)
+        
+        if self.config['HEADERS']:
+            response['Server-Timing'] = ', '.join(
+                f'{name};dur={ms}' + (f';desc="{timings.queries} queries"' if name == 'db' else '')
+                for name, ms in stages.items()
+                if name != 'llm' or ms
+            )
+        
+        if stages['total'] >= self.config['SLOW_REQUEST_MS']:
+            self.log_slow_request(request, response, timings, stages)
+    
+    def log_slow_request(self, request, response, timings: RequestTimings, stages: dict) -> None:
+        # Most expensive first, repeated queries (N+1) add up near the top
+        queries = sorted(timings.query_stats.items(), key=lambda item: item[1][1], reverse=True)
+        slow_request_logger.warning(json.dumps({
+            'time': timezone.now().isoformat(),
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'user_id': getattr(getattr(request, 'user', None), 'pk', None),
+            'stages_ms': stages,
+            'queries': timings.queries,
+            'distinct_queries': len(queries),
+            'query_breakdown': [
+                {'sql': sql, 'count': count, 'ms': round(seconds * 1000, 1)}
+                for sql, (count, seconds) in queries[:self.config['MAX_LOGGED_QUERIES']]
+            ],
+        }))
\ No newline at end of file
@@ -0,0 +1,365 @@
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, List, Optional
+from django.conf import settings
+from django.core.cache import cache
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+
+from apps.core.exceptions import AdmissionRejected
+from apps.core.metrics import (
+    LLM_ADMISSION_IN_FLIGHT,
+    LLM_ADMISSION_QUEUE_DEPTH,
+    LLM_ADMISSION_REJECTED,
+    LLM_ADMISSION_WAIT_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class _Waiter:
+    """A queued request, woken from whichever thread releases a slot"""
+    
+    def __init__(self, tier: str, rank: int, seq: int, loop=None):
+        self.tier = tier
+        self.rank = rank
+        self.seq = seq
+        self.granted = False
+        self.evicted = False
+        if loop is None:
+            self.event = threading.Event()
+            self.future = None
+        else:
+            self.event = None
+            self.loop = loop
+            self.future = loop.create_future()
+    
+    def __lt__(self, other):
+        return (self.rank, self.seq) < (other.rank, other.seq)
+    
+    def wake(self):
+        if self.future is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+    
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class AdmissionController:
+    """
+    Bounds the LLM calls in flight, per process and across the cluster
+    
+    Up to MAX_CONCURRENT calls run per process. Beyond that, requests
+    wait in a queue of at most MAX_QUEUE, served by tier (TIERS, highest
+    priority first) and in arrival order within a tier. When the queue
+    is full, a request that outranks the lowest queued one takes its
+    place (that one is shed with 503), otherwise it's rejected with 429
+    right away. A request that waits longer than QUEUE_TIMEOUT gets 503.
+    Both carry a Retry-After estimated from the queue and recent call
+    durations.
+    
+    With GLOBAL_MAX_CONCURRENT set, a process also needs one of that
+    many lease slots in the shared cache (Redis) before calling, so the
+    whole cluster stays under the upstream's concurrency quota. Leases
+    expire after LEASE seconds if a worker dies holding one.
+    """
+    
+    KEY_PREFIX = 'llm:admission'
+    
+    DEFAULT_CONFIG = {
+        'ENABLED': True,
+        'MAX_CONCURRENT': 16,
+        'MAX_QUEUE': 64,
+        'QUEUE_TIMEOUT': 10,
+        'GLOBAL_MAX_CONCURRENT': 0,
+        'LEASE': 120,
+        'POLL_INTERVAL': 0.05,
+        'TIERS': ['priority', 'default', 'background'],
+    }
+    
+    _lock = threading.Lock()
+    _active = 0
+    _queue: List[_Waiter] = []
+    _seq = itertools.count()
+    # Moving average of how long a slot is held, for Retry-After
+    _avg_hold = 1.0
+    
+    @classmethod
+    def get_config(cls) -> Dict:
+        config = {**cls.DEFAULT_CONFIG}
+        config.update(settings.LLM_CONFIG.get('ADMISSION', {}))
+        return config
+    
+    @classmethod
+    def tier_for(cls, user) -> str:
+        """Staff get the priority tier, everyone else the default one"""
+        if user is not None and user.is_staff:
+            return 'priority'
+        return 'default'
+    
+    @classmethod
+    def retry_after(cls, config: Dict) -> int:
+        """Seconds until the queue ahead has likely drained"""
+        waiting = len(cls._queue) + 1
+        return max(1, math.ceil(waiting * cls._avg_hold / config['MAX_CONCURRENT']))
+    
+    @classmethod
+    def _rank(cls, tier: str, config: Dict) -> int:
+        tiers = config['TIERS']
+        return tiers.index(tier) if tier in tiers else len(tiers)
+    
+    @classmethod
+    def _reject(cls, tier: str, reason: str, status_code: int, config: Dict) -> AdmissionRejected:
+        LLM_ADMISSION_REJECTED.labels(tier=tier, reason=reason).inc()
+        messages = {
+            'queue_full': 'Too many requests waiting for the language model, try again shortly',
+            'evicted': 'Request was shed in favor of higher priority traffic, try again shortly',
+            'timeout': 'The language model is busy, try again shortly',
+        }
+        return AdmissionRejected(messages[reason], status_code, cls.retry_after(config))
+    
+    @classmethod
+    def _update_depth(cls) -> None:
+        """Must hold _lock"""
+        counts = {tier: 0 for tier in cls.get_config()['TIERS']}
+        for waiter in cls._queue:
+            counts[waiter.tier] = counts.get(waiter.tier, 0) + 1
+        for tier, count in counts.items():
+            LLM_ADMISSION_QUEUE_DEPTH.labels(tier=tier).set(count)
+    
+    @classmethod
+    def check(cls, tier: str) -> None:
+        """Fail fast the way acquire would on a full queue, without queueing"""
+        config = cls.get_config()
+        if not config['ENABLED']:
+            return
+        
+        rank = cls._rank(tier, config)
+        with cls._lock:
+            if cls._active < config['MAX_CONCURRENT'] or len(cls._queue) < config['MAX_QUEUE']:
+                return
+            if any(waiter.rank > rank for waiter in cls._queue):
+                return
+            raise cls._reject(tier, 'queue_full', 429, config)
+    
+    @classmethod
+    def _enqueue(cls, tier: str, config: Dict, loop=None) -> Optional[_Waiter]:
+        """Take a local slot right away (None) or queue a waiter for one"""
+        rank = cls._rank(tier, config)
+        with cls._lock:
+            if cls._active < config['MAX_CONCURRENT'] and not cls._queue:
+                cls._active += 1
+                LLM_ADMISSION_IN_FLIGHT.set(cls._active)
+                return None
+            
+            if len(cls._queue) >= config['MAX_QUEUE']:
+                lowest = max(cls._queue) if cls._queue else None
+                if lowest is None or lowest.rank <= rank:
+                    raise cls._reject(tier, 'queue_full', 429, config)
+                # Shed the newest request of the lowest tier to make room
+                cls._queue.remove(lowest)
+                heapq.heapify(cls._queue)
+                lowest.evicted = True
+                lowest.wake()
+            
+            waiter = _Waiter(tier, rank, next(cls._seq), loop)
+            heapq.heappush(cls._queue, waiter)
+            cls._update_depth()
+            return waiter
+    
+    @classmethod
+    def _abandon(cls, waiter: _Waiter, config: Dict) -> str:
+        """Reason a waiter didn't get its slot, giving back one granted meanwhile"""
+        with cls._lock:
+            if waiter.evicted:
+                return 'evicted'
+            if waiter.granted:
+                cls._release_local(0.0)
+            else:
+                cls._queue.remove(waiter)
+                heapq.heapify(cls._queue)
+                cls._update_depth()
+            return 'timeout'
+    
+    @classmethod
+    def _release_local(cls, held: float) -> None:
+        """Hand the slot to the next waiter or free it, must hold _lock"""
+        if held:
+            cls._avg_hold = 0.9 * cls._avg_hold + 0.1 * held
+        
+        if cls._queue:
+            waiter = heapq.heappop(cls._queue)
+            waiter.granted = True
+            waiter.wake()
+            cls._update_depth()
+        else:
+            cls._active -= 1
+            LLM_ADMISSION_IN_FLIGHT.set(cls._active)
+    
+    @classmethod
+    def _release(cls, held: float, lease: Optional[str]) -> None:
+        try:
+            if lease:
+                cls._release_lease(lease)
+        finally:
+            # A lease that can't be freed expires, the local slot must not leak
+            with cls._lock:
+                cls._release_local(held)
+    
+    # Cluster-wide lease slots
+    
+    @classmethod
+    def _slot_keys(cls, config: Dict) -> List[str]:
+        return [f"{cls.KEY_PREFIX}:slot:{i}" for i in range(config['GLOBAL_MAX_CONCURRENT'])]
+    
+    @classmethod
+    def _try_lease(cls, config: Dict, token: str) -> Optional[str]:
+        keys = cls._slot_keys(config)
+        taken = cache.get_many(keys)
+        free = [key for key in keys if key not in taken]
+        random.shuffle(free)
+        for key in free:
+            if cache.add(key, token, timeout=config['LEASE']):
+                return key
+        return None
+    
+    @classmethod
+    async def _atry_lease(cls, config: Dict, token: str) -> Optional[str]:
+        keys = cls._slot_keys(config)
+        taken = await cache.aget_many(keys)
+        free = [key for key in keys if key not in taken]
+        random.shuffle(free)
+        for key in free:
+            if await cache.aadd(key, token, timeout=config['LEASE']):
+                return key
+        return None
+    
+    @classmethod
+    def _release_lease(cls, lease: str) -> None:
+        key, _, token = lease.rpartition('|')
+        # Don't free a slot that expired and was leased to someone else
+        if cache.get(key) == token:
+            cache.delete(key)
+    
+    @classmethod
+    async def _arelease_lease(cls, lease: str) -> None:
+        key, _, token = lease.rpartition('|')
+        if await cache.aget(key) == token:
+            await cache.adelete(key)
+    
+    @classmethod
+    def _acquire(cls, tier: str, config: Dict) -> Optional[str]:
+        """Wait for a local slot, then a cluster lease, returns the lease"""
+        started = time.monotonic()
+        deadline = started + config['QUEUE_TIMEOUT']
+        
+        waiter = cls._enqueue(tier, config)
+        if waiter is not None:
+            waiter.event.wait(config['QUEUE_TIMEOUT'])
+            if not waiter.granted or waiter.evicted:
+                reason = cls._abandon(waiter, config)
+                raise cls._reject(tier, reason, 503, config)
+        
+        lease = None
+        if config['GLOBAL_MAX_CONCURRENT']:
+            token = uuid.uuid4().hex
+            try:
+                while True:
+                    key = cls._try_lease(config, token)
+                    if key:
+                        lease = f"{key}|{token}"
+                        break
+                    if time.monotonic() > deadline:
+                        raise cls._reject(tier, 'timeout', 503, config)
+                    time.sleep(config['POLL_INTERVAL'])
+            except BaseException:
+                # Timed out, or the cache failed: the local slot goes back either way
+                with cls._lock:
+                    cls._release_local(0.0)
+                raise
+        
+        LLM_ADMISSION_WAIT_SECONDS.labels(tier=tier).observe(time.monotonic() - started)
+        return lease
+    
+    @classmethod
+    async def _aacquire(cls, tier: str, config: Dict) -> Optional[str]:
+        started = time.monotonic()
+        deadline = started + config['QUEUE_TIMEOUT']
+        
+        waiter = cls._enqueue(tier, config, loop=asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), config['QUEUE_TIMEOUT'])
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                cls._abandon(waiter, config)
+                raise
+            if not waiter.granted or waiter.evicted:
+                reason = cls._abandon(waiter, config)
+                raise cls._reject(tier, reason, 503, config)
+        
+        lease = None
+        if config['GLOBAL_MAX_CONCURRENT']:
+            token = uuid.uuid4().hex
+            try:
+                while True:
+                    key = await cls._atry_lease(config, token)
+                    if key:
+                        lease = f"{key}|{token}"
+                        break
+                    if time.monotonic() > deadline:
+                        raise cls._reject(tier, 'timeout', 503, config)
+                    await asyncio.sleep(config['POLL_INTERVAL'])
+            except BaseException:
+                with cls._lock:
+                    cls._release_local(0.0)
+                raise
+        
+        LLM_ADMISSION_WAIT_SECONDS.labels(tier=tier).observe(time.monotonic() - started)
+        return lease
+    
+    @classmethod
+    @contextmanager
+    def slot(cls, tier: str = 'default'):
+        """Hold an admission slot for one LLM call (or stream)"""
+        config = cls.get_config()
+        if not config['ENABLED']:
+            yield
+            return
+        
+        lease = cls._acquire(tier, config)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            cls._release(time.monotonic() - started, lease)
+    
+    @classmethod
+    @asynccontextmanager
+    async def aslot(cls, tier: str = 'default'):
+        """Async variant of slot, waits without holding a thread"""
+        config = cls.get_config()
+        if not config['ENABLED']:
+            yield
+            return
+        
+        lease = await cls._aacquire(tier, config)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            try:
+                if lease:
+                    await cls._arelease_lease(lease)
+            finally:
+                cls._release(time.monotonic() - started, None)
\ No newline at end of file
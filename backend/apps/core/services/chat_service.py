@@ -0,0 +1,127 @@
+from typing import Dict, Optional, Tuple
+from django.utils import timezone
+
+from apps.chat.models import Conversation, ChatMessage, ChatJob
+from apps.chat.serializers import ChatMessageSerializer
+from .admission import AdmissionController
+from .context_builder import ContextBuilder
+from .conversation_service import ConversationService
+from .llm_service import LLMService
+from .stream_buffer import StreamBuffer
+from .token_quota import TokenQuota
+from .usage_service import UsageService
+
+
+class ChatService:
+    """
+    Chat turns and chat jobs, shared by the chat views and the Celery worker
+    """
+    
+    @classmethod
+    def generate_reply(
+        cls,
+        user,
+        conversation: Conversation,
+        user_message: ChatMessage,
+        cache: Optional[bool] = None,
+        tier: Optional[str] = None
+    ) -> Tuple[ChatMessage, Dict]:
+        """
+        Stages 2 and 3 of a chat turn, shared by ChatView and chat jobs
+        
+        The LLM is called with no transaction open, then the reply is saved
+        in a short one of its own.
+        
+        Returns:
+            (assistant_message, llm_response)
+        """
+        # Prepare messages for LLM: most recent history that fits the token budget
+        llm_messages = ContextBuilder.build_messages(conversation, user_message)
+        
+        # Call LLM service (stage 2, no transaction open)
+        llm_response = LLMService.generate_chat_response(
+            messages=llm_messages, cache=cache, tier=tier or AdmissionController.tier_for(user)
+        )
+        
+        # Save assistant response (stage 3)
+        assistant_message = ConversationService.append_message(
+            conversation, **cls.assistant_message_fields(llm_response, user_message)
+        )
+        
+        # Generate title on the first turn
+        if user_message.sequence == 1 and not conversation.title:
+            conversation.generate_title()
+        
+        # Record usage (applied to UserUsageStats by flush_usage_deltas)
+        UsageService.record_usage(user, llm_response)
+        
+        return assistant_message, llm_response
+    
+    @staticmethod
+    def response_data(conversation: Conversation, user_message: ChatMessage,
+                      assistant_message: ChatMessage, llm_response: Dict) -> Dict:
+        """Response payload shared by the sync and async chat endpoints"""
+        return {
+            'conversation_id': str(conversation.id),
+            'user_message': ChatMessageSerializer(user_message).data,
+            'assistant_message': ChatMessageSerializer(assistant_message).data,
+            'usage': {
+                'prompt_tokens': llm_response.get('prompt_tokens', 0),
+                'completion_tokens': llm_response.get('completion_tokens', 0),
+                'total_tokens': llm_response.get('tokens_used', 0),
+            }
+        }
+    
+    @staticmethod
+    def assistant_message_fields(llm_response: Dict, user_message: ChatMessage) -> Dict:
+        """ChatMessage fields for an assistant reply built from an LLM response"""
+        return {
+            'role': 'assistant',
+            'content': llm_response['content'],
+            'tokens_used': llm_response.get('tokens_used', 0),
+            'model_used': llm_response.get('model', 'unknown'),
+            'metadata': {
+                'prompt_tokens': llm_response.get('prompt_tokens', 0),
+                'completion_tokens': llm_response.get('completion_tokens', 0),
+                'finish_reason': llm_response.get('finish_reason', 'unknown'),
+                'latency_ms': llm_response.get('latency_ms'),
+                'cached': llm_response.get('cached', False),
+                'coalesced': llm_response.get('coalesced', False),
+                'attempts': llm_response.get('attempts', 1),
+                'in_reply_to': user_message.sequence,
+            }
+        }
+    
+    @staticmethod
+    def job_event(job: ChatJob) -> Dict:
+        """Final event of a chat job's event stream"""
+        return {
+            'done': True,
+            'job_id': str(job.id),
+            'status': job.status,
+            'data': job.result,
+            'error': job.error or None,
+        }
+    
+    @classmethod
+    def fail_job(cls, job_id, error: str, quota_charge: int = 0) -> Optional[ChatJob]:
+        """
+        Fail a chat job that will never run: one that couldn't be queued,
+        or that its worker couldn't load
+        
+        Works from the id alone. Refunds the quota charged when the job
+        was queued and ends the job's event stream.
+        """
+        ChatJob.objects.filter(id=job_id).update(
+            status=ChatJob.FAILED, error=error, finished_at=timezone.now()
+        )
+        job = ChatJob.objects.filter(id=job_id).first()
+        if job is None:
+            return None
+        
+        TokenQuota.settle(job.user_id, quota_charge)
+        
+        buffer = StreamBuffer.get(str(job.id), job.user_id)
+        if buffer is not None:
+            buffer.finish(cls.job_event(job))
+        return job
\ No newline at end of file
@@ -0,0 +1,118 @@
+from typing import List, Dict, Optional
+from django.conf import settings
+
+from apps.chat.models import Conversation, ChatMessage
+from .prompt_cache import PromptCache
+
+
+class ContextBuilder:
+    """
+    Builds the prompt for a chat turn from the most recent messages
+    that fit the configured token budget
+    
+    Token counts are estimated once when a message is written and
+    stored on ChatMessage.token_count, so selecting the window only
+    reads integers and never re-tokenizes history. Messages already
+    folded into the conversation's rolling summary are replaced by it.
+    
+    The history window comes from PromptCache when the conversation has
+    a current entry, so active conversations are not re-read each turn.
+    """
+    
+    # Rough chars-per-token ratio for English text on Llama-family tokenizers
+    CHARS_PER_TOKEN = 4
+    # Role/formatting tokens the chat template adds to every message
+    MESSAGE_OVERHEAD = 4
+    # Introduces the rolling summary, see SummaryService
+    SUMMARY_PREFIX = 'Summary of the earlier conversation:\n'
+    
+    @classmethod
+    def estimate_tokens(cls, content: str) -> int:
+        """Cheap token estimate for a single message"""
+        return -(-len(content or '') // cls.CHARS_PER_TOKEN) + cls.MESSAGE_OVERHEAD
+    
+    @classmethod
+    def get_prompt_budget(cls, max_tokens: Optional[int] = None) -> int:
+        """Context window tokens left for the prompt after reserving the completion"""
+        if max_tokens is None:
+            max_tokens = settings.LLM_CONFIG.get('MAX_TOKENS', 2048)
+        
+        return settings.LLM_CONFIG.get('CONTEXT_TOKEN_BUDGET', 8192) - max_tokens
+    
+    @classmethod
+    def build_messages(
+        cls,
+        conversation: Conversation,
+        user_message: ChatMessage,
+        max_tokens: Optional[int] = None
+    ) -> List[Dict[str, str]]:
+        """
+        LLM-ready messages for the turn that ends with user_message
+        
+        Walks history newest-first and stops at the budget. History
+        starts after the summary, if the conversation has one.
+        """
+        prompt_budget = cls.get_prompt_budget(max_tokens)
+        budget = prompt_budget - user_message.token_count
+        
+        messages = []
+        if conversation.context_summary:
+            messages.append({
+                'role': 'system',
+                'content': cls.SUMMARY_PREFIX + conversation.context_summary,
+            })
+            budget -= conversation.context_summary_tokens
+        
+        through = conversation.context_summary_through
+        entry = PromptCache.get(conversation.pk)
+        if not PromptCache.covers(entry, user_message.sequence, prompt_budget):
+            entry = cls.load_history(conversation, prompt_budget)
+        
+        rows = [row for row in entry['rows'] if through < row[0] < user_message.sequence]
+        
+        history = []
+        for row in reversed(rows[-settings.MAX_CHAT_HISTORY:]):
+            if row[3] > budget:
+                break
+            budget -= row[3]
+            history.append(row)
+        
+        messages.extend({'role': role, 'content': content} for _, role, content, _ in reversed(history))
+        messages.append({'role': user_message.role, 'content': user_message.content})
+        return messages
+    
+    @classmethod
+    def load_history(cls, conversation: Conversation, prompt_budget: int) -> Dict:
+        """
+        Newest history that fits prompt_budget, read from the database
+        and cached for the next turns
+        
+        Walks newest-first over (sequence, token_count) only, then loads
+        content for the selected window.
+        """
+        through = conversation.context_summary_through
+        recent = conversation.messages.filter(
+            sequence__gt=through
+        ).order_by('-sequence').values_list(
+            'sequence', 'token_count'
+        )[:settings.MAX_CHAT_HISTORY + 1]
+        
+        last_sequence = through
+        cutoff = None
+        budget = prompt_budget
+        for sequence, token_count in recent:
+            last_sequence = max(last_sequence, sequence)
+            if token_count > budget:
+                break
+            budget -= token_count
+            cutoff = sequence
+        
+        rows = []
+        if cutoff is not None:
+            rows = conversation.messages.filter(
+                sequence__gte=cutoff
+            ).order_by('sequence').values_list('sequence', 'role', 'content', 'token_count')
+        
+        return PromptCache.set(
+            conversation.pk, list(rows), last_sequence, prompt_budget, summary_through=through
+        )
\ No newline at end of file
@@ -0,0 +1,109 @@
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from apps.chat.models import Conversation, ChatMessage
+from .context_builder import ContextBuilder
+from .prompt_cache import PromptCache
+from .summary_service import SummaryService
+
+
+class ConversationService:
+    """
+    Persistence for the staged chat pipeline
+    
+    Each write runs in its own short transaction so no transaction or
+    row lock is held while waiting on the LLM. Ordering within a
+    conversation comes from a sequence number allocated at write time
+    instead of a lock held across the whole request.
+    """
+    
+    @classmethod
+    def append_message(
+        cls,
+        conversation: Conversation,
+        role: str,
+        content: str,
+        **fields
+    ) -> ChatMessage:
+        """
+        Persist a message with the next sequence number of its conversation
+        
+        The UPDATE ... SET last_sequence = last_sequence + 1 takes the row
+        lock only until this transaction commits, which serializes
+        allocation between concurrent writers of the same conversation.
+        The same statement maintains the denormalized summary columns,
+        so they always describe the highest-sequence message.
+        
+        The message is appended to the conversation's PromptCache entry.
+        After an assistant reply, long conversations get their rolling
+        summary refreshed in the background.
+        """
+        fields.setdefault('token_count', ContextBuilder.estimate_tokens(content))
+        
+        now = timezone.now()
+        preview = content[:Conversation.PREVIEW_LENGTH]
+        
+        with transaction.atomic():
+            Conversation.objects.filter(pk=conversation.pk).update(
+                last_sequence=F('last_sequence') + 1,
+                message_count=F('message_count') + 1,
+                unsummarized_tokens=F('unsummarized_tokens') + fields['token_count'],
+                last_message_preview=preview,
+                last_message_role=role,
+                last_message_at=now,
+                updated_at=now
+            )
+            sequence, message_count, unsummarized_tokens = Conversation.objects.filter(
+                pk=conversation.pk
+            ).values_list('last_sequence', 'message_count', 'unsummarized_tokens').get()
+            
+            message = ChatMessage.objects.create(
+                conversation=conversation,
+                role=role,
+                content=content,
+                sequence=sequence,
+                **fields
+            )
+        
+        conversation.last_sequence = sequence
+        conversation.message_count = message_count
+        conversation.unsummarized_tokens = unsummarized_tokens
+        conversation.last_message_preview = preview
+        conversation.last_message_role = role
+        conversation.last_message_at = now
+        conversation.updated_at = now
+        
+        PromptCache.append(conversation, message)
+        if role == 'assistant':
+            SummaryService.schedule(conversation)
+        return message
+
+    
+    @classmethod
+    def refresh_summary(cls, conversation_id) -> None:
+        """
+        Recompute the denormalized summary columns from the messages
+        
+        For writes that bypass append_message, like edits and deletes
+        in the admin. unsummarized_tokens is summed again from the
+        messages after the rolling summary. last_sequence is left alone,
+        sequence numbers are never reused.
+        """
+        messages = ChatMessage.objects.filter(conversation_id=conversation_id)
+        unsummarized = messages.filter(
+            sequence__gt=OuterRef('context_summary_through')
+        ).order_by().values('conversation_id').annotate(total=Sum('token_count')).values('total')
+        
+        with transaction.atomic():
+            latest = messages.order_by('-sequence').values_list('content', 'role', 'created_at').first()
+            content, role, created_at = latest or ('', '', None)
+            Conversation.objects.filter(pk=conversation_id).update(
+                message_count=messages.count(),
+                unsummarized_tokens=Coalesce(Subquery(unsummarized), 0),
+                last_message_preview=content[:Conversation.PREVIEW_LENGTH],
+                last_message_role=role,
+                last_message_at=created_at
+            )
+        PromptCache.invalidate(conversation_id)
\ No newline at end of file
@@ -0,0 +1,140 @@
+from typing import Iterator
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+import json
+import zipfile
+
+from apps.chat.models import Conversation
+from apps.chat.serializers import ConversationSerializer, ChatMessageSerializer
+
+
+def _dumps(data) -> str:
+    return json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+
+class _ZipStream:
+    """Write-only file object handed to ZipFile, drained by the generator"""
+    
+    def __init__(self):
+        self.chunks = []
+    
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self) -> Iterator[bytes]:
+        if self.chunks:
+            data = b''.join(self.chunks)
+            self.chunks = []
+            yield data
+
+
+class ExportService:
+    """
+    Streaming conversation export
+    
+    Every format is a generator over messages fetched with
+    .iterator(chunk_size=EXPORT_CHUNK_SIZE), so memory stays constant
+    no matter how long a conversation (or how many conversations) are
+    exported.
+    """
+    
+    FORMATS = ('markdown', 'json', 'ndjson')
+    BULK_FORMATS = ('ndjson', 'zip')
+    
+    CONTENT_TYPES = {
+        'markdown': 'text/markdown; charset=utf-8',
+        'json': 'application/json',
+        'ndjson': 'application/x-ndjson',
+        'zip': 'application/zip',
+    }
+    
+    EXTENSIONS = {
+        'markdown': 'md',
+        'json': 'json',
+        'ndjson': 'ndjson',
+        'zip': 'zip',
+    }
+    
+    @classmethod
+    def iter_messages(cls, conversation: Conversation):
+        return conversation.messages.order_by('sequence').iterator(
+            chunk_size=settings.EXPORT_CHUNK_SIZE
+        )
+    
+    @classmethod
+    def iter_conversation(cls, conversation: Conversation, format_type: str) -> Iterator[str]:
+        if format_type == 'markdown':
+            return cls.iter_markdown(conversation)
+        if format_type == 'ndjson':
+            return cls.iter_ndjson(conversation)
+        return cls.iter_json(conversation)
+    
+    @classmethod
+    def iter_markdown(cls, conversation: Conversation) -> Iterator[str]:
+        yield f"# {conversation.title or 'Untitled conversation'}\n\n"
+        for msg in cls.iter_messages(conversation):
+            yield f"**{msg.role.title()}:** {msg.content}\n\n"
+    
+    @classmethod
+    def iter_json(cls, conversation: Conversation) -> Iterator[str]:
+        """Single JSON document, the messages array is written element by element"""
+        header = _dumps(ConversationSerializer(conversation).data)
+        yield header[:-1] + ', "messages": ['
+        
+        separator = ''
+        for msg in cls.iter_messages(conversation):
+            yield separator + _dumps(ChatMessageSerializer(msg).data)
+            separator = ', '
+        
+        yield ']}'
+    
+    @classmethod
+    def iter_ndjson(cls, conversation: Conversation) -> Iterator[str]:
+        """One conversation line followed by one line per message"""
+        yield _dumps({'type': 'conversation', **ConversationSerializer(conversation).data}) + '\n'
+        
+        conversation_id = str(conversation.id)
+        for msg in cls.iter_messages(conversation):
+            yield _dumps({
+                'type': 'message',
+                'conversation_id': conversation_id,
+                **ChatMessageSerializer(msg).data
+            }) + '\n'
+    
+    @classmethod
+    def get_user_conversations(cls, user):
+        return Conversation.objects.filter(user=user, is_active=True).order_by(
+            'created_at'
+        ).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    
+    @classmethod
+    def iter_bulk_ndjson(cls, user) -> Iterator[str]:
+        for conversation in cls.get_user_conversations(user):
+            yield from cls.iter_ndjson(conversation)
+    
+    @classmethod
+    def iter_bulk_zip(cls, user) -> Iterator[bytes]:
+        """
+        Zip archive with one JSON file per conversation
+        
+        ZipFile writes local headers and data descriptors sequentially to
+        a non-seekable stream, so each entry is flushed as it is built.
+        """
+        stream = _ZipStream()
+        
+        with zipfile.ZipFile(stream, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for conversation in cls.get_user_conversations(user):
+                name = f"{conversation.created_at:%Y%m%d-%H%M%S}-{conversation.id}.json"
+                with archive.open(name, mode='w', force_zip64=True) as entry:
+                    for part in cls.iter_json(conversation):
+                        entry.write(part.encode('utf-8'))
+                        yield from stream.drain()
+                
+                yield from stream.drain()
+        
+        # Central directory is written on close
+        yield from stream.drain()
\ No newline at end of file
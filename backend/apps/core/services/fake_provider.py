@@ -0,0 +1,84 @@
+from typing import List, Dict, Optional
+import asyncio
+import random
+import time
+
+from .llm_service import BaseLLMProvider
+
+
+class FakeProvider(BaseLLMProvider):
+    """
+    Local provider for development and load tests
+    
+    Never touches the network. Latency (with optional jitter) and the
+    error rate are configurable so routing and failover can be
+    exercised without a real backend.
+    """
+    
+    def __init__(
+        self,
+        latency_ms: int = 0,
+        jitter_ms: int = 0,
+        error_rate: float = 0.0,
+        content: str = 'This is a fake response.',
+        model: str = 'fake-model',
+        seed: Optional[int] = None
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.content = content
+        self.model = model
+        self.random = random.Random(seed)
+        self.calls = 0
+    
+    def is_available(self) -> bool:
+        return True
+    
+    def _delay(self) -> float:
+        jitter = self.random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0
+        return max(0, self.latency_ms + jitter) / 1000
+    
+    def _maybe_fail(self):
+        if self.error_rate and self.random.random() < self.error_rate:
+            raise RuntimeError("Failed to generate response: fake provider error")
+    
+    def _response(self, messages: List[Dict[str, str]]) -> Dict:
+        prompt_tokens = sum(len(m['content']) // 4 for m in messages)
+        completion_tokens = len(self.content) // 4
+        return {
+            'content': self.content,
+            'tokens_used': prompt_tokens + completion_tokens,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'model': self.model,
+            'finish_reason': 'stop',
+        }
+    
+    def generate_response(self, messages: List[Dict[str, str]], **kwargs) -> Dict:
+        self.calls += 1
+        time.sleep(self._delay())
+        self._maybe_fail()
+        return self._response(messages)
+    
+    async def agenerate_response(self, messages: List[Dict[str, str]], **kwargs) -> Dict:
+        self.calls += 1
+        await asyncio.sleep(self._delay())
+        self._maybe_fail()
+        return self._response(messages)
+    
+    def generate_streaming_response(self, messages: List[Dict[str, str]], **kwargs):
+        self.calls += 1
+        time.sleep(self._delay())
+        self._maybe_fail()
+        for index, word in enumerate(self.content.split(' ')):
+            yield (' ' if index else '') + word
+        yield {key: value for key, value in self._response(messages).items() if key != 'content'}
+    
+    async def agenerate_streaming_response(self, messages: List[Dict[str, str]], **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self._delay())
+        self._maybe_fail()
+        for index, word in enumerate(self.content.split(' ')):
+            yield (' ' if index else '') + word
+        yield {key: value for key, value in self._response(messages).items() if key != 'content'}
\ No newline at end of file
@@ -1,12 +1,29 @@
-from typing import List, Dict
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, TimeoutError as FutureTimeout, wait
+from email.utils import parsedate_to_datetime
+from typing import List, Dict, Optional
 from django.conf import settings
-from groq import Groq
+from django.utils import timezone
+from groq import Groq, AsyncGroq, APIConnectionError, APIStatusError
+import asyncio
 import logging
+import random
+import threading
+import time
+import weakref
 
+from apps.core.exceptions import LLMRequestRejected
+from apps.core.metrics import LLM_RETRIES, LLM_HEDGED_REQUESTS
+from .admission import AdmissionController
+from .http_clients import HTTPClientPool
+from .llm_metrics import LLMCallMetrics
 from .llm_service import BaseLLMProvider
 
 logger = logging.getLogger(__name__)
 
+# Worth another attempt, everything else (400, 401, 404...) fails fast
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
 
 class GroqProvider(BaseLLMProvider):
     """
@@ -14,22 +31,91 @@ class GroqProvider(BaseLLMProvider):
     Uses llama-3.3-70b-versatile (FREE & FAST)
     """
     
+    DEFAULT_RETRY = {
+        'MAX_ATTEMPTS': 3,
+        'BASE_DELAY': 0.5,
+        # Longest backoff, a longer Retry-After gives up instead of waiting
+        'MAX_DELAY': 10,
+        # Budget for all attempts and waits of one request
+        'TOTAL_TIMEOUT': 60,
+    }
+    
+    DEFAULT_HEDGE = {
+        'ENABLED': False,
+        # Hedge after this latency percentile of recent attempts, failed ones included
+        'PERCENTILE': 95,
+        'MIN_SAMPLES': 20,
+        # Used until enough samples are in, and as a floor
+        'DEFAULT_DELAY': 5.0,
+        'MIN_DELAY': 0.2,
+        # Threads of sync hedged calls, None for a primary and a hedge per admitted call
+        # (twice ADMISSION['MAX_CONCURRENT'])
+        'MAX_WORKERS': None,
+    }
+    
+    _executor: Optional[ThreadPoolExecutor] = None
+    _executor_lock = threading.Lock()
+    _executor_workers = 0
+    # Executor threads taken, by running attempts and losers finishing in the background
+    _busy_workers = 0
+    
     def __init__(self):
         self.api_key = settings.LLM_CONFIG.get('GROQ_API_KEY')
         self.model = settings.LLM_CONFIG.get('GROQ_MODEL', 'llama-3.3-70b-versatile')
+        # None uses the SDK default (GROQ_BASE_URL env or api.groq.com)
+        self.base_url = settings.LLM_CONFIG.get('GROQ_BASE_URL') or None
+        # Per attempt
         self.timeout = settings.LLM_CONFIG.get('TIMEOUT', 30)
+        self.retry = {**self.DEFAULT_RETRY, **settings.LLM_CONFIG.get('RETRY', {})}
+        self.hedge = {**self.DEFAULT_HEDGE, **settings.LLM_CONFIG.get('HEDGE', {})}
+        self.latencies = deque(maxlen=200)
         self.client = None
+        self._async_clients = weakref.WeakKeyDictionary()
         
         if self.api_key:
             try:
-                self.client = Groq(api_key=self.api_key)
+                # Retries are done here, with Retry-After and hedging, not by the SDK
+                self.client = Groq(
+                    api_key=self.api_key,
+                    base_url=self.base_url,
+                    max_retries=0,
+                    http_client=HTTPClientPool.get_client('groq', self.timeout)
+                )
             except Exception as e:
                 logger.error(f"Failed to initialize Groq client: {e}")
     
+    @property
+    def async_client(self) -> AsyncGroq:
+        """AsyncGroq on the shared connection pool of the running event loop"""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = self._async_clients[loop] = AsyncGroq(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                max_retries=0,
+                http_client=HTTPClientPool.get_async_client('groq', self.timeout)
+            )
+        return client
+    
     def is_available(self) -> bool:
         """Check if Groq is properly configured"""
         return self.client is not None and bool(self.api_key)
     
+    def is_async_available(self) -> bool:
+        """Check if the async Groq client can be built"""
+        return self.is_available()
+    
+    def prewarm(self) -> None:
+        """Open a pooled connection ahead of the first request"""
+        if not self.is_available():
+            return
+        
+        try:
+            self.client.models.list(timeout=self.timeout)
+        except Exception as e:
+            logger.warning(f"Groq connection prewarm failed: {e}")
+    
     def generate_response(
         self, 
         messages: List[Dict[str, str]], 
@@ -46,40 +132,396 @@ class GroqProvider(BaseLLMProvider):
             temperature: Sampling temperature
         
         Returns:
-            Dict with 'content', 'tokens_used', 'model', 'finish_reason'
+            Dict with 'content', 'tokens_used', 'model', 'finish_reason',
+            'attempts'
         """
         if not self.is_available():
             raise RuntimeError("Groq provider is not configured. Check GROQ_API_KEY.")
         
+        def attempt():
+            started = time.monotonic()
+            try:
+                return self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    timeout=self.timeout,
+                    **kwargs
+                )
+            finally:
+                # Timed out and failed attempts too, they are the slow tail
+                self.latencies.append(time.monotonic() - started)
+        
+        attempts = [0]
+        deadline = time.monotonic() + self.retry['TOTAL_TIMEOUT']
+        metrics = LLMCallMetrics('groq', self.model)
+        
+        while True:
+            try:
+                response = self._hedged_call(attempt, attempts)
+                result = self._parse_response(response)
+                metrics.success(result)
+                return {**result, 'attempts': attempts[0]}
+            
+            except Exception as e:
+                delay = self._retry_delay(e, attempts[0], deadline)
+                if delay is None:
+                    metrics.failure(e)
+                    logger.error(f"Groq API error after {attempts[0]} attempts: {str(e)}")
+                    raise self._final_error(e, 'Failed to generate response')
+                
+                logger.warning(f"Groq API error, retrying in {delay:.2f}s: {str(e)}")
+                time.sleep(delay)
+    
+    async def agenerate_response(
+        self, 
+        messages: List[Dict[str, str]], 
+        max_tokens: int = 2048,
+        temperature: float = 0.7,
+        **kwargs
+    ) -> Dict:
+        """
+        Generate response using the async Groq client
+        Same return shape as generate_response
+        """
+        if not self.is_async_available():
+            raise RuntimeError("Groq provider is not configured. Check GROQ_API_KEY.")
+        
+        async def attempt():
+            started = time.monotonic()
+            try:
+                response = await self.async_client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    timeout=self.timeout,
+                    **kwargs
+                )
+            except asyncio.CancelledError:
+                # A cancelled hedging loser, its time so far is no latency sample
+                raise
+            except Exception:
+                self.latencies.append(time.monotonic() - started)
+                raise
+            self.latencies.append(time.monotonic() - started)
+            return response
+        
+        attempts = [0]
+        deadline = time.monotonic() + self.retry['TOTAL_TIMEOUT']
+        metrics = LLMCallMetrics('groq', self.model)
+        
+        while True:
+            try:
+                response = await self._ahedged_call(attempt, attempts)
+                result = self._parse_response(response)
+                metrics.success(result)
+                return {**result, 'attempts': attempts[0]}
+            
+            except Exception as e:
+                delay = self._retry_delay(e, attempts[0], deadline)
+                if delay is None:
+                    metrics.failure(e)
+                    logger.error(f"Groq API error after {attempts[0]} attempts: {str(e)}")
+                    raise self._final_error(e, 'Failed to generate response')
+                
+                logger.warning(f"Groq API error, retrying in {delay:.2f}s: {str(e)}")
+                await asyncio.sleep(delay)
+    
+    def _with_retries(self, call):
+        """Run call under the retry policy, without hedging (used to open streams)"""
+        deadline = time.monotonic() + self.retry['TOTAL_TIMEOUT']
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                return call()
+            except Exception as e:
+                delay = self._retry_delay(e, attempts, deadline)
+                if delay is None:
+                    raise
+                logger.warning(f"Groq API error, retrying in {delay:.2f}s: {str(e)}")
+                time.sleep(delay)
+    
+    async def _awith_retries(self, call):
+        """Async variant of _with_retries, call returns an awaitable"""
+        deadline = time.monotonic() + self.retry['TOTAL_TIMEOUT']
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                return await call()
+            except Exception as e:
+                delay = self._retry_delay(e, attempts, deadline)
+                if delay is None:
+                    raise
+                logger.warning(f"Groq API error, retrying in {delay:.2f}s: {str(e)}")
+                await asyncio.sleep(delay)
+    
+    def _retry_delay(self, error: Exception, attempts: int, deadline: float) -> Optional[float]:
+        """Seconds to wait before the next attempt, None to give up"""
+        if isinstance(error, APIStatusError):
+            if error.status_code not in RETRYABLE_STATUS_CODES:
+                return None
+            reason = str(error.status_code)
+        elif isinstance(error, APIConnectionError):
+            # Includes APITimeoutError, raised when an attempt hits self.timeout
+            reason = 'connection'
+        else:
+            return None
+        
+        if attempts >= self.retry['MAX_ATTEMPTS']:
+            return None
+        
+        # Full jitter exponential backoff, at least what the server asked for
+        backoff = min(self.retry['MAX_DELAY'], self.retry['BASE_DELAY'] * 2 ** (attempts - 1))
+        delay = random.uniform(0, backoff)
+        retry_after = self._retry_after(error)
+        if retry_after is not None:
+            if retry_after > self.retry['MAX_DELAY']:
+                return None
+            delay = max(delay, retry_after)
+        
+        if time.monotonic() + delay >= deadline:
+            return None
+        
+        LLM_RETRIES.labels(provider='groq', reason=reason).inc()
+        return delay
+    
+    @staticmethod
+    def _final_error(error: Exception, message: str) -> RuntimeError:
+        """Error to raise once retries are given up, LLMRequestRejected for client errors"""
+        if (isinstance(error, APIStatusError) and 400 <= error.status_code < 500
+                and error.status_code not in RETRYABLE_STATUS_CODES):
+            return LLMRequestRejected(f"{message}: {str(error)}", error.status_code)
+        return RuntimeError(f"{message}: {str(error)}")
+    
+    @staticmethod
+    def _retry_after(error: Exception) -> Optional[float]:
+        """Retry-After (or retry-after-ms) of an error response, in seconds"""
+        response = getattr(error, 'response', None)
+        if response is None:
+            return None
+        
+        headers = response.headers
+        try:
+            if headers.get('retry-after-ms'):
+                return float(headers['retry-after-ms']) / 1000
+            if headers.get('retry-after'):
+                return float(headers['retry-after'])
+        except ValueError:
+            pass
+        
+        try:
+            retry_at = parsedate_to_datetime(headers['retry-after'])
+            return max(0.0, (retry_at - timezone.now()).total_seconds())
+        except (KeyError, TypeError, ValueError):
+            return None
+    
+    def _hedge_delay(self) -> Optional[float]:
+        """Seconds to wait for the first attempt before hedging, None when hedging is off"""
+        if not self.hedge['ENABLED']:
+            return None
+        
+        samples = sorted(self.latencies)
+        if len(samples) < self.hedge['MIN_SAMPLES']:
+            return self.hedge['DEFAULT_DELAY']
+        
+        index = min(len(samples) - 1, int(len(samples) * self.hedge['PERCENTILE'] / 100))
+        return max(self.hedge['MIN_DELAY'], samples[index])
+    
+    def _max_workers(self) -> int:
+        return self.hedge['MAX_WORKERS'] or 2 * AdmissionController.get_config()['MAX_CONCURRENT']
+    
+    @classmethod
+    def _get_executor(cls, max_workers: int) -> ThreadPoolExecutor:
+        with cls._executor_lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=max_workers, thread_name_prefix='groq-hedge'
+                )
+                cls._executor_workers = max_workers
+            return cls._executor
+    
+    @classmethod
+    def _submit(cls, attempt, max_workers: int):
+        """Run attempt on the executor if a thread is free now, None otherwise"""
+        executor = cls._get_executor(max_workers)
+        with cls._executor_lock:
+            if cls._busy_workers >= cls._executor_workers:
+                return None
+            cls._busy_workers += 1
+        
+        def run():
+            try:
+                return attempt()
+            finally:
+                with cls._executor_lock:
+                    cls._busy_workers -= 1
+        return executor.submit(run)
+    
+    def _hedged_call(self, attempt, attempts: List[int]):
+        """
+        Run attempt, firing a second one if the first is slower than the hedge delay
+        
+        The first attempt to succeed wins. The loser can't be interrupted
+        and finishes in the background, bounded by the per-attempt timeout.
+        Attempts never queue for a thread: with the executor taken (by
+        losers still running, say) the call runs unhedged instead.
+        """
+        delay = self._hedge_delay()
+        attempts[0] += 1
+        if delay is None:
+            return attempt()
+        
+        primary = self._submit(attempt, self._max_workers())
+        if primary is None:
+            LLM_HEDGED_REQUESTS.labels(winner='skipped').inc()
+            return attempt()
+        try:
+            return primary.result(timeout=delay)
+        except FutureTimeout:
+            pass
+        
+        hedge = self._submit(attempt, self._max_workers())
+        if hedge is None:
+            LLM_HEDGED_REQUESTS.labels(winner='skipped').inc()
+            return primary.result()
+        attempts[0] += 1
+        pending = {primary, hedge}
+        error = None
+        
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    LLM_HEDGED_REQUESTS.labels(winner='hedge' if future is hedge else 'primary').inc()
+                    return future.result()
+                error = future.exception()
+        
+        LLM_HEDGED_REQUESTS.labels(winner='none').inc()
+        raise error
+    
+    async def _ahedged_call(self, attempt, attempts: List[int]):
+        """Async variant of _hedged_call, the losing attempt is cancelled"""
+        delay = self._hedge_delay()
+        attempts[0] += 1
+        if delay is None:
+            return await attempt()
+        
+        primary = asyncio.ensure_future(attempt())
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return primary.result()
+            
+            attempts[0] += 1
+            hedge = asyncio.ensure_future(attempt())
+            pending = {primary, hedge}
+            error = None
+            
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        LLM_HEDGED_REQUESTS.labels(winner='hedge' if task is hedge else 'primary').inc()
+                        return task.result()
+                    error = task.exception()
+            
+            LLM_HEDGED_REQUESTS.labels(winner='none').inc()
+            raise error
+        
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    def _parse_response(self, response) -> Dict:
+        """Extract response data from a Groq chat completion"""
+        choice = response.choices[0]
+        usage = response.usage
+        
+        return {
+            'content': choice.message.content,
+            'tokens_used': usage.total_tokens if usage else 0,
+            'prompt_tokens': usage.prompt_tokens if usage else 0,
+            'completion_tokens': usage.completion_tokens if usage else 0,
+            'model': response.model,
+            'finish_reason': choice.finish_reason,
+        }
+    
+    def _parse_stream_chunk(self, chunk, result: Dict) -> Optional[str]:
+        """Text of a stream chunk, model/finish_reason/usage are collected into result"""
+        result['model'] = chunk.model or result['model']
+        
+        # Groq sends usage on the last chunk as x_groq.usage
+        x_groq = getattr(chunk, 'x_groq', None)
+        usage = x_groq.get('usage') if isinstance(x_groq, dict) else getattr(x_groq, 'usage', None)
+        if usage:
+            if not isinstance(usage, dict):
+                usage = usage.model_dump() if hasattr(usage, 'model_dump') else vars(usage)
+            result['tokens_used'] = usage.get('total_tokens', 0)
+            result['prompt_tokens'] = usage.get('prompt_tokens', 0)
+            result['completion_tokens'] = usage.get('completion_tokens', 0)
+        
+        if not chunk.choices:
+            return None
+        
+        choice = chunk.choices[0]
+        if choice.finish_reason:
+            result['finish_reason'] = choice.finish_reason
+        return choice.delta.content if choice.delta else None
+    
+    def generate_streaming_response(
+        self, 
+        messages: List[Dict[str, str]], 
+        max_tokens: int = 2048,
+        temperature: float = 0.7,
+        **kwargs
+    ):
+        """
+        Generate streaming response (for real-time chat)
+        Yields chunks of text as they arrive, then one dict with the
+        usage Groq reports on the final chunk (same keys as
+        generate_response, without 'content')
+        """
+        if not self.is_available():
+            raise RuntimeError("Groq provider is not configured.")
+        
+        stream = None
+        metrics = LLMCallMetrics('groq', self.model, mode='stream')
         try:
-            # Call Groq API
-            response = self.client.chat.completions.create(
+            stream = self._with_retries(lambda: self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 max_tokens=max_tokens,
                 temperature=temperature,
                 timeout=self.timeout,
+                stream=True,
                 **kwargs
-            )
-            
-            # Extract response data
-            choice = response.choices[0]
-            usage = response.usage
-            
-            return {
-                'content': choice.message.content,
-                'tokens_used': usage.total_tokens if usage else 0,
-                'prompt_tokens': usage.prompt_tokens if usage else 0,
-                'completion_tokens': usage.completion_tokens if usage else 0,
-                'model': response.model,
-                'finish_reason': choice.finish_reason,
-            }
+            ))
             
+            result = {'model': self.model}
+            for chunk in stream:
+                text = self._parse_stream_chunk(chunk, result)
+                if text:
+                    metrics.first_token()
+                    yield text
+            metrics.success(result)
+            yield result
+        
         except Exception as e:
-            logger.error(f"Groq API error: {str(e)}")
-            raise RuntimeError(f"Failed to generate response: {str(e)}")
+            metrics.failure(e)
+            logger.error(f"Groq streaming error: {str(e)}")
+            raise self._final_error(e, 'Streaming failed')
+        
+        finally:
+            # Also runs when the consumer closes us early, stops the upstream generation
+            if stream is not None:
+                stream.close()
     
-    def generate_streaming_response(
+    async def agenerate_streaming_response(
         self, 
         messages: List[Dict[str, str]], 
         max_tokens: int = 2048,
@@ -87,26 +529,40 @@ class GroqProvider(BaseLLMProvider):
         **kwargs
     ):
         """
-        Generate streaming response (for real-time chat)
-        Yields chunks of text as they arrive
+        Async streaming response
+        Yields chunks of text as they arrive without blocking a thread,
+        then the usage dict like generate_streaming_response
         """
-        if not self.is_available():
+        if not self.is_async_available():
             raise RuntimeError("Groq provider is not configured.")
         
+        stream = None
+        metrics = LLMCallMetrics('groq', self.model, mode='stream')
         try:
-            stream = self.client.chat.completions.create(
+            stream = await self._awith_retries(lambda: self.async_client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 max_tokens=max_tokens,
                 temperature=temperature,
+                timeout=self.timeout,
                 stream=True,
                 **kwargs
-            )
+            ))
             
-            for chunk in stream:
-                if chunk.choices[0].delta.content:
-                    yield chunk.choices[0].delta.content
-                    
+            result = {'model': self.model}
+            async for chunk in stream:
+                text = self._parse_stream_chunk(chunk, result)
+                if text:
+                    metrics.first_token()
+                    yield text
+            metrics.success(result)
+            yield result
+        
         except Exception as e:
+            metrics.failure(e)
             logger.error(f"Groq streaming error: {str(e)}")
-            raise RuntimeError(f"Streaming failed: {str(e)}")
\ No newline at end of file
+            raise self._final_error(e, 'Streaming failed')
+        
+        finally:
+            if stream is not None:
+                await stream.close()
\ No newline at end of file
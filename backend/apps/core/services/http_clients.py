@@ -0,0 +1,85 @@
+from typing import Dict
+from django.conf import settings
+import asyncio
+import httpx
+import logging
+import threading
+import weakref
+
+logger = logging.getLogger(__name__)
+
+
+class HTTPClientPool:
+    """
+    Process-wide httpx clients shared by the LLM providers
+    
+    One client (and so one connection pool) per upstream, reused by
+    every request so keep-alive connections skip the TCP/TLS handshake.
+    Async clients are bound to the event loop that uses them, so there
+    is one per upstream per loop.
+    """
+    
+    DEFAULT_CONFIG = {
+        'MAX_CONNECTIONS': 100,
+        'MAX_KEEPALIVE_CONNECTIONS': 20,
+        'KEEPALIVE_EXPIRY': 60,
+        'CONNECT_TIMEOUT': 5,
+        'HTTP2': True,
+    }
+    
+    _clients: Dict[str, httpx.Client] = {}
+    _async_clients = weakref.WeakKeyDictionary()
+    _lock = threading.Lock()
+    
+    @classmethod
+    def get_config(cls) -> Dict:
+        return {**cls.DEFAULT_CONFIG, **settings.LLM_CONFIG.get('HTTP', {})}
+    
+    @classmethod
+    def http2_available(cls) -> bool:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            return False
+        return True
+    
+    @classmethod
+    def _client_options(cls, timeout: float) -> Dict:
+        config = cls.get_config()
+        return {
+            'limits': httpx.Limits(
+                max_connections=config['MAX_CONNECTIONS'],
+                max_keepalive_connections=config['MAX_KEEPALIVE_CONNECTIONS'],
+                keepalive_expiry=config['KEEPALIVE_EXPIRY'],
+            ),
+            'timeout': httpx.Timeout(timeout, connect=config['CONNECT_TIMEOUT']),
+            # HTTP/2 needs the optional h2 package (httpx[http2])
+            'http2': config['HTTP2'] and cls.http2_available(),
+            'follow_redirects': True,
+        }
+    
+    @classmethod
+    def get_client(cls, name: str, timeout: float) -> httpx.Client:
+        with cls._lock:
+            client = cls._clients.get(name)
+            if client is None or client.is_closed:
+                client = cls._clients[name] = httpx.Client(**cls._client_options(timeout))
+            return client
+    
+    @classmethod
+    def get_async_client(cls, name: str, timeout: float) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        with cls._lock:
+            clients = cls._async_clients.setdefault(loop, {})
+            client = clients.get(name)
+            if client is None or client.is_closed:
+                client = clients[name] = httpx.AsyncClient(**cls._client_options(timeout))
+            return client
+    
+    @classmethod
+    def close_all(cls) -> None:
+        """Close the sync clients, e.g. after fork or at shutdown"""
+        with cls._lock:
+            for client in cls._clients.values():
+                client.close()
+            cls._clients.clear()
\ No newline at end of file
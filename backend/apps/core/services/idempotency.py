@@ -0,0 +1,111 @@
+from typing import Dict, Optional
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+import hashlib
+import json
+import time
+
+from apps.core.metrics import IDEMPOTENT_REQUESTS
+
+
+class IdempotencyStore:
+    """
+    Responses of chat requests sent with an Idempotency-Key header
+    
+    The first request with a key claims it with an atomic add and runs.
+    Once it's done, its response is stored under the key for
+    IDEMPOTENCY_TTL seconds. A retry with the same key gets the stored
+    response back. A retry that arrives while the first request is
+    still running waits for that response. Either way the provider
+    isn't called again. Keys are per user and endpoint, and they live
+    in the bounded 'idempotency' cache alias. A key reused with a
+    different body is rejected.
+    """
+    
+    KEY_PREFIX = 'idempotency'
+    MAX_KEY_LENGTH = 255
+    
+    IN_PROGRESS = 'in_progress'
+    DONE = 'done'
+    
+    @classmethod
+    def get_cache(cls):
+        return caches[settings.IDEMPOTENCY['ALIAS']]
+    
+    @classmethod
+    def is_valid_key(cls, key: str) -> bool:
+        return 0 < len(key) <= cls.MAX_KEY_LENGTH and key.isprintable()
+    
+    @classmethod
+    def make_key(cls, user_id: int, scope: str, key: str) -> str:
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return f"{cls.KEY_PREFIX}:{scope}:{user_id}:{digest}"
+    
+    @classmethod
+    def fingerprint(cls, data: Dict) -> str:
+        payload = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    @classmethod
+    def begin(cls, key: str, fingerprint: str) -> Optional[Dict]:
+        """
+        Claim key for this request
+        
+        Returns None when claimed, otherwise the record of the request
+        that holds it. If that request is still running, this waits for
+        it for up to WAIT_TIMEOUT seconds.
+        """
+        config = settings.IDEMPOTENCY
+        claim = {'state': cls.IN_PROGRESS, 'fingerprint': fingerprint}
+        if cls.get_cache().add(key, claim, timeout=config['LOCK_TIMEOUT']):
+            return None
+        
+        deadline = time.monotonic() + config['WAIT_TIMEOUT']
+        while True:
+            existing = cls.get_cache().get(key)
+            if existing is None:
+                # The first request failed and gave the key up, this one runs instead
+                if cls.get_cache().add(key, claim, timeout=config['LOCK_TIMEOUT']):
+                    return None
+                continue
+            
+            if (existing['fingerprint'] != fingerprint
+                    or existing['state'] == cls.DONE
+                    or time.monotonic() > deadline):
+                return existing
+            time.sleep(config['POLL_INTERVAL'])
+    
+    @classmethod
+    def begin_stream(cls, key: str, fingerprint: str, stream_id: str) -> Optional[Dict]:
+        """
+        Claim key for a chat stream, None when claimed
+        
+        The stream's replay buffer is its response, so the record points
+        at it right away and lives as long as the buffer does.
+        """
+        record = {'state': cls.DONE, 'fingerprint': fingerprint, 'stream_id': stream_id}
+        while True:
+            if cls.get_cache().add(key, record, timeout=settings.STREAM_REPLAY_TTL):
+                return None
+            existing = cls.get_cache().get(key)
+            if existing is not None:
+                return existing
+    
+    @classmethod
+    def complete(cls, key: str, fingerprint: str, status: int, data: Dict) -> None:
+        cls.get_cache().set(key, {
+            'state': cls.DONE,
+            'fingerprint': fingerprint,
+            'status': status,
+            'data': data,
+        }, timeout=settings.IDEMPOTENCY['TTL'])
+    
+    @classmethod
+    def release(cls, key: str) -> None:
+        """Give the key up after a failure, so a retry runs again"""
+        cls.get_cache().delete(key)
+    
+    @classmethod
+    def count(cls, scope: str, result: str) -> None:
+        IDEMPOTENT_REQUESTS.labels(scope=scope, result=result).inc()
\ No newline at end of file
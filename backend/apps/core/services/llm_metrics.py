@@ -0,0 +1,61 @@
+from typing import Dict, Optional
+import time
+
+from apps.core.metrics import (
+    LLM_ERRORS,
+    LLM_REQUEST_SECONDS,
+    LLM_TIME_TO_FIRST_TOKEN_SECONDS,
+    LLM_TOKENS,
+    LLM_TOKENS_PER_SECOND,
+)
+
+
+class LLMCallMetrics:
+    """
+    Prometheus observations of one provider request, retries included
+    
+    Labeled with the requested model, so every series of a model lines
+    up even when the API reports a more specific version.
+    
+    Created when the request starts. Streams call first_token() when
+    the first text arrives, then success() or failure() ends it.
+    Streams closed early by the consumer are never ended, those are
+    counted as cancelled instead.
+    """
+    
+    def __init__(self, provider: str, model: str, mode: str = 'complete'):
+        self.provider = provider
+        self.model = model
+        self.mode = mode
+        self.started = time.monotonic()
+        self.first_token_at: Optional[float] = None
+    
+    def first_token(self) -> None:
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+            LLM_TIME_TO_FIRST_TOKEN_SECONDS.labels(
+                provider=self.provider, model=self.model
+            ).observe(self.first_token_at - self.started)
+    
+    def success(self, result: Dict) -> None:
+        now = time.monotonic()
+        LLM_REQUEST_SECONDS.labels(
+            provider=self.provider, model=self.model, mode=self.mode
+        ).observe(now - self.started)
+        
+        prompt_tokens = result.get('prompt_tokens') or 0
+        completion_tokens = result.get('completion_tokens') or 0
+        LLM_TOKENS.labels(provider=self.provider, model=self.model, kind='prompt').observe(prompt_tokens)
+        LLM_TOKENS.labels(provider=self.provider, model=self.model, kind='completion').observe(completion_tokens)
+        
+        # Generation speed, from the first token on for streams
+        generating = now - (self.first_token_at or self.started)
+        if completion_tokens and generating > 0:
+            LLM_TOKENS_PER_SECOND.labels(
+                provider=self.provider, model=self.model, mode=self.mode
+            ).observe(completion_tokens / generating)
+    
+    def failure(self, error: Exception) -> None:
+        LLM_ERRORS.labels(
+            provider=self.provider, model=self.model, error=type(error).__name__
+        ).inc()
\ No newline at end of file
@@ -1,6 +1,14 @@
 from abc import ABC, abstractmethod
 from typing import List, Dict, Optional
+from asgiref.sync import sync_to_async
+import time
 from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .admission import AdmissionController
+from .request_timing import RequestTimings
+from .response_cache import ResponseCache
+from .single_flight import SingleFlight
 
 
 class BaseLLMProvider(ABC):
@@ -31,6 +39,20 @@ class BaseLLMProvider(ABC):
     def is_available(self) -> bool:
         """Check if provider is properly configured"""
         pass
+    
+    async def agenerate_response(
+        self, 
+        messages: List[Dict[str, str]], 
+        **kwargs
+    ) -> Dict:
+        """
+        Async variant of generate_response
+        Providers without a native async client fall back to running
+        the blocking call in a worker thread
+        """
+        return await sync_to_async(self.generate_response, thread_sensitive=False)(
+            messages, **kwargs
+        )
 
 
 class LLMService:
@@ -41,30 +63,58 @@ class LLMService:
     
     _provider: Optional[BaseLLMProvider] = None
     
+    # Add more providers here, e.g. 'deepseek': 'apps.core.services.deepseek_provider.DeepSeekProvider'
+    PROVIDER_CLASSES = {
+        'groq': 'apps.core.services.groq_provider.GroqProvider',
+    }
+    # Canned replies for development and load tests, only registered with DEBUG on
+    DEBUG_PROVIDER_CLASSES = {
+        'fake': 'apps.core.services.fake_provider.FakeProvider',
+    }
+    
     @classmethod
     def get_provider(cls) -> BaseLLMProvider:
-        """Get configured LLM provider (singleton pattern)"""
+        """
+        Get the provider pool (singleton pattern)
+        
+        The pool holds every provider named in LLM_CONFIG['PROVIDERS']
+        and routes each call by latency, error rate and circuit state.
+        """
         if cls._provider is None:
-            provider_name = settings.LLM_CONFIG.get('PROVIDER', 'groq')
-            
-            if provider_name == 'groq':
-                from .groq_provider import GroqProvider
-                cls._provider = GroqProvider()
-            # Add more providers here
-            # elif provider_name == 'deepseek':
-            #     from .deepseek_provider import DeepSeekProvider
-            #     cls._provider = DeepSeekProvider()
-            else:
-                raise ValueError(f"Unknown LLM provider: {provider_name}")
+            from .provider_pool import build_pool_from_settings
+            cls._provider = build_pool_from_settings()
         
         return cls._provider
     
+    @classmethod
+    def prewarm(cls) -> None:
+        """Build the provider and open its connections at worker startup"""
+        if not settings.LLM_CONFIG.get('HTTP', {}).get('PREWARM', True):
+            return
+        
+        provider = cls.get_provider()
+        if hasattr(provider, 'prewarm'):
+            provider.prewarm()
+    
+    @classmethod
+    def create_provider(cls, provider_name: str) -> BaseLLMProvider:
+        """Instantiate a single provider by its registry name"""
+        provider_classes = cls.PROVIDER_CLASSES
+        if settings.DEBUG:
+            provider_classes = {**provider_classes, **cls.DEBUG_PROVIDER_CLASSES}
+        if provider_name not in provider_classes:
+            raise ValueError(f"Unknown LLM provider: {provider_name}")
+        
+        return import_string(provider_classes[provider_name])()
+    
     @classmethod
     def generate_chat_response(
         cls,
         messages: List[Dict[str, str]],
         max_tokens: Optional[int] = None,
         temperature: Optional[float] = None,
+        cache: Optional[bool] = None,
+        tier: Optional[str] = None,
         **kwargs
     ) -> Dict:
         """
@@ -74,28 +124,127 @@ class LLMService:
             messages: Conversation history
             max_tokens: Maximum tokens to generate
             temperature: Sampling temperature
+            cache: Force the response cache on/off, None uses the deployment setting
+            tier: Admission priority tier of the caller, 'default' when None
         
         Returns:
-            Dict with response data
+            Dict with response data, including the measured 'latency_ms'
+            and 'cached' on cache hits
+        """
+        provider = cls._get_available_provider()
+        max_tokens, temperature = cls._resolve_params(max_tokens, temperature)
+        started = time.monotonic()
+        
+        cache_key = None
+        if ResponseCache.should_use(temperature, cache):
+            cache_key = ResponseCache.make_key(
+                cls._request_model(kwargs), messages, max_tokens, temperature, **kwargs
+            )
+            response = ResponseCache.get(cache_key)
+            if response is not None:
+                response['latency_ms'] = int((time.monotonic() - started) * 1000)
+                return response
+        
+        def call():
+            # Cache hits and single-flight followers don't take a slot
+            with AdmissionController.slot(tier or 'default'):
+                response = provider.generate_response(
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    **kwargs
+                )
+            if cache_key:
+                ResponseCache.set(cache_key, response)
+            return response
+        
+        with RequestTimings.llm_call():
+            if SingleFlight.is_enabled():
+                # Identical concurrent requests share one upstream call
+                key = SingleFlight.make_key(
+                    cls._request_model(kwargs), messages, max_tokens, temperature, **kwargs
+                )
+                response = SingleFlight.do(key, call)
+            else:
+                response = call()
+        response['latency_ms'] = int((time.monotonic() - started) * 1000)
+        return response
+    
+    @classmethod
+    async def agenerate_chat_response(
+        cls,
+        messages: List[Dict[str, str]],
+        max_tokens: Optional[int] = None,
+        temperature: Optional[float] = None,
+        cache: Optional[bool] = None,
+        tier: Optional[str] = None,
+        **kwargs
+    ) -> Dict:
+        """
+        Async variant of generate_chat_response
+        Does not hold a thread while waiting on the provider
         """
+        provider = cls._get_available_provider()
+        max_tokens, temperature = cls._resolve_params(max_tokens, temperature)
+        started = time.monotonic()
+        
+        cache_key = None
+        if ResponseCache.should_use(temperature, cache):
+            cache_key = ResponseCache.make_key(
+                cls._request_model(kwargs), messages, max_tokens, temperature, **kwargs
+            )
+            response = await ResponseCache.aget(cache_key)
+            if response is not None:
+                response['latency_ms'] = int((time.monotonic() - started) * 1000)
+                return response
+        
+        async def call():
+            async with AdmissionController.aslot(tier or 'default'):
+                response = await provider.agenerate_response(
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    **kwargs
+                )
+            if cache_key:
+                await ResponseCache.aset(cache_key, response)
+            return response
+        
+        with RequestTimings.llm_call():
+            if SingleFlight.is_enabled():
+                key = SingleFlight.make_key(
+                    cls._request_model(kwargs), messages, max_tokens, temperature, **kwargs
+                )
+                response = await SingleFlight.ado(key, call)
+            else:
+                response = await call()
+        response['latency_ms'] = int((time.monotonic() - started) * 1000)
+        return response
+    
+    @classmethod
+    def _get_available_provider(cls) -> BaseLLMProvider:
         provider = cls.get_provider()
         
         if not provider.is_available():
             raise RuntimeError("LLM provider is not properly configured")
         
-        # Use defaults from settings if not provided
+        return provider
+    
+    @classmethod
+    def _request_model(cls, kwargs: Dict) -> Optional[str]:
+        """Model a request is for, as far as request keys are concerned"""
+        return kwargs.get('model', settings.LLM_CONFIG.get('GROQ_MODEL'))
+    
+    @classmethod
+    def _resolve_params(cls, max_tokens: Optional[int], temperature: Optional[float]):
+        """Use defaults from settings if not provided"""
         if max_tokens is None:
             max_tokens = settings.LLM_CONFIG.get('MAX_TOKENS', 2048)
         
         if temperature is None:
             temperature = settings.LLM_CONFIG.get('TEMPERATURE', 0.7)
         
-        return provider.generate_response(
-            messages=messages,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            **kwargs
-        )
+        return max_tokens, temperature
     
     @classmethod
     def format_conversation_for_llm(cls, conversation_messages) -> List[Dict[str, str]]:
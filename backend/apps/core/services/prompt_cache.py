@@ -0,0 +1,99 @@
+from typing import Dict, List, Optional
+from django.conf import settings
+from django.core.cache import cache
+
+
+class PromptCache:
+    """
+    Append-only, LLM-ready history of each active conversation
+    
+    An entry holds [sequence, role, content, token_count] rows for the
+    newest messages up to last_sequence, as many as fit in the prompt
+    budget (and MAX_CHAT_HISTORY). ConversationService appends every
+    message it writes, so building the next prompt needs no history
+    query. A message written out of order (concurrent turns) drops the
+    entry and the next read rebuilds it, edits and deletes must call
+    invalidate().
+    
+    Rows dropped from the front don't change prompts: each was dropped
+    because it no longer fit in the budget next to the newer rows, so
+    the budget walk of ContextBuilder would stop at it anyway.
+    """
+    
+    KEY_PREFIX = 'conversation:prompt'
+    
+    @classmethod
+    def key(cls, conversation_id) -> str:
+        return f"{cls.KEY_PREFIX}:{conversation_id}"
+    
+    @classmethod
+    def is_enabled(cls) -> bool:
+        return settings.PROMPT_CACHE_ENABLED
+    
+    @classmethod
+    def get(cls, conversation_id) -> Optional[Dict]:
+        if not cls.is_enabled():
+            return None
+        return cache.get(cls.key(conversation_id))
+    
+    @classmethod
+    def set(cls, conversation_id, rows: List, last_sequence: int, budget: int,
+            summary_through: int = 0) -> Dict:
+        """Store rows (oldest first, contiguous up to last_sequence), returns the entry"""
+        entry = cls.trim({
+            'last_sequence': last_sequence,
+            'budget': budget,
+            'rows': [list(row) for row in rows],
+        }, summary_through)
+        if cls.is_enabled():
+            cache.set(cls.key(conversation_id), entry, timeout=settings.CONVERSATION_TIMEOUT)
+        return entry
+    
+    @classmethod
+    def append(cls, conversation, message) -> None:
+        """Add a just-written message to the conversation's entry, if it has one"""
+        if not cls.is_enabled():
+            return
+        
+        key = cls.key(conversation.pk)
+        entry = cache.get(key)
+        if entry is None:
+            return
+        
+        if entry['last_sequence'] != message.sequence - 1:
+            # Another writer got in between, rebuild on the next read
+            cache.delete(key)
+            return
+        
+        entry['rows'].append([message.sequence, message.role, message.content, message.token_count])
+        entry['last_sequence'] = message.sequence
+        cache.set(
+            key, cls.trim(entry, conversation.context_summary_through),
+            timeout=settings.CONVERSATION_TIMEOUT
+        )
+    
+    @classmethod
+    def invalidate(cls, conversation_id) -> None:
+        cache.delete(cls.key(conversation_id))
+    
+    @classmethod
+    def trim(cls, entry: Dict, summary_through: int = 0) -> Dict:
+        """Drop rows already summarized, then the oldest ones past the budget"""
+        rows = [row for row in entry['rows'] if row[0] > summary_through]
+        total = sum(row[3] for row in rows)
+        
+        # One more than MAX_CHAT_HISTORY, the newest row is the turn's own message
+        while rows and (total > entry['budget'] or len(rows) > settings.MAX_CHAT_HISTORY + 1):
+            total -= rows.pop(0)[3]
+        
+        entry['rows'] = rows
+        return entry
+    
+    @classmethod
+    def covers(cls, entry: Optional[Dict], before_sequence: int, budget: int) -> bool:
+        """Whether entry has every row a prompt ending before before_sequence needs"""
+        return (
+            entry is not None
+            and entry['last_sequence'] >= before_sequence - 1
+            and entry['budget'] >= budget
+        )
\ No newline at end of file
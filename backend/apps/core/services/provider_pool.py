@@ -0,0 +1,355 @@
+from collections import deque
+from typing import List, Dict, Optional
+from django.conf import settings
+import logging
+import threading
+import time
+
+from apps.core.exceptions import LLMRequestRejected
+from .llm_service import BaseLLMProvider
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderStats:
+    """Rolling latency and error samples of one provider"""
+    
+    def __init__(self, window: int):
+        self.samples = deque(maxlen=window)
+        self.lock = threading.Lock()
+    
+    def record(self, latency_ms: int, ok: bool):
+        with self.lock:
+            self.samples.append((latency_ms, ok))
+    
+    def snapshot(self) -> Dict:
+        with self.lock:
+            samples = list(self.samples)
+        
+        latencies = sorted(latency for latency, ok in samples if ok)
+        errors = sum(1 for _, ok in samples if not ok)
+        
+        return {
+            'samples': len(samples),
+            'error_rate': errors / len(samples) if samples else 0.0,
+            'p50_ms': self._percentile(latencies, 50),
+            'p95_ms': self._percentile(latencies, 95),
+        }
+    
+    @staticmethod
+    def _percentile(values: List[int], percentile: int) -> Optional[int]:
+        if not values:
+            return None
+        index = min(len(values) - 1, int(len(values) * percentile / 100))
+        return values[index]
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after too many failures, half-open after a cooldown
+    
+    Opens on FAILURE_THRESHOLD consecutive failures, or once the rolling
+    error rate reaches ERROR_RATE_THRESHOLD over at least MIN_SAMPLES
+    calls. While half-open a single trial call is let through; its
+    outcome closes or re-opens the breaker.
+    """
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, failure_threshold: int, error_rate_threshold: float,
+                 min_samples: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.trial_started_at = 0.0
+        self.lock = threading.Lock()
+    
+    def allow(self) -> bool:
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                self.state = self.HALF_OPEN
+                self.trial_in_flight = False
+            
+            # Half-open, one trial at a time (a trial that never reported back expires)
+            if self.trial_in_flight and time.monotonic() - self.trial_started_at < self.cooldown:
+                return False
+            self.trial_in_flight = True
+            self.trial_started_at = time.monotonic()
+            return True
+    
+    def record_success(self):
+        with self.lock:
+            self.consecutive_failures = 0
+            self.trial_in_flight = False
+            self.state = self.CLOSED
+    
+    def record_failure(self, stats: Dict):
+        with self.lock:
+            self.consecutive_failures += 1
+            self.trial_in_flight = False
+            
+            too_many_errors = (
+                stats['samples'] >= self.min_samples
+                and stats['error_rate'] >= self.error_rate_threshold
+            )
+            if (self.state == self.HALF_OPEN
+                    or self.consecutive_failures >= self.failure_threshold
+                    or too_many_errors):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+    
+    def release(self):
+        """Give back a half-open trial that was never attempted"""
+        with self.lock:
+            self.trial_in_flight = False
+
+
+class PoolMember:
+    """A registered provider with its rolling stats and breaker"""
+    
+    def __init__(self, name: str, provider: BaseLLMProvider, config: Dict):
+        self.name = name
+        self.provider = provider
+        self.stats = ProviderStats(config['WINDOW'])
+        self.breaker = CircuitBreaker(
+            failure_threshold=config['FAILURE_THRESHOLD'],
+            error_rate_threshold=config['ERROR_RATE_THRESHOLD'],
+            min_samples=config['MIN_SAMPLES'],
+            cooldown=config['COOLDOWN'],
+        )
+    
+    def score(self) -> float:
+        """
+        Lower is better: blended p50/p95 latency inflated by the error rate
+        
+        Members without enough samples score 0 so they get explored.
+        """
+        stats = self.stats.snapshot()
+        if stats['samples'] < self.breaker.min_samples:
+            return 0.0
+        if stats['p50_ms'] is None:
+            return float('inf')
+        
+        latency = (stats['p50_ms'] + stats['p95_ms']) / 2
+        return latency / max(1.0 - stats['error_rate'], 0.05)
+    
+    def record_success(self, latency_ms: int):
+        self.stats.record(latency_ms, True)
+        self.breaker.record_success()
+    
+    def record_failure(self, latency_ms: int):
+        self.stats.record(latency_ms, False)
+        self.breaker.record_failure(self.stats.snapshot())
+
+
+class ProviderPool(BaseLLMProvider):
+    """
+    Routes requests over several providers
+    
+    Each call goes to the available provider with the best rolling
+    latency/error score and fails over to the next one on error.
+    Providers whose circuit breaker is open are skipped, so a failing
+    backend costs one fast skip instead of a full timeout. Requests a
+    provider rejects as invalid (LLMRequestRejected) are raised as is,
+    they say nothing about the provider's health.
+    Stats are per process.
+    """
+    
+    DEFAULT_CONFIG = {
+        'WINDOW': 100,
+        'FAILURE_THRESHOLD': 5,
+        'ERROR_RATE_THRESHOLD': 0.5,
+        'MIN_SAMPLES': 10,
+        'COOLDOWN': 30,
+    }
+    
+    def __init__(self, config: Optional[Dict] = None):
+        self.config = {**self.DEFAULT_CONFIG, **(config or {})}
+        self.members: Dict[str, PoolMember] = {}
+    
+    def register(self, name: str, provider: BaseLLMProvider) -> None:
+        self.members[name] = PoolMember(name, provider, self.config)
+    
+    def is_available(self) -> bool:
+        """Check if at least one provider is configured"""
+        return any(member.provider.is_available() for member in self.members.values())
+    
+    def prewarm(self) -> None:
+        """Open connections of every provider that supports it"""
+        for member in self.members.values():
+            if hasattr(member.provider, 'prewarm'):
+                member.provider.prewarm()
+    
+    def get_stats(self) -> Dict[str, Dict]:
+        """Rolling stats and breaker state per provider"""
+        return {
+            name: {**member.stats.snapshot(), 'state': member.breaker.state}
+            for name, member in self.members.items()
+        }
+    
+    def _candidates(self) -> List[PoolMember]:
+        members = [m for m in self.members.values() if m.provider.is_available()]
+        return sorted(members, key=lambda member: member.score())
+    
+    def _attempts(self, method: str):
+        """Members to try in order, each one admitted by its breaker"""
+        for member in self._candidates():
+            if not hasattr(member.provider, method):
+                continue
+            if member.breaker.allow():
+                yield member
+    
+    def _no_provider_error(self, last_error: Optional[Exception]) -> RuntimeError:
+        if last_error is not None:
+            return RuntimeError(f"All LLM providers failed: {last_error}")
+        return RuntimeError("No LLM provider available (all circuits open)")
+    
+    def generate_response(self, messages: List[Dict[str, str]], **kwargs) -> Dict:
+        last_error = None
+        
+        for member in self._attempts('generate_response'):
+            started = time.monotonic()
+            try:
+                response = member.provider.generate_response(messages, **kwargs)
+            except LLMRequestRejected:
+                # The request's fault, another provider won't take it either
+                member.breaker.release()
+                raise
+            except Exception as e:
+                member.record_failure(int((time.monotonic() - started) * 1000))
+                logger.warning(f"LLM provider {member.name} failed, failing over: {e}")
+                last_error = e
+                continue
+            
+            member.record_success(int((time.monotonic() - started) * 1000))
+            response['provider'] = member.name
+            return response
+        
+        raise self._no_provider_error(last_error)
+    
+    async def agenerate_response(self, messages: List[Dict[str, str]], **kwargs) -> Dict:
+        last_error = None
+        
+        for member in self._attempts('agenerate_response'):
+            started = time.monotonic()
+            try:
+                response = await member.provider.agenerate_response(messages, **kwargs)
+            except LLMRequestRejected:
+                member.breaker.release()
+                raise
+            except Exception as e:
+                member.record_failure(int((time.monotonic() - started) * 1000))
+                logger.warning(f"LLM provider {member.name} failed, failing over: {e}")
+                last_error = e
+                continue
+            
+            member.record_success(int((time.monotonic() - started) * 1000))
+            response['provider'] = member.name
+            return response
+        
+        raise self._no_provider_error(last_error)
+    
+    def generate_streaming_response(self, messages: List[Dict[str, str]], **kwargs):
+        """
+        Stream from the best provider
+        
+        Fails over only until the first chunk arrives, time to first
+        chunk is what gets recorded as latency.
+        """
+        last_error = None
+        
+        for member in self._attempts('generate_streaming_response'):
+            started = time.monotonic()
+            first_chunk = True
+            upstream = member.provider.generate_streaming_response(messages, **kwargs)
+            try:
+                for chunk in upstream:
+                    if first_chunk:
+                        member.record_success(int((time.monotonic() - started) * 1000))
+                        first_chunk = False
+                    if isinstance(chunk, dict):
+                        # Final usage dict of the stream
+                        chunk = {**chunk, 'provider': member.name}
+                    yield chunk
+            except LLMRequestRejected:
+                # Released below like a stream that never started
+                raise
+            except Exception as e:
+                member.record_failure(int((time.monotonic() - started) * 1000))
+                if not first_chunk:
+                    raise
+                logger.warning(f"LLM provider {member.name} failed, failing over: {e}")
+                last_error = e
+                continue
+            finally:
+                # Closing us early (client went away) closes the provider stream too
+                upstream.close()
+                # Generator closed before the first chunk, don't leave a trial hanging
+                if first_chunk:
+                    member.breaker.release()
+            
+            if first_chunk:
+                member.record_success(int((time.monotonic() - started) * 1000))
+            return
+        
+        raise self._no_provider_error(last_error)
+    
+    async def agenerate_streaming_response(self, messages: List[Dict[str, str]], **kwargs):
+        """Async variant of generate_streaming_response"""
+        last_error = None
+        
+        for member in self._attempts('agenerate_streaming_response'):
+            started = time.monotonic()
+            first_chunk = True
+            upstream = member.provider.agenerate_streaming_response(messages, **kwargs)
+            try:
+                async for chunk in upstream:
+                    if first_chunk:
+                        member.record_success(int((time.monotonic() - started) * 1000))
+                        first_chunk = False
+                    if isinstance(chunk, dict):
+                        # Final usage dict of the stream
+                        chunk = {**chunk, 'provider': member.name}
+                    yield chunk
+            except LLMRequestRejected:
+                # Released below like a stream that never started
+                raise
+            except Exception as e:
+                member.record_failure(int((time.monotonic() - started) * 1000))
+                if not first_chunk:
+                    raise
+                logger.warning(f"LLM provider {member.name} failed, failing over: {e}")
+                last_error = e
+                continue
+            finally:
+                await upstream.aclose()
+                if first_chunk:
+                    member.breaker.release()
+            
+            if first_chunk:
+                member.record_success(int((time.monotonic() - started) * 1000))
+            return
+        
+        raise self._no_provider_error(last_error)
+
+
+def build_pool_from_settings() -> ProviderPool:
+    """Pool of the providers named in LLM_CONFIG['PROVIDERS']"""
+    from .llm_service import LLMService
+    
+    pool = ProviderPool(settings.LLM_CONFIG.get('POOL'))
+    for name in settings.LLM_CONFIG.get('PROVIDERS') or [settings.LLM_CONFIG.get('PROVIDER', 'groq')]:
+        pool.register(name, LLMService.create_provider(name))
+    return pool
\ No newline at end of file
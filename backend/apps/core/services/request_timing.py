@@ -0,0 +1,132 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, List, Optional
+from django.db import connection
+from django.db.backends.signals import connection_created
+import asyncio
+import time
+
+from apps.core.metrics import CHAT_REQUEST_SECONDS
+
+_current: ContextVar[Optional['RequestTimings']] = ContextVar('request_timings', default=None)
+
+
+def _time_query(execute, sql, params, many, context):
+    """Database execute wrapper, adds query time to the tracked request if any"""
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    
+    started = time.monotonic()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add_query(sql, time.monotonic() - started)
+
+
+def install_query_timer(connection, **kwargs):
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+connection_created.connect(install_query_timer)
+
+
+class RequestTimings:
+    """
+    Where the time of one chat request goes: database, LLM or the rest
+    
+    track() makes an instance current for the block (a context
+    variable, so it follows sync_to_async into the database thread).
+    Queries are timed by a wrapper on every database connection and
+    LLMService adds the time spent on provider calls. At the end the
+    split is observed in talkflow_chat_request_seconds by endpoint.
+    
+    Blocks nest: an inner instance (a chat view's) passes its queries
+    and LLM time on to the outer one (ProfilingMiddleware's). With
+    capture_queries, queries are also tallied by SQL (without
+    parameters), so a query repeated per row shows up as one entry
+    with a high count.
+    """
+    
+    def __init__(self, parent: Optional['RequestTimings'] = None, capture_queries: bool = False):
+        self.parent = parent
+        self.started = time.monotonic()
+        self.db = 0.0
+        self.llm = 0.0
+        self.queries = 0
+        # SQL -> [count, seconds]
+        self.query_stats: Optional[Dict[str, List]] = {} if capture_queries else None
+    
+    def add_query(self, sql: str, seconds: float) -> None:
+        self.db += seconds
+        self.queries += 1
+        if self.query_stats is not None:
+            stats = self.query_stats.setdefault(sql, [0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+        if self.parent is not None:
+            self.parent.add_query(sql, seconds)
+    
+    def add_llm(self, seconds: float) -> None:
+        self.llm += seconds
+        if self.parent is not None:
+            self.parent.add_llm(seconds)
+    
+    @classmethod
+    def current(cls) -> Optional['RequestTimings']:
+        return _current.get()
+    
+    @classmethod
+    @contextmanager
+    def track(cls, endpoint: Optional[str] = None, capture_queries: bool = False):
+        """Time the block, observed under endpoint unless that's None"""
+        # Connections opened before this module was imported missed the signal
+        install_query_timer(connection)
+        timings = cls(parent=_current.get(), capture_queries=capture_queries)
+        token = _current.set(timings)
+        try:
+            yield timings
+        finally:
+            _current.reset(token)
+            if endpoint is not None:
+                timings.observe(endpoint)
+    
+    @classmethod
+    def timed(cls, endpoint: str):
+        """Decorator running a view (sync or async) or function under track()"""
+        def decorator(func):
+            if asyncio.iscoroutinefunction(func):
+                @wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with cls.track(endpoint):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+            
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with cls.track(endpoint):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+    
+    @classmethod
+    @contextmanager
+    def llm_call(cls):
+        """Count the block as LLM time of the current request"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            timings = _current.get()
+            if timings is not None:
+                timings.add_llm(time.monotonic() - started)
+    
+    def observe(self, endpoint: str) -> None:
+        total = time.monotonic() - self.started
+        CHAT_REQUEST_SECONDS.labels(endpoint=endpoint, component='db').observe(self.db)
+        CHAT_REQUEST_SECONDS.labels(endpoint=endpoint, component='llm').observe(self.llm)
+        CHAT_REQUEST_SECONDS.labels(endpoint=endpoint, component='other').observe(
+            max(0.0, total - self.db - self.llm)
+        )
\ No newline at end of file
@@ -0,0 +1,88 @@
+from typing import Dict, List, Optional
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+import hashlib
+import json
+import re
+
+from apps.core.metrics import LLM_RESPONSE_CACHE_REQUESTS
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+class ResponseCache:
+    """
+    Exact-match cache of LLM responses
+    
+    Opt-in: used when enabled for the deployment and the request is
+    deterministic (temperature 0), or when the request asks for it.
+    Entries live in the 'llm_responses' cache alias, which bounds their
+    number and TTL and evicts least recently used entries first.
+    """
+    
+    KEY_PREFIX = 'llm:response'
+    
+    @classmethod
+    def get_cache(cls):
+        return caches[settings.LLM_CONFIG['RESPONSE_CACHE']['ALIAS']]
+    
+    @classmethod
+    def should_use(cls, temperature: float, requested: Optional[bool] = None) -> bool:
+        """requested is the per-request flag, None defers to the deployment setting"""
+        if requested is not None:
+            return requested
+        
+        return settings.LLM_CONFIG['RESPONSE_CACHE']['ENABLED'] and temperature == 0
+    
+    @classmethod
+    def normalize_messages(cls, messages: List[Dict[str, str]]) -> List[List[str]]:
+        return [
+            [message['role'].strip().lower(), WHITESPACE_RE.sub(' ', message['content']).strip()]
+            for message in messages
+        ]
+    
+    @classmethod
+    def make_key(cls, model: Optional[str], messages, max_tokens, temperature, **kwargs) -> str:
+        payload = json.dumps(
+            [model, cls.normalize_messages(messages), max_tokens, temperature, kwargs],
+            cls=DjangoJSONEncoder, sort_keys=True, separators=(',', ':')
+        )
+        return f"{cls.KEY_PREFIX}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+    
+    @classmethod
+    def get(cls, key: str) -> Optional[Dict]:
+        response = cls.get_cache().get(key)
+        LLM_RESPONSE_CACHE_REQUESTS.labels(result='hit' if response is not None else 'miss').inc()
+        if response is None:
+            return None
+        return {**response, 'cached': True}
+    
+    @classmethod
+    def set(cls, key: str, response: Dict) -> None:
+        # Truncated or filtered completions are not worth replaying
+        if response.get('finish_reason') != 'stop':
+            return
+        
+        cls.get_cache().set(key, {
+            name: value for name, value in response.items()
+            if name not in ('latency_ms', 'coalesced', 'cached')
+        })
+    
+    @classmethod
+    async def aget(cls, key: str) -> Optional[Dict]:
+        response = await cls.get_cache().aget(key)
+        LLM_RESPONSE_CACHE_REQUESTS.labels(result='hit' if response is not None else 'miss').inc()
+        if response is None:
+            return None
+        return {**response, 'cached': True}
+    
+    @classmethod
+    async def aset(cls, key: str, response: Dict) -> None:
+        if response.get('finish_reason') != 'stop':
+            return
+        
+        await cls.get_cache().aset(key, {
+            name: value for name, value in response.items()
+            if name not in ('latency_ms', 'coalesced', 'cached')
+        })
\ No newline at end of file
@@ -0,0 +1,178 @@
+from typing import List, Dict
+from django.conf import settings
+from django.db import connection
+import re
+
+from apps.chat.models import Conversation, ChatMessage
+
+# SQLite FTS5 table fed by triggers on chat_chatmessage (see chat migrations 0005, 0010 and 0011)
+SQLITE_FTS_TABLE = 'chat_message_fts'
+# Postgres GIN expression index over to_tsvector(content)
+POSTGRES_SEARCH_CONFIG = 'english'
+POSTGRES_SEARCH_INDEX = 'chat_message_search_idx'
+
+SNIPPET_START = '<mark>'
+SNIPPET_END = '</mark>'
+
+
+class SearchService:
+    """
+    Full-text search over a user's conversations
+    
+    Backed by SQLite FTS5 or a Postgres tsvector index depending on the
+    database in use; both are maintained incrementally by the database
+    as messages are inserted, edited and deleted. Other backends fall back to icontains.
+    """
+    
+    SNIPPET_WORDS = 12
+    
+    @classmethod
+    def search_conversations(cls, user, query: str) -> List[Dict]:
+        """
+        Ranked conversation hits for query
+        
+        Returns:
+            List of dicts with 'conversation_id', 'message_id', 'rank',
+            'snippet', best match first, one entry per conversation
+        """
+        terms = re.findall(r'\w+', query)
+        if not terms:
+            return []
+        
+        limit = settings.SEARCH_MAX_RESULTS
+        
+        if connection.vendor == 'sqlite':
+            message_hits = cls._search_sqlite(user, terms, limit)
+        elif connection.vendor == 'postgresql':
+            message_hits = cls._search_postgres(user, terms, limit)
+        else:
+            message_hits = cls._search_fallback(user, terms, limit)
+        
+        title_hits = cls._search_titles(user, terms, limit)
+        return cls._merge_hits(title_hits + message_hits, limit)
+    
+    @classmethod
+    def _search_sqlite(cls, user, terms: List[str], limit: int) -> List[Dict]:
+        # Quote every term so user input can't inject FTS5 syntax, prefix-match the last one
+        fts_query = ' '.join(f'"{term}"' for term in terms) + '*'
+        
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT f.conversation_id, f.message_id,
+                       snippet({SQLITE_FTS_TABLE}, 0, %s, %s, '…', %s),
+                       bm25({SQLITE_FTS_TABLE}) AS rank
+                FROM {SQLITE_FTS_TABLE} f
+                JOIN chat_chatmessage m ON m.id = f.message_id
+                JOIN chat_conversation c ON c.id = f.conversation_id
+                WHERE {SQLITE_FTS_TABLE} MATCH %s
+                  AND c.user_id = %s AND c.is_active
+                ORDER BY rank
+                LIMIT %s
+                """,
+                [SNIPPET_START, SNIPPET_END, cls.SNIPPET_WORDS, fts_query, user.id, limit]
+            )
+            rows = cursor.fetchall()
+        
+        # bm25() is lower-is-better, flip it so every backend ranks higher-is-better
+        return [
+            {
+                'conversation_id': Conversation._meta.pk.to_python(conversation_id),
+                'message_id': ChatMessage._meta.pk.to_python(message_id),
+                'snippet': snippet,
+                'rank': -rank,
+            }
+            for conversation_id, message_id, snippet, rank in rows
+        ]
+    
+    @classmethod
+    def _search_postgres(cls, user, terms: List[str], limit: int) -> List[Dict]:
+        from django.contrib.postgres.search import (
+            SearchHeadline, SearchQuery, SearchRank, SearchVector
+        )
+        
+        # Must match the indexed expression exactly for the GIN index to be used
+        vector = SearchVector('content', config=POSTGRES_SEARCH_CONFIG)
+        search_query = SearchQuery(' '.join(terms), config=POSTGRES_SEARCH_CONFIG)
+        
+        rows = ChatMessage.objects.annotate(
+            search=vector,
+        ).filter(
+            search=search_query,
+            conversation__user=user,
+            conversation__is_active=True,
+        ).annotate(
+            rank=SearchRank(vector, search_query),
+            snippet=SearchHeadline(
+                'content', search_query, config=POSTGRES_SEARCH_CONFIG,
+                start_sel=SNIPPET_START, stop_sel=SNIPPET_END,
+                max_words=cls.SNIPPET_WORDS, min_words=cls.SNIPPET_WORDS // 2,
+            ),
+        ).order_by('-rank').values_list(
+            'conversation_id', 'id', 'snippet', 'rank'
+        )[:limit]
+        
+        return [
+            {
+                'conversation_id': conversation_id,
+                'message_id': message_id,
+                'snippet': snippet,
+                'rank': rank,
+            }
+            for conversation_id, message_id, snippet, rank in rows
+        ]
+    
+    @classmethod
+    def _search_fallback(cls, user, terms: List[str], limit: int) -> List[Dict]:
+        messages = ChatMessage.objects.filter(
+            conversation__user=user,
+            conversation__is_active=True,
+        )
+        for term in terms:
+            messages = messages.filter(content__icontains=term)
+        
+        rows = messages.order_by('-created_at').values_list(
+            'conversation_id', 'id', 'content'
+        )[:limit]
+        
+        return [
+            {
+                'conversation_id': conversation_id,
+                'message_id': message_id,
+                'snippet': content[:Conversation.PREVIEW_LENGTH],
+                'rank': 0.0,
+            }
+            for conversation_id, message_id, content in rows
+        ]
+    
+    @classmethod
+    def _search_titles(cls, user, terms: List[str], limit: int) -> List[Dict]:
+        # Bounded by the (user, is_active) index, titles are short
+        conversations = Conversation.objects.filter(user=user, is_active=True)
+        for term in terms:
+            conversations = conversations.filter(title__icontains=term)
+        
+        return [
+            {
+                'conversation_id': conversation_id,
+                'message_id': None,
+                'snippet': title,
+                'rank': 0.0,
+                'title_match': True,
+            }
+            for conversation_id, title in conversations.values_list('id', 'title')[:limit]
+        ]
+    
+    @classmethod
+    def _merge_hits(cls, hits: List[Dict], limit: int) -> List[Dict]:
+        """Keep the best hit per conversation, title matches first, then by rank"""
+        def sort_key(hit):
+            return hit.get('title_match', False), hit['rank']
+        
+        best = {}
+        for hit in hits:
+            current = best.get(hit['conversation_id'])
+            if current is None or sort_key(hit) > sort_key(current):
+                best[hit['conversation_id']] = hit
+        
+        return sorted(best.values(), key=sort_key, reverse=True)[:limit]
\ No newline at end of file
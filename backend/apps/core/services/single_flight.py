@@ -0,0 +1,195 @@
+from typing import Callable, Dict, Optional
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from apps.core.metrics import LLM_SINGLE_FLIGHT_CALLS, LLM_COALESCED_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """An in-flight call that followers in the same process wait on"""
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent LLM calls into one upstream call
+    
+    Within a process, followers wait on the leader's call directly.
+    Across workers, the leader holds a lock in the ALIAS cache and
+    publishes its result there for the followers polling it. That
+    cache is Redis when REDIS_URL is set; otherwise it's per process
+    and only calls within one worker are coalesced. A result
+    is only read by requests that found the lock taken, so this never
+    acts as a response cache. If the leader fails, followers make their
+    own call.
+    """
+    
+    KEY_PREFIX = 'llm:single_flight'
+    
+    _calls: Dict[str, _Call] = {}
+    _async_calls: Dict[str, asyncio.Future] = {}
+    _lock = threading.Lock()
+    
+    @classmethod
+    def make_key(cls, model: Optional[str], messages, max_tokens, temperature, **kwargs) -> str:
+        payload = json.dumps(
+            [model, messages, max_tokens, temperature, kwargs],
+            cls=DjangoJSONEncoder, sort_keys=True, separators=(',', ':')
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    @classmethod
+    def get_config(cls) -> Dict:
+        config = {
+            'ENABLED': True,
+            # Longer than any upstream call with its retries, so a dead leader's lock expires
+            'LOCK_TIMEOUT': settings.LLM_CONFIG.get('RETRY', {}).get(
+                'TOTAL_TIMEOUT', settings.LLM_CONFIG.get('TIMEOUT', 30)
+            ) + 5,
+            'RESULT_TTL': 10,
+            'POLL_INTERVAL': 0.05,
+            'ALIAS': 'single_flight',
+        }
+        config.update(settings.LLM_CONFIG.get('SINGLE_FLIGHT', {}))
+        return config
+    
+    @classmethod
+    def is_enabled(cls) -> bool:
+        return cls.get_config()['ENABLED']
+    
+    @classmethod
+    def _coalesced(cls, response: Dict, scope: str) -> Dict:
+        LLM_COALESCED_REQUESTS.labels(scope=scope).inc()
+        return {**response, 'coalesced': True}
+    
+    @classmethod
+    def do(cls, key: str, fn: Callable[[], Dict]) -> Dict:
+        """Run fn once per key across concurrent callers, return its result"""
+        with cls._lock:
+            call = cls._calls.get(key)
+            leader = call is None
+            if leader:
+                call = cls._calls[key] = _Call()
+        
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return cls._coalesced(call.result, 'process')
+        
+        try:
+            call.result = cls._do_shared(key, fn)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with cls._lock:
+                cls._calls.pop(key, None)
+            call.done.set()
+    
+    @classmethod
+    def _do_shared(cls, key: str, fn: Callable[[], Dict]) -> Dict:
+        config = cls.get_config()
+        cache = caches[config['ALIAS']]
+        lock_key = f"{cls.KEY_PREFIX}:lock:{key}"
+        result_key = f"{cls.KEY_PREFIX}:result:{key}"
+        
+        if not cache.add(lock_key, 1, timeout=config['LOCK_TIMEOUT']):
+            # Another worker is leading, wait for its result while it holds the lock
+            deadline = time.monotonic() + config['LOCK_TIMEOUT']
+            while time.monotonic() < deadline:
+                response = cache.get(result_key)
+                if response is not None:
+                    return cls._coalesced(response, 'shared')
+                if cache.get(lock_key) is None:
+                    break
+                time.sleep(config['POLL_INTERVAL'])
+            
+            logger.info("Single-flight leader gave up, calling the LLM directly")
+            LLM_SINGLE_FLIGHT_CALLS.inc()
+            return fn()
+        
+        try:
+            LLM_SINGLE_FLIGHT_CALLS.inc()
+            response = fn()
+            cache.set(result_key, response, timeout=config['RESULT_TTL'])
+            return response
+        finally:
+            cache.delete(lock_key)
+    
+    @classmethod
+    async def ado(cls, key: str, fn: Callable) -> Dict:
+        """Async variant of do, fn returns an awaitable"""
+        loop = asyncio.get_running_loop()
+        future = cls._async_calls.get(key)
+        
+        if future is not None and future.get_loop() is loop:
+            try:
+                # shield so a cancelled follower doesn't cancel the leader's call
+                response = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The leader was cancelled, not us, run the call ourselves
+                return await cls.ado(key, fn)
+            return cls._coalesced(response, 'process')
+        
+        future = cls._async_calls[key] = loop.create_future()
+        try:
+            response = await cls._ado_shared(key, fn)
+            future.set_result(response)
+            return response
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Followers re-raise it, don't warn about an unretrieved exception
+            future.exception()
+            raise
+        finally:
+            if cls._async_calls.get(key) is future:
+                del cls._async_calls[key]
+    
+    @classmethod
+    async def _ado_shared(cls, key: str, fn: Callable) -> Dict:
+        config = cls.get_config()
+        cache = caches[config['ALIAS']]
+        lock_key = f"{cls.KEY_PREFIX}:lock:{key}"
+        result_key = f"{cls.KEY_PREFIX}:result:{key}"
+        
+        if not await cache.aadd(lock_key, 1, timeout=config['LOCK_TIMEOUT']):
+            deadline = time.monotonic() + config['LOCK_TIMEOUT']
+            while time.monotonic() < deadline:
+                response = await cache.aget(result_key)
+                if response is not None:
+                    return cls._coalesced(response, 'shared')
+                if await cache.aget(lock_key) is None:
+                    break
+                await asyncio.sleep(config['POLL_INTERVAL'])
+            
+            logger.info("Single-flight leader gave up, calling the LLM directly")
+            LLM_SINGLE_FLIGHT_CALLS.inc()
+            return await fn()
+        
+        try:
+            LLM_SINGLE_FLIGHT_CALLS.inc()
+            response = await fn()
+            await cache.aset(result_key, response, timeout=config['RESULT_TTL'])
+            return response
+        finally:
+            await cache.adelete(lock_key)
\ No newline at end of file
@@ -0,0 +1,332 @@
+from collections import deque
+from typing import Callable, Dict, Iterator, AsyncIterator, List, Optional, Tuple
+from django.conf import settings
+from django.core.cache import cache
+import asyncio
+import threading
+import time
+import uuid
+
+from .streaming import sse_event
+
+
+class StreamGone(Exception):
+    """The stream expired or the requested events fell out of the replay buffer"""
+
+
+class StreamBuffer:
+    """
+    Numbered, replayable events of one chat stream, kept in the cache
+    
+    The generation writes every event here and clients read them back,
+    so a client that reconnects with Last-Event-ID resumes where it left
+    off, and the generation doesn't depend on any client staying
+    connected. Only the last STREAM_REPLAY_EVENTS events are kept, for
+    STREAM_REPLAY_TTL seconds. Works across workers when the cache is
+    shared (Redis).
+    
+    Event IDs are "<stream_id>:<seq>", seq counting from 1.
+    
+    Readers keep a heartbeat key alive while they follow the stream.
+    Once it has been gone for STREAM_CANCEL_GRACE seconds the stream is
+    abandoned and the generation stops, leaving that long to reconnect.
+    
+    The buffer returned by create() also hands its events to readers in
+    this process directly, waking them on every append, so the client
+    that started the stream gets each frame as soon as it's written.
+    Readers that got their buffer from get() (Last-Event-ID resumes,
+    other workers) poll the cache every STREAM_POLL_INTERVAL.
+    
+    iter_events() can be given a finished() callback for streams whose
+    writer may not reach the buffer (a worker on another cache). It's
+    checked while the stream is idle, and a final event it returns ends
+    the stream.
+    """
+    
+    KEY_PREFIX = 'sse'
+    # Seconds between heartbeat writes of a reader / abandonment checks of the writer
+    HEARTBEAT_INTERVAL = 1
+    
+    def __init__(self, stream_id: str, user_id: int):
+        self.stream_id = stream_id
+        self.user_id = user_id
+        self.last_seq = 0
+        self.max_events = settings.STREAM_REPLAY_EVENTS
+        self.ttl = settings.STREAM_REPLAY_TTL
+        self.heartbeat_at = 0.0
+        self.checked_at = time.monotonic()
+        self.finished_checked_at = 0.0
+        # Delivery to readers in this process, only for buffers from create()
+        self.local_events = None
+        self.local_done = False
+        self.local_ready = threading.Condition()
+        self.local_waiters = []
+    
+    @property
+    def meta_key(self) -> str:
+        return f"{self.KEY_PREFIX}:{self.stream_id}:meta"
+    
+    def event_key(self, seq: int) -> str:
+        return f"{self.KEY_PREFIX}:{self.stream_id}:{seq}"
+    
+    @property
+    def heartbeat_key(self) -> str:
+        return f"{self.KEY_PREFIX}:{self.stream_id}:reader"
+    
+    def event_id(self, seq: int) -> str:
+        return f"{self.stream_id}:{seq}"
+    
+    @classmethod
+    def create(cls, user_id: int, stream_id: Optional[str] = None) -> 'StreamBuffer':
+        buffer = cls(stream_id or uuid.uuid4().hex, user_id)
+        buffer.local_events = deque(maxlen=buffer.max_events)
+        # The creating request reads it right away
+        buffer.heartbeat()
+        buffer.append({'stream_id': buffer.stream_id})
+        return buffer
+    
+    @classmethod
+    def get(cls, stream_id: str, user_id: int) -> Optional['StreamBuffer']:
+        """Buffer of a live or recently finished stream owned by user_id"""
+        buffer = cls(stream_id, user_id)
+        meta = cache.get(buffer.meta_key)
+        if meta is None or meta['user_id'] != user_id:
+            return None
+        # A writer picking the stream up (chat jobs) continues the numbering
+        buffer.last_seq = meta['last_seq']
+        return buffer
+    
+    @staticmethod
+    def parse_event_id(event_id: Optional[str]) -> Tuple[Optional[str], int]:
+        """(stream_id, seq) from a Last-Event-ID value, (None, 0) if unusable"""
+        stream_id, _, seq = (event_id or '').strip().rpartition(':')
+        if not stream_id or not seq.isdigit():
+            return None, 0
+        return stream_id, int(seq)
+    
+    # Writer side, one generation per stream
+    
+    def append(self, data: Dict, done: bool = False) -> int:
+        self.last_seq += 1
+        # Event first, then the meta that makes it visible to readers
+        cache.set(self.event_key(self.last_seq), data, timeout=self.ttl)
+        cache.set(
+            self.meta_key,
+            {'user_id': self.user_id, 'last_seq': self.last_seq, 'done': done},
+            timeout=self.ttl
+        )
+        if self.last_seq > self.max_events:
+            cache.delete(self.event_key(self.last_seq - self.max_events))
+        if self.local_events is not None:
+            self._deliver_local(self.last_seq, data, done)
+        return self.last_seq
+    
+    def _deliver_local(self, seq: int, data: Dict, done: bool) -> None:
+        with self.local_ready:
+            self.local_events.append((seq, data))
+            self.local_done = done
+            self.local_ready.notify_all()
+            for loop, wakeup in self.local_waiters:
+                loop.call_soon_threadsafe(wakeup.set)
+    
+    def finish(self, data: Dict) -> int:
+        return self.append(data, done=True)
+    
+    def is_abandoned(self) -> bool:
+        """No reader for the grace period, checked at most once per HEARTBEAT_INTERVAL"""
+        now = time.monotonic()
+        if now - self.checked_at < self.HEARTBEAT_INTERVAL:
+            return False
+        self.checked_at = now
+        return cache.get(self.heartbeat_key) is None
+    
+    async def ais_abandoned(self) -> bool:
+        now = time.monotonic()
+        if now - self.checked_at < self.HEARTBEAT_INTERVAL:
+            return False
+        self.checked_at = now
+        return await cache.aget(self.heartbeat_key) is None
+    
+    # Reader side, any number of clients
+    
+    def _heartbeat_due(self) -> bool:
+        now = time.monotonic()
+        if now - self.heartbeat_at < self.HEARTBEAT_INTERVAL:
+            return False
+        self.heartbeat_at = now
+        return True
+    
+    def heartbeat(self) -> None:
+        if self._heartbeat_due():
+            cache.set(
+                self.heartbeat_key, 1,
+                timeout=settings.STREAM_CANCEL_GRACE + self.HEARTBEAT_INTERVAL
+            )
+    
+    async def aheartbeat(self) -> None:
+        if self._heartbeat_due():
+            await cache.aset(
+                self.heartbeat_key, 1,
+                timeout=settings.STREAM_CANCEL_GRACE + self.HEARTBEAT_INTERVAL
+            )
+    
+    def _read_new(self, meta: Dict, after: int) -> Dict[int, Dict]:
+        first_kept = max(1, meta['last_seq'] - self.max_events + 1)
+        if after + 1 < first_kept:
+            raise StreamGone("Stream events are no longer available")
+        return {seq: self.event_key(seq) for seq in range(after + 1, meta['last_seq'] + 1)}
+    
+    def _check_finished(self, finished: Optional[Callable[[], Optional[Dict]]]) -> Optional[Dict]:
+        """Final event from finished(), called at most once per HEARTBEAT_INTERVAL"""
+        now = time.monotonic()
+        if finished is None or now - self.finished_checked_at < self.HEARTBEAT_INTERVAL:
+            return None
+        self.finished_checked_at = now
+        return finished()
+    
+    def _local_pending(self, after: int) -> bool:
+        return self.local_done or self.local_events[-1][0] > after
+    
+    def _take_local(self, after: int) -> Tuple[List[Tuple[int, Dict]], bool]:
+        """Locally delivered events after seq `after`, and whether the stream is done"""
+        if self.local_events[0][0] > after + 1:
+            raise StreamGone("Stream events are no longer available")
+        return [(seq, data) for seq, data in self.local_events if seq > after], self.local_done
+    
+    def _iter_local(self, after: int) -> Iterator[Tuple[int, Dict]]:
+        idle_deadline = time.monotonic() + settings.STREAM_IDLE_TIMEOUT
+        
+        while True:
+            self.heartbeat()
+            with self.local_ready:
+                # Woken by append(), the timeout keeps the heartbeat going
+                self.local_ready.wait_for(lambda: self._local_pending(after), self.HEARTBEAT_INTERVAL)
+                events, done = self._take_local(after)
+            
+            if events:
+                for seq, data in events:
+                    yield seq, data
+                after = events[-1][0]
+                idle_deadline = time.monotonic() + settings.STREAM_IDLE_TIMEOUT
+            elif done:
+                return
+            elif time.monotonic() > idle_deadline:
+                raise StreamGone("Stream stalled")
+    
+    async def _aiter_local(self, after: int) -> AsyncIterator[Tuple[int, Dict]]:
+        idle_deadline = time.monotonic() + settings.STREAM_IDLE_TIMEOUT
+        # append() runs on another thread, it sets wakeup through the loop
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        wakeup = waiter[1]
+        with self.local_ready:
+            self.local_waiters.append(waiter)
+        
+        try:
+            while True:
+                await self.aheartbeat()
+                wakeup.clear()
+                with self.local_ready:
+                    events, done = self._take_local(after)
+                
+                if events:
+                    for seq, data in events:
+                        yield seq, data
+                    after = events[-1][0]
+                    idle_deadline = time.monotonic() + settings.STREAM_IDLE_TIMEOUT
+                elif done:
+                    return
+                elif time.monotonic() > idle_deadline:
+                    raise StreamGone("Stream stalled")
+                else:
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), self.HEARTBEAT_INTERVAL)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            with self.local_ready:
+                self.local_waiters.remove(waiter)
+    
+    def iter_events(self, after: int = 0,
+                    finished: Optional[Callable[[], Optional[Dict]]] = None) -> Iterator[Tuple[int, Dict]]:
+        """(seq, data) of events after seq `after`, following the stream until it's done"""
+        if self.local_events is not None:
+            # The writer is in this process and reaches the buffer, finished isn't needed
+            yield from self._iter_local(after)
+            return
+        
+        poll_interval = settings.STREAM_POLL_INTERVAL
+        idle_deadline = time.monotonic() + settings.STREAM_IDLE_TIMEOUT
+        
+        while True:
+            # Only runs while the client keeps consuming, stops once it's gone
+            self.heartbeat()
+            meta = cache.get(self.meta_key)
+            if meta is None:
+                raise StreamGone("Stream expired")
+            
+            if meta['last_seq'] > after:
+                keys = self._read_new(meta, after)
+                events = cache.get_many(list(keys.values()))
+                for seq, key in keys.items():
+                    if key not in events:
+                        raise StreamGone("Stream events are no longer available")
+                    yield seq, events[key]
+                after = meta['last_seq']
+                idle_deadline = time.monotonic() + settings.STREAM_IDLE_TIMEOUT
+            elif meta['done']:
+                return
+            else:
+                final = self._check_finished(finished)
+                if final is not None:
+                    yield after + 1, final
+                    return
+                if time.monotonic() > idle_deadline:
+                    raise StreamGone("Stream stalled")
+                time.sleep(poll_interval)
+    
+    async def aiter_events(self, after: int = 0) -> AsyncIterator[Tuple[int, Dict]]:
+        """Async variant of iter_events"""
+        if self.local_events is not None:
+            async for seq, data in self._aiter_local(after):
+                yield seq, data
+            return
+        
+        poll_interval = settings.STREAM_POLL_INTERVAL
+        idle_deadline = time.monotonic() + settings.STREAM_IDLE_TIMEOUT
+        
+        while True:
+            await self.aheartbeat()
+            meta = await cache.aget(self.meta_key)
+            if meta is None:
+                raise StreamGone("Stream expired")
+            
+            if meta['last_seq'] > after:
+                keys = self._read_new(meta, after)
+                events = await cache.aget_many(list(keys.values()))
+                for seq, key in keys.items():
+                    if key not in events:
+                        raise StreamGone("Stream events are no longer available")
+                    yield seq, events[key]
+                after = meta['last_seq']
+                idle_deadline = time.monotonic() + settings.STREAM_IDLE_TIMEOUT
+            elif meta['done']:
+                return
+            elif time.monotonic() > idle_deadline:
+                raise StreamGone("Stream stalled")
+            else:
+                await asyncio.sleep(poll_interval)
+    
+    def iter_sse(self, after: int = 0,
+                 finished: Optional[Callable[[], Optional[Dict]]] = None) -> Iterator[str]:
+        try:
+            for seq, data in self.iter_events(after, finished):
+                yield sse_event(data, self.event_id(seq))
+        except StreamGone as e:
+            yield sse_event({'error': str(e)})
+    
+    async def aiter_sse(self, after: int = 0) -> AsyncIterator[str]:
+        try:
+            async for seq, data in self.aiter_events(after):
+                yield sse_event(data, self.event_id(seq))
+        except StreamGone as e:
+            yield sse_event({'error': str(e)})
\ No newline at end of file
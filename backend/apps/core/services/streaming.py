@@ -0,0 +1,101 @@
+from typing import Dict, List, Optional, Union
+from django.conf import settings
+import json
+import time
+
+from .context_builder import ContextBuilder
+
+
+def sse_event(data: Dict, event_id: Optional[str] = None) -> str:
+    """One Server-Sent Events frame"""
+    frame = f"data: {json.dumps(data, separators=(',', ':'))}\n\n"
+    if event_id is not None:
+        frame = f"id: {event_id}\n{frame}"
+    return frame
+
+
+class StreamAccumulator:
+    """
+    Turns a provider stream into frames of text and a final LLM response
+    
+    Text pieces are coalesced into one frame until STREAM_FLUSH_CHARS
+    characters are pending or STREAM_FLUSH_INTERVAL seconds have passed
+    since the last frame, instead of one frame per token. The full text
+    is kept as a list of pieces and joined once.
+    
+    Providers end their stream with a dict of usage data; if one
+    doesn't (or the stream is cancelled first), tokens are estimated.
+    """
+    
+    def __init__(self, prompt_tokens: int = 0):
+        # Estimate, used when the provider doesn't report usage
+        self.prompt_tokens = prompt_tokens
+        self.flush_chars = settings.STREAM_FLUSH_CHARS
+        self.flush_interval = settings.STREAM_FLUSH_INTERVAL
+        self.parts: List[str] = []
+        self.pending: List[str] = []
+        self.pending_chars = 0
+        self.result: Dict = {}
+        self.started = time.monotonic()
+        self.last_flush = self.started
+        self.first_token_at: Optional[float] = None
+    
+    def feed(self, item: Union[str, Dict]) -> Optional[str]:
+        """Add a stream item, returns the text of a frame when one is due"""
+        if isinstance(item, dict):
+            self.result.update(item)
+            return None
+        
+        if not item:
+            return None
+        
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+        self.parts.append(item)
+        self.pending.append(item)
+        self.pending_chars += len(item)
+        
+        if (self.pending_chars >= self.flush_chars
+                or time.monotonic() - self.last_flush >= self.flush_interval):
+            return self.flush()
+        return None
+    
+    def flush(self) -> Optional[str]:
+        """Everything pending as one frame of text, None if nothing is"""
+        if not self.pending:
+            return None
+        
+        frame = ''.join(self.pending)
+        self.pending = []
+        self.pending_chars = 0
+        self.last_flush = time.monotonic()
+        return frame
+    
+    def cancel(self) -> None:
+        """Mark the reply as cut short, usage will be estimated"""
+        self.result = {
+            key: value for key, value in self.result.items()
+            if key not in ('tokens_used', 'prompt_tokens', 'completion_tokens')
+        }
+        self.result['finish_reason'] = 'cancelled'
+    
+    @property
+    def content(self) -> str:
+        return ''.join(self.parts)
+    
+    def get_response(self, default_model: Optional[str] = None) -> Dict:
+        """LLM response dict in the shape LLMService.generate_chat_response returns"""
+        content = self.content
+        response = {'model': default_model, 'finish_reason': 'stop', **self.result}
+        response['content'] = content
+        response['latency_ms'] = int((time.monotonic() - self.started) * 1000)
+        
+        if self.first_token_at is not None:
+            response['ttft_ms'] = int((self.first_token_at - self.started) * 1000)
+        
+        if not response.get('completion_tokens'):
+            response.setdefault('prompt_tokens', self.prompt_tokens)
+            response['completion_tokens'] = ContextBuilder.estimate_tokens(content)
+            response['tokens_used'] = response['prompt_tokens'] + response['completion_tokens']
+        
+        return response
\ No newline at end of file
@@ -0,0 +1,183 @@
+from typing import Dict, List
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+import logging
+
+from apps.chat.models import Conversation
+from .context_builder import ContextBuilder
+
+logger = logging.getLogger(__name__)
+
+
+class SummaryService:
+    """
+    Rolling summary of the older turns of long conversations
+    
+    Once the messages after the summary add up to TRIGGER_TOKENS, a
+    Celery task folds all but the newest KEEP_RECENT_TOKENS of them into
+    Conversation.context_summary, at most CHUNK_TOKENS per LLM call.
+    ContextBuilder then sends the summary as a system message in place
+    of the folded messages, so prompts level off instead of growing
+    with the conversation. Messages themselves are never changed.
+    """
+    
+    KEY_PREFIX = 'conversation:summary'
+    
+    SYSTEM_PROMPT = (
+        "You maintain a running summary of a conversation between a user and "
+        "an AI assistant. Merge the new messages into the existing summary. "
+        "Keep facts, decisions, names, numbers, code identifiers, open questions "
+        "and the user's stated preferences; drop greetings and filler. "
+        "Write in the third person. Reply with the updated summary only."
+    )
+    
+    @classmethod
+    def get_config(cls) -> Dict:
+        config = {
+            'ENABLED': True,
+            'TRIGGER_TOKENS': 3000,
+            'KEEP_RECENT_TOKENS': 1500,
+            'CHUNK_TOKENS': 6000,
+            'MAX_TOKENS': 512,
+            'TEMPERATURE': 0.2,
+            # A summarization that never finished stops blocking new ones after this
+            'LOCK_TIMEOUT': 300,
+        }
+        config.update(settings.LLM_CONFIG.get('SUMMARY', {}))
+        return config
+    
+    @classmethod
+    def lock_key(cls, conversation_id) -> str:
+        return f"{cls.KEY_PREFIX}:{conversation_id}"
+    
+    @classmethod
+    def needs_summary(cls, conversation: Conversation) -> bool:
+        return conversation.unsummarized_tokens >= cls.get_config()['TRIGGER_TOKENS']
+    
+    @classmethod
+    def schedule(cls, conversation: Conversation) -> None:
+        """Queue a summarization if the conversation is due and none is queued yet"""
+        config = cls.get_config()
+        if not config['ENABLED'] or not cls.needs_summary(conversation):
+            return
+        
+        if not cache.add(cls.lock_key(conversation.pk), 1, timeout=config['LOCK_TIMEOUT']):
+            return
+        
+        from apps.chat.tasks import summarize_conversation
+        
+        try:
+            summarize_conversation.delay(str(conversation.pk))
+        except Exception as e:
+            # The reply is already saved, summarizing can wait for the next turn
+            cache.delete(cls.lock_key(conversation.pk))
+            logger.warning(f"Could not queue summary of conversation {conversation.pk}: {str(e)}")
+    
+    @classmethod
+    def summarize(cls, conversation_id) -> None:
+        """Fold the next chunk of older messages into the summary, runs on a worker"""
+        try:
+            conversation = Conversation.objects.select_related('user').get(id=conversation_id)
+            folded = cls.fold_messages(conversation)
+        finally:
+            cache.delete(cls.lock_key(conversation_id))
+        
+        # Big backlogs (conversations from before summaries) take several chunks
+        if folded:
+            conversation.refresh_from_db(fields=['unsummarized_tokens'])
+            cls.schedule(conversation)
+    
+    @classmethod
+    def select_messages(cls, rows: List, config: Dict) -> List:
+        """
+        Oldest (sequence, token_count) rows to fold
+        
+        Leaves at least KEEP_RECENT_TOKENS of the newest messages out,
+        and takes at most CHUNK_TOKENS (but at least one message).
+        """
+        remaining = sum(token_count for _, token_count in rows)
+        selected = []
+        chunk = 0
+        
+        for sequence, token_count in rows:
+            if remaining - token_count < config['KEEP_RECENT_TOKENS']:
+                break
+            if selected and chunk + token_count > config['CHUNK_TOKENS']:
+                break
+            selected.append((sequence, token_count))
+            chunk += token_count
+            remaining -= token_count
+        
+        return selected
+    
+    @classmethod
+    def build_prompt(cls, summary: str, messages) -> List[Dict[str, str]]:
+        transcript = '\n\n'.join(
+            f"{role.capitalize()}: {content}" for role, content in messages
+        )
+        return [
+            {'role': 'system', 'content': cls.SYSTEM_PROMPT},
+            {
+                'role': 'user',
+                'content': f"Existing summary:\n{summary or '(none yet)'}\n\nNew messages:\n{transcript}",
+            },
+        ]
+    
+    @classmethod
+    def fold_messages(cls, conversation: Conversation) -> int:
+        """Summarize one chunk, returns the number of messages folded"""
+        from .llm_service import LLMService
+        from .usage_service import UsageService
+        
+        config = cls.get_config()
+        through = conversation.context_summary_through
+        
+        rows = list(
+            conversation.messages.filter(sequence__gt=through)
+            .order_by('sequence').values_list('sequence', 'token_count')
+        )
+        selected = cls.select_messages(rows, config)
+        if not selected:
+            return 0
+        
+        new_through = selected[-1][0]
+        folded_tokens = sum(token_count for _, token_count in selected)
+        messages = conversation.messages.filter(
+            sequence__gt=through, sequence__lte=new_through
+        ).order_by('sequence').values_list('role', 'content')
+        
+        llm_response = LLMService.generate_chat_response(
+            messages=cls.build_prompt(conversation.context_summary, messages),
+            max_tokens=config['MAX_TOKENS'],
+            temperature=config['TEMPERATURE'],
+            cache=False,
+            # Yields to interactive chat when the LLM is saturated
+            tier='background'
+        )
+        summary = llm_response['content'].strip()
+        
+        # Only applies on top of the summary this one was built from
+        updated = Conversation.objects.filter(
+            pk=conversation.pk, context_summary_through=through
+        ).update(
+            context_summary=summary,
+            context_summary_through=new_through,
+            context_summary_tokens=ContextBuilder.estimate_tokens(
+                ContextBuilder.SUMMARY_PREFIX + summary
+            ),
+            unsummarized_tokens=F('unsummarized_tokens') - folded_tokens
+        )
+        
+        # Summarizing costs tokens like any other call
+        UsageService.record_usage(conversation.user, llm_response, messages=0)
+        
+        if not updated:
+            logger.info(f"Summary of conversation {conversation.pk} changed meanwhile, discarded")
+            return 0
+        
+        logger.info(
+            f"Summarized messages {through + 1}-{new_through} of conversation "
+            f"{conversation.pk} ({folded_tokens} tokens)"
+        )
+        return len(selected)
\ No newline at end of file
@@ -0,0 +1,182 @@
+from typing import Dict, Optional, Tuple
+from django.conf import settings
+from django.core.cache import caches
+import logging
+import math
+import threading
+import time
+
+from apps.chat.models import Conversation
+from apps.core.exceptions import QuotaExceeded
+from apps.core.metrics import TOKEN_QUOTA_REJECTED
+from .context_builder import ContextBuilder
+
+try:
+    from django_redis import get_redis_connection
+    from django_redis.cache import RedisCache
+except ImportError:
+    get_redis_connection = None
+    RedisCache = None
+
+logger = logging.getLogger(__name__)
+
+
+class TokenQuota:
+    """
+    Per-user token bucket over LLM tokens
+    
+    A bucket holds up to BURST tokens and refills at TOKENS_PER_MINUTE.
+    Each chat request is charged up front with its estimated prompt plus
+    the completion limit, and rejected with 429 if the bucket can't
+    cover that. Once the reply is in, the charge is reconciled against
+    the tokens actually used, so unused completion tokens flow back and
+    a reply that cost more than estimated leaves the bucket in debt.
+    
+    Buckets live in the ALIAS cache. On django-redis every update is a
+    single Lua script, so all workers share one bucket per user. Other
+    backends fall back to a process lock, which is only atomic (and the
+    limit only shared) within one process.
+    """
+    
+    KEY_PREFIX = 'quota:tokens'
+    
+    DEFAULT_CONFIG = {
+        'ENABLED': True,
+        'ALIAS': 'ratelimit',
+        'TOKENS_PER_MINUTE': 20000,
+        'BURST': 40000,
+    }
+    
+    # KEYS[1] bucket, ARGV: capacity, refill per second, cost, force (1 = may go into debt), ttl
+    SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if ARGV[4] == '1' or tokens >= cost then
+    tokens = math.min(capacity, tokens - cost)
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[5]))
+return {allowed, tostring(tokens)}
+"""
+    
+    _lock = threading.Lock()
+    _script = None
+    
+    @classmethod
+    def get_config(cls) -> Dict:
+        config = {**cls.DEFAULT_CONFIG}
+        config.update(settings.TOKEN_QUOTA)
+        return config
+    
+    @classmethod
+    def is_enabled(cls) -> bool:
+        config = cls.get_config()
+        return config['ENABLED'] and config['TOKENS_PER_MINUTE'] > 0
+    
+    @classmethod
+    def key(cls, user_id) -> str:
+        return f"{cls.KEY_PREFIX}:{user_id}"
+    
+    @classmethod
+    def estimate(cls, user, conversation_id, message: str) -> int:
+        """Estimated prompt (history capped at the budget) plus the completion limit"""
+        history = 0
+        if conversation_id:
+            row = Conversation.objects.filter(id=conversation_id, user=user).values_list(
+                'context_summary_tokens', 'unsummarized_tokens'
+            ).first()
+            if row:
+                history = sum(row)
+        
+        prompt = min(
+            ContextBuilder.get_prompt_budget(),
+            history + ContextBuilder.estimate_tokens(message)
+        )
+        return prompt + settings.LLM_CONFIG.get('MAX_TOKENS', 2048)
+    
+    @classmethod
+    def charge(cls, user, conversation_id, message: str) -> int:
+        """
+        Take a request's estimated tokens from the user's bucket
+        
+        Returns the amount charged, to be passed to settle(). Raises
+        QuotaExceeded with the seconds until the bucket can cover it.
+        """
+        if not cls.is_enabled():
+            return 0
+        
+        config = cls.get_config()
+        # A request bigger than the bucket could never pass, charge it a full bucket
+        cost = min(cls.estimate(user, conversation_id, message), config['BURST'])
+        allowed, tokens = cls._apply(user.id, cost, force=False, config=config)
+        if allowed:
+            return cost
+        
+        TOKEN_QUOTA_REJECTED.inc()
+        rate = config['TOKENS_PER_MINUTE'] / 60
+        raise QuotaExceeded(
+            'Token quota exceeded, try again shortly',
+            retry_after=max(1, math.ceil((cost - tokens) / rate))
+        )
+    
+    @classmethod
+    def settle(cls, user_id, charged: int, llm_response: Optional[Dict] = None) -> None:
+        """
+        Reconcile an up-front charge with the tokens the request used
+        
+        Without a response (the request failed), for a cache hit or for
+        a reply coalesced with an identical request (single-flight), the
+        whole charge is refunded, as no tokens were spent for it.
+        """
+        if not charged or not cls.is_enabled():
+            return
+        
+        used = 0
+        if llm_response is not None and not (llm_response.get('cached') or llm_response.get('coalesced')):
+            used = llm_response.get('tokens_used') or 0
+        
+        if used != charged:
+            try:
+                cls._apply(user_id, used - charged, force=True, config=cls.get_config())
+            except Exception as e:
+                # The reply is already out, a lost adjustment only skews the bucket
+                logger.warning(f"Could not reconcile token quota of user {user_id}: {str(e)}")
+    
+    @classmethod
+    def _apply(cls, user_id, cost: int, force: bool, config: Dict) -> Tuple[bool, float]:
+        """Refill the bucket and take cost from it, returns (allowed, tokens left)"""
+        cache = caches[config['ALIAS']]
+        capacity = config['BURST']
+        rate = config['TOKENS_PER_MINUTE'] / 60
+        # An idle bucket is full again after this, no need to keep it
+        ttl = math.ceil(capacity / rate) + 60
+        
+        if RedisCache is not None and isinstance(cache, RedisCache):
+            client = get_redis_connection(config['ALIAS'])
+            if cls._script is None:
+                cls._script = client.register_script(cls.SCRIPT)
+            allowed, tokens = cls._script(
+                keys=[cache.make_key(cls.key(user_id))],
+                args=[capacity, rate, cost, 1 if force else 0, ttl],
+                client=client
+            )
+            return bool(allowed), float(tokens)
+        
+        with cls._lock:
+            now = time.time()
+            state = cache.get(cls.key(user_id)) or {'tokens': capacity, 'ts': now}
+            tokens = min(capacity, state['tokens'] + max(0.0, now - state['ts']) * rate)
+            allowed = force or tokens >= cost
+            if allowed:
+                tokens = min(capacity, tokens - cost)
+            cache.set(cls.key(user_id), {'tokens': tokens, 'ts': now}, timeout=ttl)
+            return allowed, tokens
\ No newline at end of file
@@ -0,0 +1,251 @@
+from collections import defaultdict
+from datetime import date
+from typing import Dict, List, Optional
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, Sum
+from django.utils import timezone
+import bisect
+import logging
+
+from apps.chat.models import UserUsageStats, UsageDelta, UsageRollup
+
+logger = logging.getLogger(__name__)
+
+
+class UsageService:
+    """
+    Write-behind usage accounting
+    
+    The chat path only inserts a UsageDelta row per request, which never
+    contends with other requests of the same user. A periodic task
+    applies the buffered deltas to UserUsageStats with F() updates and
+    to the per-day UsageRollup rows, and reads add whatever is still
+    pending to the stored totals.
+    """
+    
+    # Upper bounds of the latency histogram buckets, plus one overflow bucket
+    LATENCY_BUCKETS_MS = [100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000]
+    
+    @classmethod
+    def record_usage(cls, user, llm_response: Optional[Dict] = None, messages: int = 1) -> None:
+        """Buffer usage of one chat turn, llm_response as returned by LLMService"""
+        llm_response = llm_response or {}
+        if llm_response.get('coalesced') or llm_response.get('cached'):
+            # Answered without an upstream call of its own, no tokens were spent for it
+            llm_response = {'model': llm_response.get('model'), 'latency_ms': llm_response.get('latency_ms')}
+        UsageDelta.objects.create(
+            user=user,
+            messages=messages,
+            tokens=llm_response.get('tokens_used') or 0,
+            model=llm_response.get('model') or '',
+            prompt_tokens=llm_response.get('prompt_tokens') or 0,
+            completion_tokens=llm_response.get('completion_tokens') or 0,
+            latency_ms=llm_response.get('latency_ms'),
+        )
+    
+    @classmethod
+    def get_stats(cls, user) -> UserUsageStats:
+        """UserUsageStats with pending deltas folded in (not saved)"""
+        stats, _ = UserUsageStats.objects.get_or_create(user=user)
+        
+        pending = UsageDelta.objects.filter(user=user).aggregate(
+            messages=Sum('messages'),
+            tokens=Sum('tokens'),
+            last_request_at=Max('created_at'),
+        )
+        # Any delta counts, summary calls are recorded with messages=0
+        if pending['last_request_at'] is not None:
+            stats.total_messages += pending['messages'] or 0
+            stats.total_tokens += pending['tokens'] or 0
+            if stats.last_request_at is None or pending['last_request_at'] > stats.last_request_at:
+                stats.last_request_at = pending['last_request_at']
+        
+        return stats
+    
+    @classmethod
+    def flush(cls) -> int:
+        """
+        Apply buffered deltas in batches, returns number of deltas applied
+        
+        Each batch deletes its deltas before applying them, in one
+        transaction. If a concurrent flusher already took some of them
+        the delete count won't match and the batch is rolled back.
+        """
+        batch_size = settings.USAGE_FLUSH_BATCH_SIZE
+        applied = 0
+        
+        while True:
+            rows = list(
+                UsageDelta.objects.order_by('id').values_list(
+                    'id', 'user_id', 'messages', 'tokens', 'created_at',
+                    'model', 'prompt_tokens', 'completion_tokens', 'latency_ms'
+                )[:batch_size]
+            )
+            if not rows:
+                break
+            
+            totals = defaultdict(lambda: {'messages': 0, 'tokens': 0, 'last_request_at': None})
+            rollups = defaultdict(cls.empty_rollup)
+            for _, user_id, messages, tokens, created_at, *usage in rows:
+                total = totals[user_id]
+                total['messages'] += messages
+                total['tokens'] += tokens
+                if total['last_request_at'] is None or created_at > total['last_request_at']:
+                    total['last_request_at'] = created_at
+                
+                model, prompt_tokens, completion_tokens, latency_ms = usage
+                rollup = rollups[(user_id, timezone.localdate(created_at), model)]
+                cls.add_to_rollup(rollup, messages, prompt_tokens, completion_tokens, latency_ms)
+            
+            with transaction.atomic():
+                deleted, _ = UsageDelta.objects.filter(id__in=[row[0] for row in rows]).delete()
+                if deleted != len(rows):
+                    transaction.set_rollback(True)
+                    logger.warning("Usage flush raced with another flusher, retrying batch")
+                    continue
+                
+                UserUsageStats.objects.bulk_create(
+                    [UserUsageStats(user_id=user_id) for user_id in totals],
+                    ignore_conflicts=True
+                )
+                for user_id, total in totals.items():
+                    UserUsageStats.objects.filter(user_id=user_id).update(
+                        total_messages=F('total_messages') + total['messages'],
+                        total_tokens=F('total_tokens') + total['tokens'],
+                        last_request_at=total['last_request_at']
+                    )
+                
+                cls.apply_rollups(rollups)
+            
+            applied += len(rows)
+            if len(rows) < batch_size:
+                break
+        
+        return applied
+    
+    @classmethod
+    def empty_rollup(cls) -> Dict:
+        return {
+            'message_count': 0,
+            'prompt_tokens': 0,
+            'completion_tokens': 0,
+            'latency_histogram': [0] * (len(cls.LATENCY_BUCKETS_MS) + 1),
+        }
+    
+    @classmethod
+    def add_to_rollup(cls, rollup: Dict, messages: int, prompt_tokens: int,
+                      completion_tokens: int, latency_ms: Optional[int]) -> None:
+        rollup['message_count'] += messages
+        rollup['prompt_tokens'] += prompt_tokens or 0
+        rollup['completion_tokens'] += completion_tokens or 0
+        if latency_ms is not None:
+            rollup['latency_histogram'][bisect.bisect_left(cls.LATENCY_BUCKETS_MS, latency_ms)] += 1
+    
+    @classmethod
+    def merge_histograms(cls, target: List[int], source: List[int]) -> List[int]:
+        """Bucket-wise sum, tolerates histograms stored before the buckets changed"""
+        size = len(cls.LATENCY_BUCKETS_MS) + 1
+        target = (list(target) + [0] * size)[:size]
+        for index, count in enumerate(source[:size]):
+            target[index] += count
+        return target
+    
+    @classmethod
+    def apply_rollups(cls, rollups: Dict) -> None:
+        """
+        Add aggregated {(user_id, day, model): rollup} into UsageRollup
+        
+        Must run inside a transaction. Counters are F() updates, the
+        histogram is merged under a row lock.
+        """
+        UsageRollup.objects.bulk_create(
+            [
+                UsageRollup(user_id=user_id, day=day, model=model)
+                for user_id, day, model in rollups
+            ],
+            ignore_conflicts=True
+        )
+        for (user_id, day, model), rollup in rollups.items():
+            row = UsageRollup.objects.select_for_update().only('latency_histogram').get(
+                user_id=user_id, day=day, model=model
+            )
+            UsageRollup.objects.filter(pk=row.pk).update(
+                message_count=F('message_count') + rollup['message_count'],
+                prompt_tokens=F('prompt_tokens') + rollup['prompt_tokens'],
+                completion_tokens=F('completion_tokens') + rollup['completion_tokens'],
+                latency_histogram=cls.merge_histograms(
+                    row.latency_histogram, rollup['latency_histogram']
+                ),
+            )
+    
+    @classmethod
+    def latency_percentile(cls, histogram: List[int], percentile: float) -> Optional[int]:
+        """
+        Estimated percentile in ms, interpolated within its bucket
+        
+        Samples are assumed spread evenly between the bucket's bounds, as
+        histogram_quantile() does in Prometheus. The overflow bucket has
+        no upper bound, percentiles falling in it report the last bound.
+        """
+        total = sum(histogram)
+        if not total:
+            return None
+        
+        rank = percentile / 100 * total
+        seen = 0
+        for index, count in enumerate(histogram):
+            if count and seen + count >= rank:
+                if index >= len(cls.LATENCY_BUCKETS_MS):
+                    break
+                lower = cls.LATENCY_BUCKETS_MS[index - 1] if index else 0
+                upper = cls.LATENCY_BUCKETS_MS[index]
+                return round(lower + (upper - lower) * (rank - seen) / count)
+            seen += count
+        return cls.LATENCY_BUCKETS_MS[-1]
+    
+    @classmethod
+    def get_timeseries(cls, user, start: date, end: date, model: Optional[str] = None,
+                       by_model: bool = False) -> List[Dict]:
+        """
+        Daily usage points between start and end (inclusive), read from UsageRollup
+        
+        Deltas not yet flushed are not included, so the current day lags
+        by at most USAGE_FLUSH_INTERVAL seconds.
+        """
+        rollups = UsageRollup.objects.filter(user=user, day__range=(start, end))
+        if model is not None:
+            rollups = rollups.filter(model=model)
+        
+        points = {}
+        rows = rollups.order_by('day', 'model').values_list(
+            'day', 'model', 'message_count', 'prompt_tokens',
+            'completion_tokens', 'latency_histogram'
+        )
+        for day, row_model, message_count, prompt_tokens, completion_tokens, histogram in rows:
+            key = (day, row_model) if by_model else day
+            point = points.get(key)
+            if point is None:
+                point = points[key] = cls.empty_rollup()
+            point['message_count'] += message_count
+            point['prompt_tokens'] += prompt_tokens
+            point['completion_tokens'] += completion_tokens
+            point['latency_histogram'] = cls.merge_histograms(point['latency_histogram'], histogram)
+        
+        series = []
+        for key, point in points.items():
+            day, row_model = key if by_model else (key, None)
+            entry = {
+                'day': day,
+                'message_count': point['message_count'],
+                'prompt_tokens': point['prompt_tokens'],
+                'completion_tokens': point['completion_tokens'],
+                'total_tokens': point['prompt_tokens'] + point['completion_tokens'],
+                'latency_p50_ms': cls.latency_percentile(point['latency_histogram'], 50),
+                'latency_p95_ms': cls.latency_percentile(point['latency_histogram'], 95),
+            }
+            if by_model:
+                entry['model'] = row_model
+            series.append(entry)
+        
+        return series
\ No newline at end of file
@@ -0,0 +1,296 @@
+from django.test import SimpleTestCase, override_settings
+from groq import APIStatusError
+from unittest import mock
+import asyncio
+import httpx
+import threading
+import time
+
+from apps.core.exceptions import LLMRequestRejected
+from apps.core.services.admission import AdmissionController
+from apps.core.services.fake_provider import FakeProvider
+from apps.core.services.groq_provider import GroqProvider
+from apps.core.services.llm_service import LLMService
+from apps.core.services.provider_pool import CircuitBreaker, ProviderPool
+from apps.core.services import stream_buffer
+from apps.core.services.stream_buffer import StreamBuffer
+
+MESSAGES = [{'role': 'user', 'content': 'hello'}]
+
+
+class MidStreamFailure(FakeProvider):
+    """Streams its first word, then fails"""
+    
+    def generate_streaming_response(self, messages, **kwargs):
+        self.calls += 1
+        yield self.content.split(' ')[0]
+        raise RuntimeError("Connection reset mid-stream")
+
+
+class RejectingProvider(FakeProvider):
+    """Refuses every request as too large"""
+    
+    def generate_response(self, messages, **kwargs):
+        self.calls += 1
+        raise LLMRequestRejected("Failed to generate response: prompt too large", 413)
+
+
+class ProviderPoolTests(SimpleTestCase):
+    
+    def make_pool(self, **providers):
+        pool = ProviderPool({'FAILURE_THRESHOLD': 2, 'MIN_SAMPLES': 10, 'COOLDOWN': 30})
+        for name, provider in providers.items():
+            pool.register(name, provider)
+        return pool
+    
+    def test_fails_over_to_next_provider(self):
+        broken = FakeProvider(error_rate=1.0)
+        backup = FakeProvider(content='from backup')
+        pool = self.make_pool(broken=broken, backup=backup)
+        
+        response = pool.generate_response(MESSAGES)
+        
+        self.assertEqual(response['content'], 'from backup')
+        self.assertEqual(response['provider'], 'backup')
+        self.assertEqual((broken.calls, backup.calls), (1, 1))
+    
+    def test_all_providers_failing_raises(self):
+        pool = self.make_pool(first=FakeProvider(error_rate=1.0), second=FakeProvider(error_rate=1.0))
+        
+        with self.assertRaisesMessage(RuntimeError, 'All LLM providers failed'):
+            pool.generate_response(MESSAGES)
+    
+    def test_open_breaker_skips_provider(self):
+        broken = FakeProvider(error_rate=1.0)
+        backup = FakeProvider()
+        pool = self.make_pool(broken=broken, backup=backup)
+        
+        for _ in range(2):
+            pool.generate_response(MESSAGES)
+        self.assertEqual(pool.members['broken'].breaker.state, CircuitBreaker.OPEN)
+        
+        pool.generate_response(MESSAGES)
+        self.assertEqual(broken.calls, 2)
+        self.assertEqual(backup.calls, 3)
+    
+    def test_half_open_trial_closes_or_reopens_breaker(self):
+        flaky = FakeProvider(error_rate=1.0)
+        backup = FakeProvider()
+        pool = self.make_pool(flaky=flaky, backup=backup)
+        breaker = pool.members['flaky'].breaker
+        
+        for _ in range(2):
+            pool.generate_response(MESSAGES)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        
+        # Cooldown over, the failing trial opens the breaker again
+        breaker.opened_at -= breaker.cooldown
+        pool.generate_response(MESSAGES)
+        self.assertEqual(flaky.calls, 3)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        
+        # The next trial succeeds and closes it
+        breaker.opened_at -= breaker.cooldown
+        flaky.error_rate = 0.0
+        response = pool.generate_response(MESSAGES)
+        self.assertEqual(response['provider'], 'flaky')
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+    
+    def test_half_open_lets_one_trial_through(self):
+        breaker = CircuitBreaker(failure_threshold=1, error_rate_threshold=0.5, min_samples=10, cooldown=30)
+        breaker.record_failure({'samples': 1, 'error_rate': 1.0})
+        self.assertFalse(breaker.allow())
+        
+        breaker.opened_at -= breaker.cooldown
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(breaker.allow())
+        
+        # A trial that was never attempted is handed back
+        breaker.release()
+        self.assertTrue(breaker.allow())
+    
+    def test_stream_fails_over_before_first_chunk(self):
+        pool = self.make_pool(broken=FakeProvider(error_rate=1.0), backup=FakeProvider(content='from backup'))
+        
+        chunks = list(pool.generate_streaming_response(MESSAGES))
+        
+        self.assertEqual(''.join(chunk for chunk in chunks if isinstance(chunk, str)), 'from backup')
+        self.assertEqual(chunks[-1]['provider'], 'backup')
+    
+    def test_stream_does_not_fail_over_after_first_chunk(self):
+        cut_off = MidStreamFailure(content='partial reply')
+        backup = FakeProvider()
+        pool = self.make_pool(cut_off=cut_off, backup=backup)
+        
+        chunks = []
+        with self.assertRaisesMessage(RuntimeError, 'mid-stream'):
+            for chunk in pool.generate_streaming_response(MESSAGES):
+                chunks.append(chunk)
+        
+        # Already sent text can't be taken back, so no second provider is tried
+        self.assertEqual(chunks, ['partial'])
+        self.assertEqual(backup.calls, 0)
+    
+    def test_rejected_request_is_not_failed_over_or_counted(self):
+        rejecting = RejectingProvider()
+        backup = FakeProvider()
+        pool = self.make_pool(rejecting=rejecting, backup=backup)
+        
+        for _ in range(3):
+            with self.assertRaises(LLMRequestRejected):
+                pool.generate_response(MESSAGES)
+        
+        self.assertEqual(backup.calls, 0)
+        self.assertEqual(pool.members['rejecting'].breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(pool.get_stats()['rejecting']['samples'], 0)
+
+
+class ProviderRegistryTests(SimpleTestCase):
+    
+    def test_fake_provider_needs_debug(self):
+        with self.assertRaises(ValueError):
+            LLMService.create_provider('fake')
+        
+        with override_settings(DEBUG=True):
+            self.assertIsInstance(LLMService.create_provider('fake'), FakeProvider)
+
+
+
+class GroqErrorTests(SimpleTestCase):
+    
+    def status_error(self, status_code):
+        response = httpx.Response(status_code, request=httpx.Request('POST', 'https://api.groq.com'))
+        return APIStatusError('error', response=response, body=None)
+    
+    def test_client_errors_are_rejections(self):
+        for status_code in (400, 401, 413):
+            error = GroqProvider._final_error(self.status_error(status_code), 'Failed')
+            self.assertIsInstance(error, LLMRequestRejected)
+            self.assertEqual(error.status_code, status_code)
+    
+    def test_rate_limits_and_server_errors_are_provider_failures(self):
+        for status_code in (429, 500, 503):
+            error = GroqProvider._final_error(self.status_error(status_code), 'Failed')
+            self.assertNotIsInstance(error, LLMRequestRejected)
+    
+    
+    def test_failed_attempts_are_latency_samples(self):
+        provider = GroqProvider()
+        provider.api_key = 'key'
+        provider.client = mock.Mock()
+        provider.client.chat.completions.create.side_effect = self.status_error(400)
+        
+        with self.assertRaises(LLMRequestRejected):
+            provider.generate_response(MESSAGES)
+        self.assertEqual(len(provider.latencies), 1)
+
+
+class HedgedCallTests(SimpleTestCase):
+    
+    def setUp(self):
+        for name, value in (('_executor', None), ('_executor_workers', 0), ('_busy_workers', 0)):
+            patcher = mock.patch.object(GroqProvider, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        
+        self.provider = GroqProvider()
+        self.provider.hedge = {**self.provider.hedge, 'ENABLED': True, 'DEFAULT_DELAY': 0.01, 'MIN_DELAY': 0.01}
+    
+    def test_hedge_is_skipped_without_a_free_thread(self):
+        self.provider.hedge['MAX_WORKERS'] = 1
+        release = threading.Event()
+        calls = []
+        
+        def attempt():
+            calls.append(1)
+            release.wait(5)
+            return 'primary'
+        
+        attempts = [0]
+        threading.Timer(0.1, release.set).start()
+        self.assertEqual(self.provider._hedged_call(attempt, attempts), 'primary')
+        self.assertEqual((attempts[0], len(calls)), (1, 1))
+    
+    def test_pool_defaults_to_twice_the_admission_limit(self):
+        with self.settings(LLM_CONFIG={'ADMISSION': {'MAX_CONCURRENT': 5}}):
+            self.assertEqual(self.provider._max_workers(), 10)
+
+
+class StreamBufferTests(SimpleTestCase):
+    
+    def write_later(self, buffer, chunks):
+        def write():
+            for chunk in chunks:
+                buffer.append({'chunk': chunk})
+            buffer.finish({'done': True})
+        threading.Timer(0.05, write).start()
+    
+    @override_settings(STREAM_POLL_INTERVAL=5)
+    def test_attached_reader_gets_frames_without_polling(self):
+        buffer = StreamBuffer.create(user_id=1)
+        self.write_later(buffer, ['a', 'b'])
+        
+        started = time.monotonic()
+        with mock.patch.object(stream_buffer.cache, 'get_many') as get_many:
+            events = list(buffer.iter_events())
+        
+        self.assertEqual([data for _, data in events][1:], [{'chunk': 'a'}, {'chunk': 'b'}, {'done': True}])
+        self.assertEqual([seq for seq, _ in events], [1, 2, 3, 4])
+        self.assertLess(time.monotonic() - started, 1)
+        get_many.assert_not_called()
+    
+    @override_settings(STREAM_POLL_INTERVAL=5)
+    def test_attached_async_reader_gets_frames_without_polling(self):
+        buffer = StreamBuffer.create(user_id=1)
+        
+        async def read():
+            self.write_later(buffer, ['a'])
+            return [data async for _, data in buffer.aiter_events()]
+        
+        started = time.monotonic()
+        self.assertEqual(asyncio.run(read())[1:], [{'chunk': 'a'}, {'done': True}])
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(buffer.local_waiters, [])
+    
+    def test_resuming_reader_reads_the_cache(self):
+        buffer = StreamBuffer.create(user_id=1)
+        buffer.append({'chunk': 'a'})
+        buffer.finish({'done': True})
+        
+        resumed = StreamBuffer.get(buffer.stream_id, 1)
+        self.assertIsNone(resumed.local_events)
+        self.assertEqual(list(resumed.iter_events(after=2)), [(3, {'done': True})])
+
+@override_settings(LLM_CONFIG={'ADMISSION': {'MAX_CONCURRENT': 2, 'GLOBAL_MAX_CONCURRENT': 2}})
+class AdmissionSlotTests(SimpleTestCase):
+    """A failing lease cache must not leak local slots"""
+    
+    def setUp(self):
+        patcher = mock.patch.object(AdmissionController, '_active', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_lease_failure_gives_the_local_slot_back(self):
+        with mock.patch.object(AdmissionController, '_try_lease', side_effect=ConnectionError('cache down')):
+            with self.assertRaises(ConnectionError):
+                with AdmissionController.slot():
+                    pass
+        self.assertEqual(AdmissionController._active, 0)
+    
+    def test_lease_release_failure_gives_the_local_slot_back(self):
+        with mock.patch.object(AdmissionController, '_release_lease', side_effect=ConnectionError('cache down')):
+            with self.assertRaises(ConnectionError):
+                with AdmissionController.slot():
+                    self.assertEqual(AdmissionController._active, 1)
+        self.assertEqual(AdmissionController._active, 0)
+    
+    def test_async_lease_release_failure_gives_the_local_slot_back(self):
+        async def hold():
+            async with AdmissionController.aslot():
+                pass
+        
+        with mock.patch.object(AdmissionController, '_arelease_lease', side_effect=ConnectionError('cache down')):
+            with self.assertRaises(ConnectionError):
+                asyncio.run(hold())
+        self.assertEqual(AdmissionController._active, 0)
\ No newline at end of file
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+"""
+Benchmark concurrent chat throughput: sync ChatView vs AsyncChatView
+
+Runs both endpoints in-process against a throwaway SQLite database with
+a stub provider that sleeps for a fixed latency instead of calling Groq.
+
+Sync path:  N requests through the WSGI handler on a fixed thread pool
+            (models gunicorn/uwsgi worker threads)
+Async path: N requests through the ASGI handler on one event loop
+
+Usage:
+    python scripts/bench_async_chat.py --requests 200 --workers 8 --latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'talkflow.settings')
+
+import django
+from django.conf import settings
+
+
+def setup_django(db_path):
+    settings.DATABASES['default']['NAME'] = db_path
+    settings.ALLOWED_HOSTS = ['testserver']
+    settings.RATELIMIT_ENABLE = False
+    settings.LOGGING = {'version': 1, 'disable_existing_loggers': False}
+    # Every request sends the same prompt, measure raw throughput rather than coalescing
+    settings.LLM_CONFIG['SINGLE_FLIGHT'] = {'ENABLED': False}
+    django.setup()
+    
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def install_stub_provider(latency):
+    from apps.core.services.llm_service import BaseLLMProvider, LLMService
+    
+    class StubProvider(BaseLLMProvider):
+        model = 'stub'
+        
+        def is_available(self):
+            return True
+        
+        def _response(self):
+            return {
+                'content': 'stub reply',
+                'tokens_used': 20,
+                'prompt_tokens': 10,
+                'completion_tokens': 10,
+                'model': self.model,
+                'finish_reason': 'stop',
+            }
+        
+        def generate_response(self, messages, **kwargs):
+            time.sleep(latency)
+            return self._response()
+        
+        async def agenerate_response(self, messages, **kwargs):
+            await asyncio.sleep(latency)
+            return self._response()
+    
+    LLMService._provider = StubProvider()
+
+
+def auth_header():
+    from django.contrib.auth.models import User
+    from rest_framework_simplejwt.tokens import RefreshToken
+    
+    user, _ = User.objects.get_or_create(username='bench')
+    return f'Bearer {RefreshToken.for_user(user).access_token}'
+
+
+def run_sync(n, workers, token):
+    from django.test import Client
+    
+    def one(_):
+        response = Client().post(
+            '/api/chat/', {'message': 'hello'},
+            content_type='application/json', headers={'Authorization': token}
+        )
+        return response.status_code
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        codes = list(pool.map(one, range(n)))
+    return time.perf_counter() - start, codes
+
+
+async def run_async(n, token):
+    from django.test import AsyncClient
+    
+    client = AsyncClient()
+    
+    async def one():
+        response = await client.post(
+            '/api/chat/async/', {'message': 'hello'},
+            content_type='application/json', headers={'Authorization': token}
+        )
+        return response.status_code
+    
+    start = time.perf_counter()
+    codes = await asyncio.gather(*(one() for _ in range(n)))
+    return time.perf_counter() - start, codes
+
+
+def report(label, elapsed, codes):
+    ok = sum(1 for code in codes if code == 200)
+    print(
+        f"{label:<6} {len(codes):>5} requests  {ok:>5} ok  "
+        f"{elapsed:7.2f}s  {len(codes) / elapsed:8.1f} req/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=8, help='sync worker threads')
+    parser.add_argument('--latency', type=float, default=0.5, help='stub LLM latency (s)')
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, 'bench.sqlite3'))
+        install_stub_provider(args.latency)
+        token = auth_header()
+        
+        print(f"latency={args.latency}s  sync workers={args.workers}")
+        report('sync', *run_sync(args.requests, args.workers, token))
+        report('async', *asyncio.run(run_async(args.requests, token)))
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+"""
+Benchmark LLM connection reuse: a Groq client per request vs the shared pool
+
+Runs a local HTTPS stub of the Groq chat completions API (self-signed
+certificate made with openssl, plain HTTP with --no-tls) and sends N
+sequential completions through each path, counting the connections
+the stub had to accept.
+
+Per-request: a fresh Groq() client per call, as ChatStreamView used to
+             do, so every call pays TCP + TLS setup
+Pooled:      GroqProvider on HTTPClientPool, connections are kept alive
+
+Usage:
+    python scripts/bench_llm_http_pool.py --requests 200
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'talkflow.settings')
+
+import django
+from django.conf import settings
+
+COMPLETION = json.dumps({
+    'id': 'stub',
+    'object': 'chat.completion',
+    'created': 0,
+    'model': 'stub',
+    'choices': [{
+        'index': 0,
+        'message': {'role': 'assistant', 'content': 'stub reply'},
+        'finish_reason': 'stop',
+    }],
+    'usage': {'prompt_tokens': 10, 'completion_tokens': 10, 'total_tokens': 20},
+}).encode()
+
+MODELS = json.dumps({'object': 'list', 'data': []}).encode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes, don't let Nagle hold the body
+    disable_nagle_algorithm = True
+    connections = 0
+    lock = threading.Lock()
+    
+    def setup(self):
+        with StubHandler.lock:
+            StubHandler.connections += 1
+        super().setup()
+    
+    def respond(self, body):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_GET(self):
+        # GroqProvider.prewarm lists models
+        self.respond(MODELS)
+    
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.respond(COMPLETION)
+    
+    def log_message(self, *args):
+        pass
+
+
+def make_certificate(tmp):
+    cert = os.path.join(tmp, 'cert.pem')
+    key = os.path.join(tmp, 'key.pem')
+    subprocess.run(
+        [
+            'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+            '-keyout', key, '-out', cert, '-days', '1', '-subj', '/CN=localhost',
+            '-addext', 'subjectAltName=DNS:localhost,IP:127.0.0.1',
+        ],
+        check=True, capture_output=True
+    )
+    return cert, key
+
+
+def start_stub(tls, tmp):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    scheme = 'http'
+    
+    if tls:
+        cert, key = make_certificate(tmp)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        # httpx trusts SSL_CERT_FILE, for both the fresh and the pooled clients
+        os.environ['SSL_CERT_FILE'] = cert
+        scheme = 'https'
+    
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"{scheme}://127.0.0.1:{server.server_address[1]}"
+
+
+def run(label, n, call):
+    StubHandler.connections = 0
+    messages = [{'role': 'user', 'content': 'hello'}]
+    
+    start = time.perf_counter()
+    for _ in range(n):
+        call(messages)
+    elapsed = time.perf_counter() - start
+    
+    print(
+        f"{label:<12} {n:>5} requests  {StubHandler.connections:>5} connections  "
+        f"{elapsed:7.2f}s  {elapsed / n * 1000:7.2f} ms/request"
+    )
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--no-tls', action='store_true', help='plain HTTP stub')
+    args = parser.parse_args()
+    
+    tls = not args.no_tls
+    if tls and not shutil.which('openssl'):
+        print("openssl not found, falling back to plain HTTP")
+        tls = False
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        server, base_url = start_stub(tls, tmp)
+        
+        settings.LLM_CONFIG.update({'GROQ_API_KEY': 'bench', 'GROQ_BASE_URL': base_url})
+        settings.LLM_CONFIG['RETRY'] = {'MAX_ATTEMPTS': 1}
+        django.setup()
+        logging.getLogger('httpx').setLevel(logging.WARNING)
+        
+        from groq import Groq
+        from apps.core.services.groq_provider import GroqProvider
+        
+        def per_request(messages):
+            client = Groq(api_key='bench', base_url=base_url, max_retries=0)
+            client.chat.completions.create(model='stub', messages=messages)
+            client.close()
+        
+        provider = GroqProvider()
+        provider.prewarm()
+        
+        print(f"stub={base_url}")
+        fresh = run('per-request', args.requests, per_request)
+        pooled = run('pooled', args.requests, lambda messages: provider.generate_response(messages))
+        print(f"connection setup saved: {(fresh - pooled) / args.requests * 1000:.2f} ms/request")
+        
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'talkflow.settings')
 
 application = get_asgi_application()
+
+# Build the LLM providers and open their pooled connections before the first request
+from apps.core.services.llm_service import LLMService  # noqa: E402
+
+LLMService.prewarm()
@@ -12,7 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 from datetime import timedelta
-from decouple import config
+from decouple import config, Csv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -51,6 +51,8 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django_prometheus.middleware.PrometheusBeforeMiddleware',
+    # Does nothing unless PROFILING['ENABLED']
+    'apps.core.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -89,6 +91,8 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # On a file, so threads of the concurrency tests share the test database
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -175,26 +179,216 @@ CORS_ALLOWED_ORIGINS = [
 # LLM Configuration
 LLM_CONFIG = {
     'PROVIDER': config('LLM_PROVIDER', default='groq'),
+    # Providers routed by the pool, in registry names (see LLMService.PROVIDER_CLASSES)
+    'PROVIDERS': config('LLM_PROVIDERS', default='', cast=Csv()),
     'GROQ_API_KEY': config('GROQ_API_KEY', default=''),
     'GROQ_MODEL': config('GROQ_MODEL', default='llama-3.3-70b-versatile'),
+    'GROQ_BASE_URL': config('GROQ_BASE_URL', default=''),
     'MAX_TOKENS': 2048,
+    # Prompt + completion tokens per request, prompts are trimmed to fit
+    'CONTEXT_TOKEN_BUDGET': config('LLM_CONTEXT_TOKEN_BUDGET', default=8192, cast=int),
     'TEMPERATURE': 0.7,
+    # Per attempt, see RETRY for the whole request
     'TIMEOUT': 30,
+    # Transient errors (429, 5xx, timeouts) are retried with jittered
+    # exponential backoff, honoring Retry-After
+    'RETRY': {
+        'MAX_ATTEMPTS': config('LLM_RETRY_MAX_ATTEMPTS', default=3, cast=int),
+        'BASE_DELAY': 0.5,
+        'MAX_DELAY': 10,
+        'TOTAL_TIMEOUT': 60,
+    },
+    # Process-wide connection pool shared by every provider request. PREWARM
+    # opens it when the WSGI/ASGI application loads (per worker, don't combine
+    # with a preloading master that forks afterwards)
+    'HTTP': {
+        'MAX_CONNECTIONS': config('LLM_HTTP_MAX_CONNECTIONS', default=100, cast=int),
+        'MAX_KEEPALIVE_CONNECTIONS': config('LLM_HTTP_MAX_KEEPALIVE', default=20, cast=int),
+        'KEEPALIVE_EXPIRY': config('LLM_HTTP_KEEPALIVE_EXPIRY', default=60, cast=int),
+        # Used when the h2 package is installed
+        'HTTP2': config('LLM_HTTP2', default=True, cast=bool),
+        'PREWARM': config('LLM_HTTP_PREWARM', default=True, cast=bool),
+    },
+    # Fire a second attempt when the first is slower than the recent p95
+    'HEDGE': {
+        'ENABLED': config('LLM_HEDGE', default=False, cast=bool),
+        'PERCENTILE': 95,
+    },
+    # Share one upstream call between identical concurrent requests. Works
+    # across workers only when the ALIAS cache is shared (REDIS_URL is set)
+    'SINGLE_FLIGHT': {
+        'ENABLED': config('LLM_SINGLE_FLIGHT', default=True, cast=bool),
+        'ALIAS': 'single_flight',
+    },
+    # Exact-match response cache, used for temperature 0 requests when enabled
+    # or when a request sends "cache": true
+    'RESPONSE_CACHE': {
+        'ENABLED': config('LLM_RESPONSE_CACHE', default=False, cast=bool),
+        'ALIAS': 'llm_responses',
+    },
+    # Rolling summary of long conversations, made by a Celery worker once the
+    # messages after the summary reach TRIGGER_TOKENS (see SummaryService)
+    'SUMMARY': {
+        'ENABLED': config('LLM_SUMMARY', default=True, cast=bool),
+        'TRIGGER_TOKENS': config('LLM_SUMMARY_TRIGGER_TOKENS', default=3000, cast=int),
+        # Newest history always sent verbatim
+        'KEEP_RECENT_TOKENS': config('LLM_SUMMARY_KEEP_RECENT_TOKENS', default=1500, cast=int),
+        # Most history folded per summarization call
+        'CHUNK_TOKENS': 6000,
+        'MAX_TOKENS': 512,
+    },
+    # Concurrency limit around LLM calls, with a bounded priority queue
+    # (see AdmissionController). GLOBAL_MAX_CONCURRENT caps the whole
+    # cluster through lease slots in the default cache, 0 disables it
+    'ADMISSION': {
+        'ENABLED': config('LLM_ADMISSION', default=True, cast=bool),
+        'MAX_CONCURRENT': config('LLM_MAX_CONCURRENT', default=16, cast=int),
+        'GLOBAL_MAX_CONCURRENT': config('LLM_GLOBAL_MAX_CONCURRENT', default=0, cast=int),
+        'MAX_QUEUE': config('LLM_ADMISSION_MAX_QUEUE', default=64, cast=int),
+        # Seconds a request waits for a slot before it gets 503
+        'QUEUE_TIMEOUT': config('LLM_ADMISSION_QUEUE_TIMEOUT', default=10, cast=float),
+        # Highest priority first, staff get 'priority', summaries 'background'
+        'TIERS': ['priority', 'default', 'background'],
+    },
+    # Rolling window and circuit breaker thresholds of the provider pool
+    'POOL': {
+        'WINDOW': 100,
+        'FAILURE_THRESHOLD': 5,
+        'ERROR_RATE_THRESHOLD': 0.5,
+        'MIN_SAMPLES': 10,
+        'COOLDOWN': config('LLM_CIRCUIT_COOLDOWN', default=30, cast=int),
+    },
+}
+
+# Idempotency-Key handling of the chat endpoints (see IdempotencyStore)
+IDEMPOTENCY = {
+    'ALIAS': 'idempotency',
+    # How long a finished response can be replayed
+    'TTL': config('IDEMPOTENCY_TTL', default=86400, cast=int),
+    # A retry waits this long for the first request to finish
+    'WAIT_TIMEOUT': LLM_CONFIG['RETRY']['TOTAL_TIMEOUT'] + 5,
+    # Frees the key of a request that died before finishing
+    'LOCK_TIMEOUT': LLM_CONFIG['RETRY']['TOTAL_TIMEOUT'] + 30,
+    'POLL_INTERVAL': 0.1,
 }
 
+# Per-user token bucket of the chat endpoints (see TokenQuota), 0 tokens per minute disables it
+TOKEN_QUOTA = {
+    'ENABLED': config('TOKEN_QUOTA', default=True, cast=bool),
+    'ALIAS': 'ratelimit',
+    'TOKENS_PER_MINUTE': config('TOKEN_QUOTA_PER_MINUTE', default=20000, cast=int),
+    'BURST': config('TOKEN_QUOTA_BURST', default=40000, cast=int),
+}
+
+# Shared by all workers when set, request rate limits and token buckets live there
+REDIS_URL = config('REDIS_URL', default='')
+
 # Cache Configuration (Optional)
 CACHES = {
+    # Stream and job event buffers, prompt cache, admission leases. Must be
+    # shared (Redis) for Celery workers to reach the web processes
     'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'unique-snowflake',
-    }
+    },
+    # LLM responses, see LLM_CONFIG['RESPONSE_CACHE']. Culling one entry at a
+    # time makes LocMemCache evict strictly least recently used entries
+    'llm_responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'llm-responses',
+        'TIMEOUT': config('LLM_RESPONSE_CACHE_TTL', default=3600, cast=int),
+        'OPTIONS': {
+            'MAX_ENTRIES': config('LLM_RESPONSE_CACHE_SIZE', default=1000, cast=int),
+            'CULL_FREQUENCY': config('LLM_RESPONSE_CACHE_SIZE', default=1000, cast=int),
+        },
+    },
+    # Idempotency keys, bounded in number. Point at a shared backend (Redis)
+    # so retries landing on another worker find their key
+    'idempotency': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'idempotency',
+        'TIMEOUT': IDEMPOTENCY['TTL'],
+        'OPTIONS': {
+            'MAX_ENTRIES': config('IDEMPOTENCY_MAX_KEYS', default=10000, cast=int),
+        },
+    },
+    # Rate limit counters and token buckets. Without Redis each worker
+    # counts on its own, so limits are effectively multiplied by workers
+    'ratelimit': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ratelimit',
+    },
+    # Single-flight locks and results, see LLM_CONFIG['SINGLE_FLIGHT']
+    'single_flight': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'single-flight',
+    },
 }
 
+RATELIMIT_USE_CACHE = 'ratelimit'
+
 # Performance Settings
 MAX_CHAT_HISTORY = config('MAX_CHAT_HISTORY', default=50, cast=int)
+# Cached prompt history of active conversations (PromptCache), kept CONVERSATION_TIMEOUT seconds
+PROMPT_CACHE_ENABLED = config('PROMPT_CACHE_ENABLED', default=True, cast=bool)
 CONVERSATION_TIMEOUT = config('CONVERSATION_TIMEOUT', default=3600, cast=int)
+SEARCH_MAX_RESULTS = config('SEARCH_MAX_RESULTS', default=200, cast=int)
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=500, cast=int)
+# SSE streams send one frame per this many characters or seconds, not per token
+STREAM_FLUSH_CHARS = config('STREAM_FLUSH_CHARS', default=64, cast=int)
+STREAM_FLUSH_INTERVAL = config('STREAM_FLUSH_INTERVAL', default=0.05, cast=float)
+# Replay buffer for resuming streams with Last-Event-ID (needs a shared cache across workers)
+STREAM_REPLAY_EVENTS = config('STREAM_REPLAY_EVENTS', default=1000, cast=int)
+STREAM_REPLAY_TTL = config('STREAM_REPLAY_TTL', default=600, cast=int)  # seconds
+STREAM_POLL_INTERVAL = 0.05  # seconds between replay buffer reads of resuming / other-worker readers
+STREAM_IDLE_TIMEOUT = 90  # seconds without events before a reader gives up
+STREAM_CANCEL_GRACE = config('STREAM_CANCEL_GRACE', default=10, cast=int)  # seconds without a reader before upstream is cancelled
+USAGE_FLUSH_INTERVAL = config('USAGE_FLUSH_INTERVAL', default=10, cast=int)  # seconds
+USAGE_FLUSH_BATCH_SIZE = config('USAGE_FLUSH_BATCH_SIZE', default=5000, cast=int)
+
+# Celery Configuration
+CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='redis://localhost:6379/0')
+CELERY_TASK_IGNORE_RESULT = True
+# Run tasks inline instead of through the broker (tests, local development)
+CELERY_TASK_ALWAYS_EAGER = config('CELERY_TASK_ALWAYS_EAGER', default=False, cast=bool)
+# Background completions, point a dedicated queue at separate workers to scale them on their own
+CHAT_JOB_QUEUE = config('CHAT_JOB_QUEUE', default='celery')
+CELERY_TASK_ROUTES = {
+    'apps.chat.tasks.run_chat_job': {'queue': CHAT_JOB_QUEUE},
+    'apps.chat.tasks.summarize_conversation': {'queue': CHAT_JOB_QUEUE},
+}
+CELERY_BEAT_SCHEDULE = {
+    'flush-usage-deltas': {
+        'task': 'apps.chat.tasks.flush_usage_deltas',
+        'schedule': USAGE_FLUSH_INTERVAL,
+    },
+}
 
 # Logging Configuration
+# Per-request profiling (see ProfilingMiddleware)
+PROFILING = {
+    'ENABLED': config('PROFILING', default=False, cast=bool),
+    # Fraction of requests profiled, a low rate is safe to leave on in production
+    'SAMPLE_RATE': config('PROFILING_SAMPLE_RATE', default=1.0, cast=float),
+    # Server-Timing headers on profiled responses
+    'HEADERS': config('PROFILING_HEADERS', default=True, cast=bool),
+    'SLOW_REQUEST_MS': config('PROFILING_SLOW_REQUEST_MS', default=1000, cast=int),
+    'LOG_FILE': config('PROFILING_LOG_FILE', default=str(BASE_DIR / 'logs' / 'slow_requests.log')),
+    'LOG_MAX_BYTES': 10 * 1024 * 1024,
+    'LOG_BACKUP_COUNT': 5,
+    # Distinct queries written per slow request, most expensive first
+    'MAX_LOGGED_QUERIES': 50,
+}
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -207,12 +401,32 @@ LOGGING = {
             'format': '{levelname} {message}',
             'style': '{',
         },
+        'json_lines': {
+            'format': '{message}',
+            'style': '{',
+        },
     },
     'handlers': {
         'console': {
             'class': 'logging.StreamHandler',
             'formatter': 'verbose',
         },
+        # Opened on the first slow request only
+        'slow_requests': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': PROFILING['LOG_FILE'],
+            'maxBytes': PROFILING['LOG_MAX_BYTES'],
+            'backupCount': PROFILING['LOG_BACKUP_COUNT'],
+            'delay': True,
+            'formatter': 'json_lines',
+        },
+    },
+    'loggers': {
+        'talkflow.profiling': {
+            'handlers': ['slow_requests'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
     'root': {
         'handlers': ['console'],
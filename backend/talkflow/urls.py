@@ -31,4 +31,5 @@ urlpatterns = [
     path('api/health/', health_check, name='health_check'),
     path('api/auth/', include('apps.authentication.urls')),
     path('api/chat/', include('apps.chat.urls')),
+    path('', include('django_prometheus.urls')),
 ]
\ No newline at end of file
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'talkflow.settings')
 
 application = get_wsgi_application()
+
+# Build the LLM providers and open their pooled connections before the first request
+from apps.core.services.llm_service import LLMService  # noqa: E402
+
+LLMService.prewarm()